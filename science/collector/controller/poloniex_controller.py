@@ -5,9 +5,16 @@ import psycopg2
 from flask import Flask, g, request
 from psycopg2.extras import DictCursor
 
-from science.collector.core.utils import json_response
+from science.collector.core.entities import Parameters
+from science.collector.core.utils import json_response, BACKTEST_MAKER_FEE, BACKTEST_TAKER_FEE, \
+    BACKTEST_INITIAL_BALANCE
+from science.collector.service.backtester import Backtester, loadHistory, rollingForecasts
 from science.collector.service.cycle_service import Cycle
+from science.collector.service.gap_service import GapService
+from science.collector.service.matching_engine import MatchingEngine
 from science.collector.service.poloniex_service import PoloniexPublicService
+from science.collector.service.simulated_exchange import SimulatedExchange, PaperTrading, syntheticBook, \
+    recordedBooks, PAPER
 
 app = Flask(__name__)
 poloniexPublicService: PoloniexPublicService = None
@@ -24,7 +31,7 @@ def before_request():
     g.cur = g.connection.cursor(cursor_factory=psycopg2.extras.DictCursor)
 
     global poloniexPublicService, cycle
-    poloniexPublicService = PoloniexPublicService(g.connection, g.cur)
+    poloniexPublicService = PoloniexPublicService(g.connection, g.cur, app.config['DATABASE_NAME'])
     cycle = Cycle(poloniexPublicService)
 
 
@@ -95,6 +102,21 @@ def deleteChartData():
     return json_response()
 
 
+@app.route('/public/chartdata/partitions', methods=['DELETE'])
+def dropExpiredChartData():
+    """
+    Drops whole monthly partitions of chart data those are older than retention (in seconds)
+    :return: amount of dropped partitions
+    """
+    if 'retention' not in request.args:
+        error = json.dumps({'error': 'Missing field (retention)'})
+        return json_response(error, 400)
+
+    r = poloniexPublicService.dropExpiredChartData(int(request.args['retention']))
+
+    return json_response(str(r))
+
+
 @app.route('/public/chartdata', methods=['GET'])
 def getChartData():
     main_currency = request.args['main_currency'] if 'main_currency' in request.args else None
@@ -111,6 +133,49 @@ def getChartData():
     return json_response(str(result))
 
 
+@app.route('/public/chartdata/freshness', methods=['GET'])
+def getChartDataFreshness():
+    """
+    Shows how far behind the stored series are
+    :return: lag in seconds since the latest stored candle was closed, for every pair and period
+    """
+    return json_response(json.dumps(poloniexPublicService.getChartDataFreshness()))
+
+
+@app.route('/public/chartdata/gaps', methods=['GET'])
+def scanChartDataGaps():
+    """
+    Finds spans of missing candles for the series within range and refreshes the gap index
+    :return: list of [gap_start, gap_end]
+    """
+    if not all(field in request.args for field in ('main_currency', 'secondary_currency', 'period', 'start', 'end')):
+        error = json.dumps({'error': 'Missing field/s (main_currency, secondary_currency, period, start, end)'})
+        return json_response(error, 400)
+
+    gaps = GapService(poloniexPublicService).scanGaps(request.args['main_currency'],
+                                                      request.args['secondary_currency'],
+                                                      int(request.args['period']),
+                                                      int(request.args['start']), int(request.args['end']))
+    return json_response(json.dumps(gaps))
+
+
+@app.route('/public/chartdata/gaps', methods=['PUT'])
+def backfillChartDataGaps():
+    """
+    Loads only the missing spans of the series within range
+    :return: amount of loaded elements and spans those are still missing
+    """
+    if not all(field in request.args for field in ('main_currency', 'secondary_currency', 'period', 'start', 'end')):
+        error = json.dumps({'error': 'Missing field/s (main_currency, secondary_currency, period, start, end)'})
+        return json_response(error, 400)
+
+    r = GapService(poloniexPublicService).backfillGaps(request.args['main_currency'],
+                                                       request.args['secondary_currency'],
+                                                       int(request.args['period']),
+                                                       int(request.args['start']), int(request.args['end']))
+    return json_response(json.dumps(r))
+
+
 @app.route('/public/csv/chartdata', methods=['GET'])
 def saveChartDataToCSV():
     main_currency = request.args['main_currency'] if 'main_currency' in request.args else None
@@ -139,6 +204,82 @@ def startCycleIteration():
     return json_response(str(operations))
 
 
+@app.route('/private/backtest', methods=['POST'])
+def backtest():
+    """
+    Replays stored chart data through the trading rules with the same parameters as the cycle takes,
+    plus 'start' and 'end' of history and optional 'initial_balance', 'order_ttl', 'forecast_every'
+    (forecasts are made with params.algorithm, that must be a batched one; without 'forecast_every' they are made
+    at every date if the forecaster can do it in one pass over history, every params.steps dates otherwise)
+    :return: metrics and performed trades
+    """
+    body = request.get_json()
+
+    if not all(field in body for field in ('start', 'end')):
+        return json_response(json.dumps({'error': 'Missing field/s (start, end)'}), 400)
+
+    params = Parameters(body)
+
+    # amount of observations forecasts are made on, as the cycle would take them
+    try:
+        window = max(2, int(cycle.windowLength(params.window).total_seconds()) // int(params.period))
+    except (ValueError, TypeError, ZeroDivisionError) as e:
+        return json_response(json.dumps({'error': 'Invalid window or period: ' + str(e)}), 400)
+
+    dates, history, prices, highs, lows = loadHistory(poloniexPublicService, params.pairs, body['start'],
+                                                      body['end'], params.period)
+    try:
+        forecasts = rollingForecasts(params.algorithm, history, window, params.steps, params.hyperparameters,
+                                     body.get('forecast_every'))
+    except ValueError as e:
+        return json_response(json.dumps({'error': str(e)}), 400)
+
+    options = {k: body[k] for k in ('initial_balance', 'order_ttl') if k in body}
+
+    backtester = Backtester(params.pairs, dates, prices, highs, lows, forecasts, params.budget, params.top_n,
+                            params.risk, params.THRESHOLD, reopen=params.reopen, **options)
+    result = backtester.run()
+
+    return json_response(json.dumps({'metrics': result['metrics'],
+                                     'trades': backtester.describeTrades(result['trades'])}))
+
+
+@app.route('/private/paper', methods=['POST'])
+def paperTrading():
+    """
+    Runs cycles of trading against the simulated exchange with the same parameters as the cycle takes, plus optional
+    'iterations', 'latency' (round trip of a call in seconds), 'books' (synthetic or recorded),
+    'prices' (middles of synthetic books, current ones from poloniex by default), 'balances' of the paper account,
+    'use_model' (whether predictions are made once by the model instead of synthetic ones for every cycle) and 'seed'
+    :return: metrics of latencies and throughput and balances at the end
+    """
+    body = request.get_json()
+    params = Parameters(body)
+
+    engine = MatchingEngine(body.get('maker_fee', BACKTEST_MAKER_FEE), body.get('taker_fee', BACKTEST_TAKER_FEE))
+
+    if body.get('books') == 'recorded':
+        for pair, book in recordedBooks(poloniexPublicService.poloniexApi, params.pairs).items():
+            engine.seed(pair, book)
+    else:
+        prices = body.get('prices') or {pair: ticker['last'] for pair, ticker in
+                                        poloniexPublicService.returnTickerForPairs(params.pairs).items()}
+        for pair in params.pairs:
+            engine.seed(pair, syntheticBook(float(prices[pair])))
+
+    for currency, amount in (body.get('balances') or {params.common_currency: BACKTEST_INITIAL_BALANCE}).items():
+        engine.deposit(PAPER, currency, float(amount))
+
+    exchange = SimulatedExchange(engine, params.pairs, **({'latency': body['latency']} if 'latency' in body else {}))
+
+    predictions = cycle.predictForParams(params, params.pairs) if body.get('use_model') else None
+
+    paper = PaperTrading(exchange, params.budget, params.steps, params.top_n, params.risk, params.THRESHOLD,
+                         params.current_price_from, params.reopen, params.order_type, seed=body.get('seed'))
+
+    return json_response(json.dumps(paper.run(body.get('iterations', 1), predictions)))
+
+
 @app.errorhandler(404)
 def not_found(e):
     return e, 404
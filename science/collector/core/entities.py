@@ -1,3 +1,8 @@
+from science.collector.core.utils import CYCLE_FETCH_WORKERS, FORECAST_DIRECT, MODEL_REFIT_EVERY, MODEL_WORKERS, \
+    MODEL_TASK_TIMEOUT_SECONDS, MODEL_TIME_BUDGET_SECONDS, MODEL_FALLBACK, CYCLE_SHARDS, CYCLE_SHARD_MODE, \
+    EXECUTION_ORDER_TYPE
+
+
 class Parameters:
     budget: float
     pairs: list
@@ -13,6 +18,16 @@ class Parameters:
     reopen: bool
     hyperparameters: dict
     algorithm: str
+    fetch_workers: int
+    forecast_mode: str
+    refit_every: int
+    model_workers: int
+    model_timeout: float
+    model_time_budget: float
+    model_fallback: str
+    shards: int
+    shard_mode: str
+    order_type: str
 
     def __init__(self, params):
         """
@@ -35,7 +50,25 @@ class Parameters:
         - reopen: whether we should reopen all still opened orders on sells or buys?
         - hyperparameters: dictionary of hyperparameters for prediction model
             Example: {'SARIMA': {'P': 1, 'D': 0, 'Q': 2, 's': 12}, 'ARIMA': {'P': 1, 'D': 0, 'Q': 2}, ...}
+            Overrides for single pairs (e.g. found by nn/sarima.py search) go under 'PAIRS':
+                {..., 'PAIRS': {'BTC_ETH': {'SARIMA': {'P': 2, 'D': 0, 'Q': 1, 's': 12}}}}
         - algorithm: what algorithm to use for prediction
+        - fetch_workers: (optional) how many pairs are loaded from poloniex at the same time
+        - forecast_mode: (optional) DIRECT - all steps are forecast from a single fit (default),
+            RECURSIVE - model is refit on every step with previous prediction appended to data
+        - refit_every: (optional) after how many cycles parameters of a model are fully re-estimated,
+            in between the model is only filtered with the previous parameters
+        - model_workers: (optional) amount of processes pairs are fitted in, 0 - sequentially
+        - model_timeout: (optional) how long (in seconds) fitting of a single pair in a worker process may take
+        - model_time_budget: (optional) how long (in seconds) fitting of all pairs may take, None - unlimited.
+            Pairs those did not make it are predicted with the last good parameters or with model_fallback
+        - model_fallback: (optional) forecaster for pairs those have no last good parameters
+        - shards: (optional) into how many groups pairs are split, each one is loaded and predicted
+            in a separate process, 0 - everything in the process of the request
+        - shard_mode: (optional) POOL - shards are run by a pool of processes,
+            QUEUE - by workers with queues of their own (stand-in for several hosts)
+        - order_type: (optional) type of placed orders: fillOrKill, immediateOrCancel, postOnly or None.
+            Open orders are moved (instead of cancel and place) only for the last three
         :param params: parameters as dictionary
         """
         self.budget = params['budget']
@@ -52,6 +85,16 @@ class Parameters:
         self.reopen = params['reopen']
         self.hyperparameters = params['hyperparameters']
         self.algorithm = params['algorithm']
+        self.fetch_workers = params.get('fetch_workers', CYCLE_FETCH_WORKERS)
+        self.forecast_mode = params.get('forecast_mode', FORECAST_DIRECT)
+        self.refit_every = params.get('refit_every', MODEL_REFIT_EVERY)
+        self.model_workers = params.get('model_workers', MODEL_WORKERS)
+        self.model_timeout = params.get('model_timeout', MODEL_TASK_TIMEOUT_SECONDS)
+        self.model_time_budget = params.get('model_time_budget', MODEL_TIME_BUDGET_SECONDS)
+        self.model_fallback = params.get('model_fallback', MODEL_FALLBACK)
+        self.shards = params.get('shards', CYCLE_SHARDS)
+        self.shard_mode = params.get('shard_mode', CYCLE_SHARD_MODE)
+        self.order_type = params.get('order_type', EXECUTION_ORDER_TYPE)
 
 
 class Operation:
@@ -6,11 +6,22 @@ from flask import make_response
 JSON_MIME_TYPE = 'application/json'
 MAX_DATA_IN_SINGLE_QUERY: int = 50000
 
-CURRENCIES_INSERT_PLAN_SQL = """
-PREPARE currencies_insert_plan AS
-    INSERT INTO poloniex.currencies
+CURRENCIES_COLUMNS = ['id', 'symbol', 'name', 'min_conf', 'deposit_address', 'disabled', 'delisted', 'frozen']
+
+CURRENCIES_UPSERT_SQL = """
+INSERT INTO poloniex.currencies
     (id, symbol, name, min_conf, deposit_address, disabled, delisted, frozen)
-    VALUES ($1, $2, $3, $4, $5, $6, $7, $8)"""
+    VALUES %s
+ON CONFLICT (id) DO UPDATE SET
+    symbol = EXCLUDED.symbol,
+    name = EXCLUDED.name,
+    min_conf = EXCLUDED.min_conf,
+    deposit_address = EXCLUDED.deposit_address,
+    disabled = EXCLUDED.disabled,
+    delisted = EXCLUDED.delisted,
+    frozen = EXCLUDED.frozen"""
+
+CURRENCIES_DELETE_SQL = "DELETE FROM poloniex.currencies WHERE id = ANY(%s)"
 
 CHART_DATA_INSERT_PLAN_SQL = """
 PREPARE chart_data_insert_plan AS
@@ -18,6 +29,13 @@ PREPARE chart_data_insert_plan AS
     (main_currency, secondary_currency, period, date, high, low, open, close, volume, quote_volume, weighted_average)
     VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11)"""
 
+CHART_DATA_COLUMNS = ['main_currency', 'secondary_currency', 'period', 'date', 'high', 'low', 'open', 'close',
+                      'volume', 'quote_volume', 'weighted_average']
+
+# candles those are already stored (overlapping ranges, repeated loads) are skipped
+CHART_DATA_INSERT_SQL = "INSERT INTO poloniex.chart_data (" + ', '.join(CHART_DATA_COLUMNS) + ") VALUES %s " \
+                        "ON CONFLICT (main_currency, secondary_currency, period, date) DO NOTHING"
+
 PERIODS = [300, 900, 1800, 7200, 14400, 86400]
 WINDOWS = ['HOUR', 'DAY', 'WEEK', 'MONTH']
 
@@ -25,8 +43,114 @@ KEY = "WCLZAVGZ-YPHP8DR7-LWXQCEQ6-4DIKZNKM"
 SECRET = "af6163ddd2cd1b55e771c45c981a46c9bb77de553c75e6862af41b00cb3f5c5f1fced0767741b575492d844d83482b18fd8336efc1e8d33b19691ff719ea3033"
 
 ALL = 'all'
+
+# Model: forecast all steps from a single fit (DIRECT) or refit on every step with previous prediction (RECURSIVE)
+FORECAST_DIRECT = 'DIRECT'
+FORECAST_RECURSIVE = 'RECURSIVE'
+# Model: significance level of confidence intervals of forecasts (0.05 -> 95% interval)
+FORECAST_ALPHA = 0.05
+# Model: after how many cycles parameters of a model are re-estimated (in between, only the filter is run)
+MODEL_REFIT_EVERY = 12
+# Model: relative decrease of log-likelihood per observation at fixed parameters that leads to re-estimation
+MODEL_DRIFT_TOLERANCE = 0.1
+# Model: file where fitted parameters are kept between restarts (None - only in memory)
+MODEL_STATE_FILE = None
+# Model: amount of processes pairs are fitted in (0 - sequentially in the calling thread)
+MODEL_WORKERS = 0
+# Model: how long (in seconds) fitting of a single pair in a worker process may take (None - unlimited)
+MODEL_TASK_TIMEOUT_SECONDS = 300
+# Model: how long (in seconds) fitting of all pairs in a cycle may take (None - unlimited)
+MODEL_TIME_BUDGET_SECONDS = None
+# Model: forecaster for pairs those neither fit within the budget nor have a previous good fit
+MODEL_FALLBACK = 'AR'
+# Model: directory where results of fitted models are cached (None - cache is disabled).
+# It must be private: owned by the user of the process and not accessible by others (it is created with mode 0700)
+MODEL_CACHE_DIR = None
+# Model: how long (in seconds) a cached result stays valid
+MODEL_CACHE_MAX_AGE_SECONDS = 60 * 60
+# Model: how many cached results are kept at most
+MODEL_CACHE_MAX_ENTRIES = 10000
+
+# Model: algorithm that takes forecasts precomputed by the streaming Kalman filter instead of fitting a model
+# (the filter is updated with candles the cycles load, so it moves only when a cycle runs)
+STREAMING = 'KALMAN'
+# Streaming forecaster: for how many steps forecasts are kept ready
+KALMAN_STEPS = 12
+# Streaming forecaster: how many latest observations of every series are kept for re-estimation
+KALMAN_HISTORY = 2000
+# Streaming forecaster: how often (in seconds) noise variances are re-estimated in background
+KALMAN_REESTIMATE_SECONDS = 60 * 60
+
+# Cycle: how many pairs are loaded from poloniex at the same time (calls are still paced by coach)
+CYCLE_FETCH_WORKERS = 6
+# Cycle: into how many shards pairs are split, each one is loaded and predicted in a process of its own (0 - no sharding)
+CYCLE_SHARDS = 0
+# Cycle: how shards are run: POOL - pool of processes, QUEUE - workers with queues of their own (stand-in for hosts)
+SHARD_POOL = 'POOL'
+SHARD_QUEUE = 'QUEUE'
+CYCLE_SHARD_MODE = SHARD_POOL
+# Cycle: how worker processes of shards are started: spawn or forkserver, so they inherit nothing of the server
+# (threads, locks held by them, DB connections, sockets of the api client)
+CYCLE_SHARD_START_METHOD = 'spawn'
+# Cycle: how long (in seconds) the coordinator waits for all the shards of a cycle
+CYCLE_SHARD_TIMEOUT_SECONDS = 600
 PAUSE_BETWEEN_QUERIES_SECONDS = .200
 
+# Collector: how long to wait after candle is closed before asking for it, to be sure poloniex has it
+COLLECTOR_CLOSE_DELAY_SECONDS = 5
+# Collector: distance between refreshes of different series scheduled on the same candle boundary
+COLLECTOR_STAGGER_SECONDS = .250
+# Collector: how deep into history to go for series those are not stored at all yet
+COLLECTOR_INITIAL_HISTORY_SECONDS = 4 * 7 * 24 * 60 * 60
+# Collector: how often partitions of chart data are created ahead and expired ones are dropped
+COLLECTOR_MAINTENANCE_SECONDS = 24 * 60 * 60
+# Collector: how long chart data is kept (None - forever)
+CHART_DATA_RETENTION_SECONDS = None
+
+# Ingestion pipeline: amount of threads those load data from poloniex
+INGESTION_FETCHERS = 3
+# Ingestion pipeline: amount of threads those write data into DB (each one has its own connection)
+INGESTION_WRITERS = 1
+# Ingestion pipeline: how many loaded batches may wait for DB before fetchers are blocked
+INGESTION_QUEUE_SIZE = 8
+# Ingestion pipeline: how many rows a writer collects from the queue into a single insert
+INGESTION_BATCH_ROWS = 20000
+
+# Trade ledger: from when own trades are loaded on the first sync
+TRADE_LEDGER_INITIAL_START = calendar.timegm((2014, 1, 1, 0, 0, 0))
+# Trade ledger: how many trades poloniex gives per call at most
+TRADE_LEDGER_PAGE = 10000
+
+# Execution: how many calls to poloniex are in flight at once (the coach still keeps 6 calls per second)
+EXECUTION_WORKERS = 6
+# Execution: additional api keys of the same account as (key, secret). Calls with one key are sent one by one
+# (so its nonces reach poloniex in order), only calls with different keys are in flight at once
+EXECUTION_KEYS = []
+# Execution: type of placed orders: fillOrKill, immediateOrCancel, postOnly or None (plain limit order)
+EXECUTION_ORDER_TYPE = 'fillOrKill'
+
+# Backtest: fees of simulated fills (fractions, as returnFeeInfo gives them)
+BACKTEST_MAKER_FEE = 0.0015
+BACKTEST_TAKER_FEE = 0.0025
+# Backtest: amount of common currency at start
+BACKTEST_INITIAL_BALANCE = 1.0
+# Backtest: after how many candles a resting order is cancelled
+BACKTEST_ORDER_TTL = 12
+# Backtest: how many dates signals are computed for at once
+BACKTEST_CHUNK = 10000
+
+# Simulation: levels on every side of synthetic order books
+SIMULATION_BOOK_DEPTH = 20
+# Simulation: distance between the best bid and ask and between levels of synthetic books (fractions of price)
+SIMULATION_SPREAD = 0.001
+SIMULATION_LEVEL_STEP = 0.0005
+# Simulation: total (in main currency) on every level of synthetic books
+SIMULATION_LEVEL_TOTAL = 1.0
+# Simulation: round trip of a simulated call to the exchange (seconds)
+SIMULATION_LATENCY_SECONDS = 0.05
+# Simulation: how far (fraction of price, standard deviation) the market moves between iterations of paper trading
+SIMULATION_VOLATILITY = 0.002
+
 
 def search_book(books, book_id):
     for book in books:
@@ -0,0 +1,24 @@
+import json
+import os
+
+import psycopg2
+from psycopg2.extras import DictCursor
+
+from science.collector.service.collector_service import Collector
+from science.collector.service.poloniex_service import PoloniexPublicService
+
+if __name__ == '__main__':
+    database = os.environ.get('DATABASE_NAME',
+                              "dbname=deep_crypto user=postgres password=postgres host=localhost port=5432")
+    # the same parameters the cycle is started with, so the collector keeps exactly those pairs fresh
+    params_file = os.environ.get('PARAMS', os.path.join(os.path.dirname(__file__), '..', 'resources',
+                                                        'example.json'))
+
+    with open(params_file) as f:
+        pairs = json.load(f)['pairs']
+
+    connection = psycopg2.connect(database)
+    cursor = connection.cursor(cursor_factory=DictCursor)
+
+    collector = Collector(PoloniexPublicService(connection, cursor, database), pairs)
+    collector.run()
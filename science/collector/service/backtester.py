@@ -0,0 +1,310 @@
+import time
+from datetime import datetime
+
+import numpy as np
+
+from science.collector.core.utils import BACKTEST_MAKER_FEE, BACKTEST_TAKER_FEE, BACKTEST_INITIAL_BALANCE, \
+    BACKTEST_ORDER_TTL, BACKTEST_CHUNK, FORECAST_DIRECT
+from science.collector.service.models.registry import getForecaster
+from science.collector.service.planner import BUY, SELL, OP_TYPES, planSignals, selectPlan, believedSteps
+
+# minimal total of an order, smaller ones are not placed (the same as in Trader)
+MIN_TOTAL = 0.0001
+
+TRADE_DTYPE = np.dtype([('date', np.int64), ('op', np.int8), ('pair', np.int32), ('price', np.float64),
+                        ('amount', np.float64), ('fee', np.float64), ('maker', np.bool_)])
+
+
+def loadHistory(poloniex_service, pairs: list, start, end, period: int, learn_on='weighted_average') -> list:
+    """
+    Loads stored chart data of pairs and leaves only the dates those are present for every pair
+    :param poloniex_service: wrapper for interaction with DB
+    :param pairs: list of pairs
+    :param start: start of history
+    :param end: end of history
+    :param period: periodicity of data
+    :param learn_on: the column forecasts are made on
+    :return: dates and matrices (dates x pairs) of learn_on, close, high and low
+    """
+    series = []
+
+    for pair in pairs:
+        main_currency, secondary_currency = pair.split('_')
+        rows = poloniex_service.getChartDataFromDB(main_currency, secondary_currency, start, end, period,
+                                                   fields=['date', learn_on, 'close', 'high', 'low'], limit=None)
+        rows = np.array([tuple(r) for r in rows], dtype=np.float64).reshape(-1, 5)
+        series.append(rows[np.argsort(rows[:, 0])])
+
+    dates = None
+    for rows in series:
+        dates = rows[:, 0] if dates is None else np.intersect1d(dates, rows[:, 0], assume_unique=True)
+
+    columns = [np.empty((len(dates), len(pairs)), dtype=np.float64) for _ in range(4)]
+    for i, rows in enumerate(series):
+        rows = rows[np.isin(rows[:, 0], dates, assume_unique=True)]
+        for c in range(4):
+            columns[c][:, i] = rows[:, c + 1]
+
+    return [dates.astype(np.int64)] + columns
+
+
+def rollingForecasts(algorithm: str, history: np.ndarray, window: int, steps: int, hyperparameters: dict,
+                     every: int = None) -> np.ndarray:
+    """
+    Forecasts as the cycle would have made them at every moment of history, on the window of data before it.
+    Only batched forecasters are fast enough for that: those that can do it over the whole history in one pass
+    (see Forecaster.rollingPrediction) forecast at every date, the rest are refit on every window
+    :param algorithm: name of forecaster in registry
+    :param history: observations, matrix (dates x pairs)
+    :param window: amount of observations forecasts are made on
+    :param steps: amount of steps in future
+    :param hyperparameters: dictionary of hyperparameters for prediction model
+    :param every: forecasts are made every that many dates and held in between (as cycles are run),
+        None - at every date for forecasters those make them in one pass, every steps dates for the rest
+    :return: forecasts, shape (dates x pairs x steps), NaN where there is not enough history yet
+    """
+    forecaster = getForecaster(algorithm)
+    if not forecaster.batched:
+        raise ValueError('Only batched forecasters can be backtested, not ' + algorithm)
+
+    T, P = history.shape
+
+    forecasts = forecaster.rollingPrediction(history, window, steps, hyperparameters)
+    if forecasts is not None:
+        if every and every > 1 and T >= window:
+            # a forecast is held until the next cycle: every date takes the one of the latest cycle before it
+            made = window - 1 + (np.arange(window - 1, T) - (window - 1)) // every * every
+            forecasts[window - 1:] = forecasts[made]
+        return forecasts
+
+    every = every or steps
+    forecasts = np.full((T, P, steps), np.nan)
+    keys = [str(i) for i in range(P)]
+
+    for t in range(window - 1, T, every):
+        data = {key: history[t - window + 1:t + 1, i] for i, key in enumerate(keys)}
+        predictions = forecaster.makePrediction(data, steps, hyperparameters, FORECAST_DIRECT)
+
+        for i, key in enumerate(keys):
+            forecasts[t, i] = [predictions[key][step] for step in range(1, steps + 1)]
+
+        forecasts[t + 1:t + every] = forecasts[t]
+
+    return forecasts
+
+
+class Backtester:
+    """
+    Replays history through the same planning rules as Trader (see planner) with simulated fills and balances:
+        - an order priced through the current price is filled at once at the current price, as taker
+        - otherwise it rests and is filled at its price, as maker, by the first candle whose range reaches it
+        - resting orders expire after order_ttl candles, with reopen new order replaces resting ones of the same kind
+    """
+
+    def __init__(self, pairs: list, dates: np.ndarray, prices: np.ndarray, highs: np.ndarray, lows: np.ndarray,
+                 forecasts: np.ndarray, budget: float, top_n=3, risk=0, THRESHOLD=0.000001,
+                 makerFee=BACKTEST_MAKER_FEE, takerFee=BACKTEST_TAKER_FEE, initial_balance=BACKTEST_INITIAL_BALANCE,
+                 reopen=False, order_ttl=BACKTEST_ORDER_TTL):
+        """
+        :param pairs: list of pairs
+        :param dates: dates of history
+        :param prices: current prices at every date, matrix (dates x pairs)
+        :param highs: highest prices of candles, matrix (dates x pairs)
+        :param lows: lowest prices of candles, matrix (dates x pairs)
+        :param forecasts: forecasts made at every date, shape (dates x pairs x steps), NaN - nothing to plan on
+        :param budget: allowed overall maximum (in common currency) for all operations during an iteration
+        :param top_n: how many of most profitable operations to apply
+        :param risk: in how many of the steps (in %) the plan believes as if they must happen
+        :param THRESHOLD: the baseline of profitability to perform any operation
+        :param makerFee: fee of orders filled from the book (fraction, as returnFeeInfo gives it)
+        :param takerFee: fee of orders filled at once (fraction, as returnFeeInfo gives it)
+        :param initial_balance: amount of common currency at start
+        :param reopen: whether a new order replaces still resting orders of the same pair and type
+        :param order_ttl: after how many candles a resting order is cancelled
+        """
+        self.pairs = pairs
+        self.dates = dates
+        self.prices = prices
+        self.highs = highs
+        self.lows = lows
+        self.forecasts = forecasts
+        self.budget = budget
+        self.top_n = top_n
+        self.risk = 100 if risk > 100 else 0 if risk < 0 else risk
+        self.THRESHOLD = THRESHOLD
+        self.makerFee = makerFee
+        self.takerFee = takerFee
+        self.initial_balance = initial_balance
+        self.reopen = reopen
+        self.order_ttl = order_ttl
+
+    def run(self) -> dict:
+        """
+        :return: metrics, equity (in common currency) at every date and performed trades (array of TRADE_DTYPE)
+        """
+        started = time.time()
+        T, P, steps = self.forecasts.shape
+        believe_in = believedSteps(steps, self.risk)
+
+        self.cash, self.reserved_cash = float(self.initial_balance), 0.0
+        # coins available and locked in resting sells, and what all of them cost
+        self.held, self.reserved, self.cost = np.zeros(P), np.zeros(P), np.zeros(P)
+        # resting orders: [op, pair, price, amount, expires]
+        self.orders = []
+        self.trades, self.fees, self.rejected = [], 0.0, 0
+
+        equity = np.empty(T)
+        plannable = self.plannable()
+
+        for t in range(T):
+            if self.orders:
+                self.fillResting(t)
+
+            # nothing to buy, nothing to sell -> planning is skipped
+            if plannable[t] or (self.held * self.prices[t] >= MIN_TOTAL).any():
+                current = self.prices[t]
+                held = self.held + self.reserved
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    bought_for = np.where(held > 0, self.cost / held, np.nan)
+
+                signals = planSignals(self.forecasts[t], current, bought_for, self.makerFee, self.takerFee,
+                                      self.THRESHOLD)
+                for operation in selectPlan(self.forecasts[t], current, signals, self.top_n, believe_in):
+                    self.place(t, operation)
+
+            equity[t] = self.cash + self.reserved_cash + ((self.held + self.reserved) * self.prices[t]).sum()
+
+        trades = np.array(self.trades, dtype=TRADE_DTYPE)
+
+        peak = np.maximum.accumulate(equity) if T else equity
+        metrics = {
+            'candles': int(T),
+            'pairs': int(P),
+            'final_equity': float(equity[-1]) if T else float(self.initial_balance),
+            'return': float(equity[-1] / self.initial_balance - 1) if T else 0.0,
+            'max_drawdown': float(np.max((peak - equity) / peak)) if T else 0.0,
+            'trades': int(len(trades)),
+            'buys': int(np.count_nonzero(trades['op'] == BUY)),
+            'sells': int(np.count_nonzero(trades['op'] == SELL)),
+            'maker_share': float(trades['maker'].mean()) if len(trades) else 0.0,
+            'fees': self.fees,
+            'rejected': self.rejected,
+            'seconds': time.time() - started,
+        }
+
+        print(datetime.now(), 'Backtest finished:', metrics)
+
+        return {'metrics': metrics, 'equity': equity, 'trades': trades}
+
+    def plannable(self) -> np.ndarray:
+        """
+        Dates, when there is anything to buy, found for the whole history at once (in chunks to bound memory)
+        :return: boolean vector over dates
+        """
+        T, P, steps = self.forecasts.shape
+        result = np.zeros(T, dtype=bool)
+        nothing_held = np.full(P, np.nan)
+
+        for begin in range(0, T, BACKTEST_CHUNK):
+            forecasts, prices = self.forecasts[begin:begin + BACKTEST_CHUNK], self.prices[begin:begin + BACKTEST_CHUNK]
+            buy, _, _ = planSignals(forecasts, prices, np.broadcast_to(nothing_held, prices.shape),
+                                    self.makerFee, self.takerFee, self.THRESHOLD)
+            result[begin:begin + BACKTEST_CHUNK] = np.isfinite(buy).any(axis=(1, 2))
+
+        return result
+
+    def place(self, t: int, operation):
+        op, pair, price = int(operation['op']), int(operation['pair']), float(operation['price'])
+        current = float(self.prices[t, pair])
+
+        amount = round(self.budget / price / self.top_n, 8)
+
+        if self.reopen:
+            for order in [o for o in self.orders if o[0] == op and o[1] == pair]:
+                self.cancel(order)
+
+        if op == SELL:
+            # the exchange would reject selling more than there is
+            amount = min(amount, float(self.held[pair]))
+
+        if amount * price < MIN_TOTAL:
+            return
+
+        if op == BUY:
+            if price >= current:
+                if amount * current > self.cash:
+                    self.rejected += 1
+                    return
+                self.cash -= amount * current
+                self.bought(t, pair, current, amount, self.takerFee, False)
+            elif amount * price > self.cash:
+                self.rejected += 1
+            else:
+                self.cash -= amount * price
+                self.reserved_cash += amount * price
+                self.orders.append([op, pair, price, amount, t + self.order_ttl])
+        else:
+            if price <= current:
+                self.held[pair] -= amount
+                self.sold(t, pair, current, amount, self.takerFee, False)
+            else:
+                self.held[pair] -= amount
+                self.reserved[pair] += amount
+                self.orders.append([op, pair, price, amount, t + self.order_ttl])
+
+    def fillResting(self, t: int):
+        resting = []
+
+        for order in self.orders:
+            op, pair, price, amount, expires = order
+
+            if op == BUY and self.lows[t, pair] <= price:
+                self.reserved_cash -= amount * price
+                self.bought(t, pair, price, amount, self.makerFee, True)
+            elif op == SELL and self.highs[t, pair] >= price:
+                self.reserved[pair] -= amount
+                self.sold(t, pair, price, amount, self.makerFee, True)
+            elif t >= expires:
+                self.cancel(order, remove=False)
+            else:
+                resting.append(order)
+
+        self.orders = resting
+
+    def cancel(self, order, remove=True):
+        op, pair, price, amount, _ = order
+
+        if op == BUY:
+            self.reserved_cash -= amount * price
+            self.cash += amount * price
+        else:
+            self.reserved[pair] -= amount
+            self.held[pair] += amount
+
+        if remove:
+            self.orders.remove(order)
+
+    def bought(self, t: int, pair: int, price: float, amount: float, fee: float, maker: bool):
+        # fee of buying is taken from the bought coins
+        self.held[pair] += amount * (1 - fee)
+        self.cost[pair] += amount * price
+        self.fees += amount * fee * price
+        self.trades.append((self.dates[t], BUY, pair, price, amount, amount * fee * price, maker))
+
+    def sold(self, t: int, pair: int, price: float, amount: float, fee: float, maker: bool):
+        # cost of what is left is reduced in proportion to what was sold
+        left = self.held[pair] + self.reserved[pair]
+        self.cost[pair] *= left / (left + amount)
+
+        # fee of selling is taken from the received common currency
+        self.cash += amount * price * (1 - fee)
+        self.fees += amount * price * fee
+        self.trades.append((self.dates[t], SELL, pair, price, amount, amount * price * fee, maker))
+
+    def describeTrades(self, trades: np.ndarray) -> list:
+        """
+        :return: trades as list of dictionaries (for responses)
+        """
+        return [{'date': int(r['date']), 'type': OP_TYPES[r['op']], 'pair': self.pairs[r['pair']],
+                 'price': float(r['price']), 'amount': float(r['amount']), 'fee': float(r['fee']),
+                 'maker': bool(r['maker'])} for r in trades]
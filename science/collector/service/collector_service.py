@@ -0,0 +1,174 @@
+import heapq
+import time
+from datetime import datetime
+
+from science.collector.core.utils import PERIODS, COLLECTOR_CLOSE_DELAY_SECONDS, COLLECTOR_STAGGER_SECONDS, \
+    COLLECTOR_INITIAL_HISTORY_SECONDS, COLLECTOR_MAINTENANCE_SECONDS, CHART_DATA_RETENTION_SECONDS
+from science.collector.service.poloniex_service import PoloniexPublicService
+
+
+class Collector:
+    poloniex_service: PoloniexPublicService
+    pairs: list
+    periods: list
+    lastDates: dict
+    freshness: dict
+
+    def __init__(self, poloniex_service, pairs: list, periods: list = None,
+                 stagger=COLLECTOR_STAGGER_SECONDS, close_delay=COLLECTOR_CLOSE_DELAY_SECONDS,
+                 initial_history=COLLECTOR_INITIAL_HISTORY_SECONDS, retention=CHART_DATA_RETENTION_SECONDS,
+                 listener=None):
+        """
+        Long-running collector that keeps chart data of every (pair, period) series up to date in DB
+        :param poloniex_service: wrapper for interaction with poloniex api
+        :param pairs: list of pairs to collect
+        :param periods: list of periods to collect for every pair (all known periods by default)
+        :param stagger: distance in seconds between refreshes of series those are due on the same candle boundary
+        :param close_delay: how long to wait after candle is closed before asking for it
+        :param initial_history: how deep into history to go (in seconds) for series those are not stored yet
+        :param retention: how long (in seconds) chart data is kept, None - forever
+        :param listener: called with (pair, period, closed observations) after they are saved.
+            Only a consumer in the same process gets them: run_collector runs the collector standalone
+            without one, and the streaming forecaster of the server is fed by cycles instead
+        """
+        self.poloniex_service = poloniex_service
+        self.pairs = pairs
+        self.periods = PERIODS if periods is None else periods
+        self.stagger = stagger
+        self.close_delay = close_delay
+        self.initial_history = initial_history
+        self.retention = retention
+        self.listener = listener
+        self.maintainedAt = None
+
+        # what is already stored -> each series continues from its own last candle
+        self.lastDates = self.poloniex_service.returnLastChartDataDates()
+        self.freshness = {}
+
+        self.schedule = []
+        self.running = False
+
+    def series(self) -> list:
+        """
+        :return: all (pair, period) series the collector is responsible for
+        """
+        return [(pair, period) for period in self.periods for pair in self.pairs]
+
+    @staticmethod
+    def nextCandleClose(period: int, now: float) -> int:
+        """
+        :param period: periodicity of data
+        :param now: current moment as timestamp
+        :return: timestamp of the nearest candle boundary in future
+        """
+        return (int(now) // period + 1) * period
+
+    def offset(self, index: int, period: int) -> float:
+        """
+        Spreads series those are due at the same moment, so api calls do not come in bursts
+        :param index: ordinal number of series
+        :param period: periodicity of series
+        :return: delay in seconds after candle close
+        """
+        return self.close_delay + (index * self.stagger) % (period / 2)
+
+    def start(self, now: float = None):
+        """
+        Fills the schedule: every series is refreshed right away, then on its candle-close boundaries
+        """
+        now = time.time() if now is None else now
+        self.schedule = []
+
+        for index, (pair, period) in enumerate(self.series()):
+            heapq.heappush(self.schedule, (now + index * self.stagger, index, pair, period))
+
+    def run(self):
+        """
+        Main loop of collector. Works until stop() is called
+        """
+        self.start()
+        self.running = True
+
+        print(datetime.now(), 'Collector started for', len(self.schedule), 'series')
+
+        while self.running and self.schedule:
+            if self.maintainedAt is None or time.time() - self.maintainedAt >= COLLECTOR_MAINTENANCE_SECONDS:
+                self.maintain()
+
+            due, index, pair, period = heapq.heappop(self.schedule)
+
+            delay = due - time.time()
+            if delay > 0:
+                time.sleep(delay)
+
+            try:
+                self.refresh(pair, period)
+            except Exception as e:
+                # the connection is shared by all refreshes, it must not stay in the aborted transaction
+                self.poloniex_service.connection.rollback()
+                print(datetime.now(), 'Refresh of', pair, period, 'failed:', e)
+
+            next_due = self.nextCandleClose(period, time.time()) + self.offset(index, period)
+            heapq.heappush(self.schedule, (next_due, index, pair, period))
+
+    def maintain(self):
+        """
+        Creates partitions of chart data for the data to come and drops expired ones
+        """
+        now = int(time.time())
+
+        try:
+            self.poloniex_service.ensureChartDataPartitions(now - self.initial_history,
+                                                            now + COLLECTOR_MAINTENANCE_SECONDS * 31)
+            if self.retention is not None:
+                self.poloniex_service.dropExpiredChartData(self.retention, now)
+        except Exception as e:
+            self.poloniex_service.connection.rollback()
+            print(datetime.now(), 'Maintenance of chart data failed:', e)
+
+        self.maintainedAt = now
+
+    def stop(self):
+        self.running = False
+
+    def refresh(self, pair: str, period: int) -> int:
+        """
+        Loads into DB only candles those were closed after the last stored one
+        :param pair: currency pair
+        :param period: periodicity of data
+        :return: amount of elements those were saved
+        """
+        now = int(time.time())
+        last_date = self.lastDates.get((pair, period))
+
+        start = now - self.initial_history if last_date is None else last_date + period
+        end = now
+
+        chartData = self.poloniex_service.poloniexApi.returnChartData(currencyPair=pair, start=start, end=end,
+                                                                       period=period)
+
+        # poloniex answers with a single zero-dated element if there is nothing in range,
+        # and the last candle may still be forming - only closed ones are written
+        closed = [o for o in chartData or []
+                  if o['date'] and int(o['date']) >= start and int(o['date']) + period <= now]
+
+        saved = 0
+        if closed:
+            main_currency, secondary_currency = pair.split('_')
+            saved = self.poloniex_service.saveChartDataToDb(main_currency, secondary_currency, period, closed)
+            last_date = max(int(o['date']) for o in closed)
+            self.lastDates[(pair, period)] = last_date
+
+            if self.listener is not None:
+                self.listener(pair, period, closed)
+
+        if last_date is not None:
+            self.freshness[(pair, period)] = now - (last_date + period)
+
+        return saved
+
+    def getFreshness(self) -> dict:
+        """
+        :return: lag in seconds since the latest stored candle was closed, where key = (pair, period)
+        """
+        return dict(self.freshness)
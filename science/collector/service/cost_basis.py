@@ -0,0 +1,134 @@
+import threading
+from bisect import bisect_right
+
+
+class PairLots:
+    """
+    FIFO lots of a single pair: every buy adds a lot, every sell consumes the oldest ones.
+    Running sums make the average price of what is held O(1), and of the newest part of it O(log n)
+    """
+
+    def __init__(self):
+        # cumulative amounts and costs of all lots ever bought (in order of trades)
+        self.cumAmount, self.cumCost = [], []
+        # what was consumed by sells from the front
+        self.head, self.consumedAmount, self.consumedCost = 0, 0.0, 0.0
+        self.lastTradeId = 0
+
+    @property
+    def held(self) -> float:
+        return (self.cumAmount[-1] if self.cumAmount else 0.0) - self.consumedAmount
+
+    def lotOf(self, i: int) -> list:
+        """
+        :return: amount and cost of lot i
+        """
+        amount = self.cumAmount[i] - (self.cumAmount[i - 1] if i else 0.0)
+        cost = self.cumCost[i] - (self.cumCost[i - 1] if i else 0.0)
+        return [amount, cost]
+
+    def buy(self, amount: float, cost: float):
+        if amount <= 0:
+            return
+        self.cumAmount.append((self.cumAmount[-1] if self.cumAmount else 0.0) + amount)
+        self.cumCost.append((self.cumCost[-1] if self.cumCost else 0.0) + cost)
+
+    def sell(self, amount: float):
+        # the oldest lots go first, the last of them may be consumed partially
+        amount = min(amount, self.held)
+
+        while amount > 0 and self.head < len(self.cumAmount):
+            lot_amount, lot_cost = self.lotOf(self.head)
+            left = self.cumAmount[self.head] - self.consumedAmount
+
+            taken = min(amount, left)
+            self.consumedAmount += taken
+            self.consumedCost += lot_cost * taken / lot_amount
+            amount -= taken
+
+            if taken >= left:
+                self.head += 1
+
+    def averagePrice(self, balance: float = None) -> float:
+        """
+        :param balance: current balance, None - as much as is held by the trades of this pair
+        :return: average price the balance was bought for. If balance is less than what is held,
+            the newest lots are taken (the oldest ones are assumed to have been gone)
+        """
+        held = self.held
+        if held <= 0:
+            return None
+
+        if balance is None or balance >= held:
+            return (self.cumCost[-1] - self.consumedCost) / held
+
+        # the newest lots those explain the balance: from the lot where the balance begins till the end
+        boundary = self.cumAmount[-1] - balance
+        i = bisect_right(self.cumAmount, boundary)
+
+        lot_amount, lot_cost = self.lotOf(i)
+        part = self.cumAmount[i] - boundary
+        cost = self.cumCost[-1] - self.cumCost[i] + lot_cost * part / lot_amount
+
+        return cost / balance
+
+
+class CostBasisIndex:
+    """
+    FIFO cost basis of every pair, maintained incrementally from the trade ledger
+    """
+
+    def __init__(self):
+        self.pairs = {}
+        # the newest applied trade of all pairs and pairs whose whole history was applied up to it
+        self.lastAppliedId = 0
+        self.covered = set()
+        self.lock = threading.Lock()
+
+    def lastTradeId(self, pairs: list) -> int:
+        """
+        :return: globalTradeID all the pairs are up to date with, 0 if some of them were never loaded
+            (pairs with no trades count as up to date once they were loaded)
+        """
+        with self.lock:
+            return self.lastAppliedId if self.covered.issuperset(pairs) else 0
+
+    def update(self, history: dict, pairs: list = None):
+        """
+        Applies trades those were not applied yet
+        :param history: dictionary where key = currencyPair and value = list of trades (in any order)
+        :param pairs: pairs the history was loaded for (even those without trades), by default pairs of history
+        """
+        with self.lock:
+            self.covered.update(history.keys() if pairs is None else pairs)
+
+            for pair, trades in history.items():
+                lots = self.pairs.setdefault(pair, PairLots())
+
+                for trade in sorted(trades, key=lambda t: int(t['globalTradeID'])):
+                    trade_id = int(trade['globalTradeID'])
+                    if trade_id <= lots.lastTradeId:
+                        continue
+
+                    amount, total, fee = float(trade['amount']), float(trade['total']), float(trade['fee'])
+
+                    # fee is a fraction: buyer gets less of the bought currency, seller - less of the main one
+                    if trade['type'] == 'buy':
+                        lots.buy(amount * (1 - fee), total)
+                    else:
+                        lots.sell(amount)
+
+                    lots.lastTradeId = trade_id
+                    self.lastAppliedId = max(self.lastAppliedId, trade_id)
+
+    def averagePrice(self, pair: str, balance: float = None) -> float:
+        """
+        :return: average price (fees included) the balance of pair was bought for, None if nothing is held
+        """
+        with self.lock:
+            lots = self.pairs.get(pair)
+            return None if lots is None else lots.averagePrice(balance)
+
+
+# Shared by all cycles of the process, so every cycle applies only new trades
+costBasisIndex = CostBasisIndex()
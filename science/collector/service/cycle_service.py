@@ -1,20 +1,32 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 
+import numpy as np
+
 from science.collector.core.entities import Parameters
-from science.collector.core.utils import datetimeToTimestamp
+from science.collector.core.utils import datetimeToTimestamp, CYCLE_FETCH_WORKERS, STREAMING
+from science.collector.service.models.kalman import streamingForecaster
 from science.collector.service.models.model import Model
+from science.collector.service.order_executor import PLACE, MOVE
 from science.collector.service.poloniex_service import PoloniexPublicService
+from science.collector.service.shard_service import getCoordinator
 from science.collector.service.trader import Trader
+from science.collector.service.window_cache import windowCache
 
 
 class Cycle:
     poloniex_service: PoloniexPublicService
+    errors: dict
+    dates: dict
 
     def __init__(self, poloniex_service):
         """
         :param poloniex_service: wrapper for interaction with poloniex api
         """
         self.poloniex_service = poloniex_service
+        self.errors = {}
+        self.dates = {}
 
     def startCycleIteration(self, params_dict: dict) -> list:
         """
@@ -23,50 +35,157 @@ class Cycle:
         """
         # take all the params those were passed into method and wraps in up into Object
         params = Parameters(params_dict)
-        # get all the data from Poloniex
-        print(datetime.now(), 'Started getting data for pairs:', params.pairs, 'And window:', params.window)
-        data = self.getAllDataForParams(params.pairs, params.window, params.period, params.learn_on)
 
-        # load data into Model and get prediction
-        model = Model(data, params.steps, params.hyperparameters, params.algorithm)
-        predictions = model.predict()
+        if params.shards > 1:
+            # every group of pairs is loaded and predicted in a process of its own, the plan is made over all of them
+            predictions, self.errors = getCoordinator(params.shards, params.shard_mode).predict(
+                self.poloniex_service.database, params_dict, params.pairs)
+        else:
+            predictions = self.predictForParams(params, params.pairs)
 
         # pass prediction to Trader logic and get a prepared plan
         trader = Trader(poloniex_service=self.poloniex_service, budget=params.budget, risk=params.risk,
                         steps=params.steps, pairs=params.pairs, predictions=predictions,
                         top_n=params.top_n, common_currency=params.common_currency, THRESHOLD=params.THRESHOLD,
-                        current_price_from=params.current_price_from, reopen=params.reopen)
+                        current_price_from=params.current_price_from, reopen=params.reopen,
+                        order_type=params.order_type)
 
         print(datetime.now(), 'Started plan preparation...')
         plan = trader.preparePlan()
 
         # perform created plan
-        operations = trader.trade(plan)
+        calls = trader.trade(plan)
 
-        # return performed operations
-        return operations
+        # return performed operations: responses of placed (and moved) orders, as poloniex gave them.
+        # Failed calls, cancels and timings of every call are only logged by the executor
+        return [call['response'] for call in calls if call['action'] in (PLACE, MOVE) and 'response' in call]
 
-    def getAllDataForParams(self, pairs: list, window: dict, period: int, learn_on: str = 'weightedAverage') -> dict:
+    def predictForParams(self, params: Parameters, pairs: list) -> dict:
         """
-        Wraps up all logic for getting data from poloniex
+        Loads data for pairs and makes predictions
+        :param params: parameters of the cycle
+        :param pairs: pairs to predict (all the pairs of the cycle or a shard of them)
+        :return: predictions where key = currencyPair and value = dict where key = step_number value = prediction
+        """
+        # get all the data from Poloniex
+        print(datetime.now(), 'Started getting data for pairs:', pairs, 'And window:', params.window)
+        data = self.getAllDataForParams(pairs, params.window, params.period, params.learn_on, params.fetch_workers,
+                                        streaming=params.algorithm == STREAMING)
+
+        if params.algorithm == STREAMING:
+            # forecasts are kept ready by the streaming filter, nothing is fitted inside the request.
+            # The filter has just been given the candles loaded above, it is updated only when a cycle runs
+            return self.getStreamingPredictions(data, params.period, params.steps, params.learn_on)
+
+        # load data into Model and get prediction
+        model = Model(data, params.steps, params.hyperparameters, params.algorithm, params.forecast_mode,
+                      params.refit_every, params.model_workers, params.model_timeout,
+                      params.model_time_budget, params.model_fallback)
+        return model.predict()
+
+    def getAllDataForParams(self, pairs: list, window: dict, period: int, learn_on: str = 'weightedAverage',
+                            workers: int = CYCLE_FETCH_WORKERS, streaming: bool = False) -> dict:
+        """
+        Wraps up all logic for getting data from poloniex.
+        Windows are kept in process-resident cache, so only candles after the last cached one are loaded.
+        Pairs are loaded concurrently; a pair that failed is reported in self.errors and left out
         :param pairs: list of pairs
         :param window: window of data on that prediction will be made
         :param period: periodicity of data
         :param learn_on: the column with price from poloniex on that to learn on our prediction algorithm
-        :return: The data from poloniex for specified params
+        :param workers: how many pairs are loaded at the same time
+        :param streaming: whether new candles are applied to the streaming filter
+        :return: The data from poloniex for specified params, every pair with its own window (dates are in self.dates)
         """
-        data = {}
-
         # parse the window to get boundaries for selection
         start, end = self.parseWindow(window)
 
-        for pair in pairs:
-            chartData = self.poloniex_service.getChartData(pair, start, end, period)
+        self.errors = {}
+        windows = {}
+
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(pairs)))) as executor:
+            futures = {pair: executor.submit(windowCache.getWindow, self.poloniex_service.chartDataApi,
+                                             pair, period, learn_on, start, end)
+                       for pair in pairs}
+
+            for pair, future in futures.items():
+                try:
+                    dates, values = future.result()
+                except Exception as e:
+                    self.errors[pair] = str(e)
+                    continue
+
+                if len(values) < 2:
+                    self.errors[pair] = 'No data'
+                    continue
+
+                windows[pair] = (dates, values)
+
+                # only the candles those were not applied yet cost anything
+                if streaming:
+                    streamingForecaster.update((pair, period, learn_on), dates, values)
+
+        data = self.alignChartData(windows, period, int(start), int(end))
+
+        if self.errors:
+            print(datetime.now(), 'Failed to get data for pairs:', self.errors)
+
+        return data
+
+    def alignChartData(self, windows: dict, period: int, start: int, end: int) -> dict:
+        """
+        Every pair keeps its own contiguous window, windows are only aligned at their end:
+        the candle that is still forming is left out, so all the windows end at the last closed candle.
+        The alignment depends only on the clock, so shards of a cycle get the same windows as a whole cycle.
+        Pairs those lag behind by more than a candle are left out, pairs with a short history
+        (e.g. recently listed) are kept and reported in self.errors
+        :param windows: dictionary where key = currencyPair and value = dates and observations
+        :param period: periodicity of data
+        :param start: start of the window
+        :param end: end of the window
+        :return: dictionary where key = currencyPair and value = array of observations, their dates are put
+            into self.dates
+        """
+        # by the clock, not by end: end of a window may be shifted by the timezone of the host
+        now = int(time.time())
+        last_closed = now // period * period - period
+        expected = (end - start) // period
+
+        self.dates, data = {}, {}
+        for pair, (dates, values) in windows.items():
+            closed = int(np.searchsorted(dates, last_closed, side='right'))
+            dates, values = dates[:closed], values[:closed]
 
-            data[pair] = [observation[learn_on] for observation in chartData]
+            if len(values) < 2 or dates[-1] < last_closed - period:
+                self.errors[pair] = 'Stale data: the last candle is ' + (str(int(dates[-1])) if len(dates) else
+                                                                         'absent')
+                continue
+
+            if len(values) < expected // 2:
+                self.errors[pair] = 'Short history: ' + str(len(values)) + ' of ' + str(expected) + ' observations'
+
+            self.dates[pair] = dates
+            data[pair] = values
 
         return data
 
+    def getStreamingPredictions(self, data: dict, period: int, steps: int, learn_on: str = 'weightedAverage') -> dict:
+        """
+        :param data: dictionary of data where key = currencyPair (only pairs are used)
+        :param period: periodicity of data
+        :param steps: amount of steps in future
+        :param learn_on: the column with price the filter is run on
+        :return: precomputed predictions in the same shape as Model gives them
+        """
+        predictions = {}
+
+        for pair in data.keys():
+            prediction, _ = streamingForecaster.forecast((pair, period, learn_on), steps)
+            if prediction is not None:
+                predictions[pair] = prediction
+
+        return predictions
+
     def parseWindow(self, window_dict=None):
         """
         Parse the window into boundaries (start, end)
@@ -74,24 +193,34 @@ class Cycle:
                 Example: {'WEEK':2}
         :return: two bounds for selection
         """
+        end = datetime.now()
+        start = end - self.windowLength(window_dict)
+
+        return [datetimeToTimestamp(start), datetimeToTimestamp(end)]
+
+    @staticmethod
+    def windowLength(window_dict=None) -> timedelta:
+        """
+        :param window_dict of data on that prediction will be made
+                Example: {'WEEK':2}
+        :return: length of the window
+        """
         if window_dict is None:
             window_dict = {'MONTH': 1}
 
-        start, end, window, amount = None, None, None, None
+        window, amount = None, None
 
         for k, v in window_dict.items():
             window = k
             amount = v
 
-        end = datetime.now()
-
         if 'HOUR' == window:
-            start = end - timedelta(hours=amount)
+            return timedelta(hours=amount)
         elif 'DAY' == window:
-            start = end - timedelta(days=amount)
+            return timedelta(days=amount)
         elif 'WEEK' == window:
-            start = end - timedelta(weeks=amount)
+            return timedelta(weeks=amount)
         elif 'MONTH' == window:
-            start = end - timedelta(weeks=amount * 4)
+            return timedelta(weeks=amount * 4)
 
-        return [datetimeToTimestamp(start), datetimeToTimestamp(end)]
+        raise ValueError('Unknown window: ' + str(window_dict))
@@ -0,0 +1,120 @@
+from datetime import datetime
+
+from psycopg2.extras import execute_values
+
+from science.collector.service.poloniex_service import PoloniexPublicService
+
+GAPS_SCAN_SQL = """
+SELECT prev_date + %(period)s AS gap_start, date - %(period)s AS gap_end
+FROM (SELECT date, lag(date) OVER (ORDER BY date) AS prev_date
+      FROM poloniex.chart_data
+      WHERE main_currency = %(main_currency)s AND secondary_currency = %(secondary_currency)s
+        AND period = %(period)s AND date >= %(start)s AND date <= %(end)s) dates
+WHERE date - prev_date > %(period)s
+ORDER BY gap_start"""
+
+GAPS_BOUNDS_SQL = """
+SELECT min(date) AS first_date, max(date) AS last_date
+FROM poloniex.chart_data
+WHERE main_currency = %(main_currency)s AND secondary_currency = %(secondary_currency)s
+  AND period = %(period)s AND date >= %(start)s AND date <= %(end)s"""
+
+# every gap that overlaps the scanned range is replaced by what the scan finds
+GAPS_CLEAR_SQL = """
+DELETE FROM poloniex.chart_data_gaps
+WHERE main_currency = %(main_currency)s AND secondary_currency = %(secondary_currency)s
+  AND period = %(period)s AND gap_end >= %(start)s AND gap_start <= %(end)s"""
+
+GAPS_INSERT_SQL = """
+INSERT INTO poloniex.chart_data_gaps (main_currency, secondary_currency, period, gap_start, gap_end, scanned_at)
+VALUES %s"""
+
+
+class GapService:
+    poloniex_service: PoloniexPublicService
+
+    def __init__(self, poloniex_service):
+        """
+        Finds missing candles of stored series and loads only them
+        :param poloniex_service: wrapper for interaction with poloniex api and DB
+        """
+        self.poloniex_service = poloniex_service
+        self.connection = poloniex_service.connection
+        self.cursor = poloniex_service.cursor
+
+    def scanGaps(self, mainCurrency, secondaryCurrency, period: int, start: int, end: int) -> list:
+        """
+        Finds all spans of missing candles within the range and stores them into the gap index
+        :param mainCurrency: main currency of the pair
+        :param secondaryCurrency: second currency of the pair
+        :param period: periodicity of data
+        :param start: start of range
+        :param end: end of range
+        :return: list of [gap_start, gap_end], both are dates of missing candles (inclusive)
+        """
+        # candle dates are multiples of period
+        first = -(-start // period) * period
+        last = end // period * period
+
+        args = {'main_currency': mainCurrency, 'secondary_currency': secondaryCurrency, 'period': period,
+                'start': first, 'end': last}
+
+        self.cursor.execute(GAPS_BOUNDS_SQL, args)
+        bounds = self.cursor.fetchone()
+
+        if bounds['first_date'] is None:
+            gaps = [[first, last]] if first <= last else []
+        else:
+            self.cursor.execute(GAPS_SCAN_SQL, args)
+            gaps = [[row['gap_start'], row['gap_end']] for row in self.cursor.fetchall()]
+
+            if bounds['first_date'] > first:
+                gaps.insert(0, [first, bounds['first_date'] - period])
+            if bounds['last_date'] < last:
+                gaps.append([bounds['last_date'] + period, last])
+
+        # the index keeps only what is missing right now
+        self.cursor.execute(GAPS_CLEAR_SQL, args)
+        if gaps:
+            scanned_at = int(datetime.now().timestamp())
+            execute_values(self.cursor, GAPS_INSERT_SQL,
+                           [(mainCurrency, secondaryCurrency, period, gap_start, gap_end, scanned_at)
+                            for gap_start, gap_end in gaps])
+        self.connection.commit()
+
+        return gaps
+
+    def returnGaps(self, mainCurrency, secondaryCurrency, period: int) -> list:
+        """
+        :return: list of [gap_start, gap_end] from the gap index, as they were found by the last scan
+        """
+        self.cursor.execute("SELECT gap_start, gap_end FROM poloniex.chart_data_gaps "
+                            "WHERE main_currency = %s AND secondary_currency = %s AND period = %s "
+                            "ORDER BY gap_start", (mainCurrency, secondaryCurrency, period))
+        return [[row['gap_start'], row['gap_end']] for row in self.cursor.fetchall()]
+
+    def backfillGaps(self, mainCurrency, secondaryCurrency, period: int, start: int, end: int) -> dict:
+        """
+        Loads into DB only the missing spans of the range instead of the whole range
+        :param mainCurrency: main currency of the pair
+        :param secondaryCurrency: second currency of the pair
+        :param period: periodicity of data
+        :param start: start of range
+        :param end: end of range
+        :return: amount of loaded elements and spans those are still missing (poloniex has no data for them)
+        """
+        gaps = self.scanGaps(mainCurrency, secondaryCurrency, period, start, end)
+
+        loaded = 0
+        if gaps:
+            pipeline = self.poloniex_service.createIngestionPipeline().start()
+            try:
+                for gap_start, gap_end in gaps:
+                    self.poloniex_service.submitChartData(pipeline, mainCurrency, secondaryCurrency,
+                                                          gap_start, gap_end, period)
+            finally:
+                loaded = pipeline.close()
+
+            gaps = self.scanGaps(mainCurrency, secondaryCurrency, period, start, end)
+
+        return {'loaded': loaded, 'gaps': gaps}
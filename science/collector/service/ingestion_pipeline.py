@@ -0,0 +1,206 @@
+import queue
+import threading
+import time
+from datetime import datetime
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+from science.collector.core.utils import CHART_DATA_INSERT_SQL, INGESTION_FETCHERS, INGESTION_WRITERS, \
+    INGESTION_QUEUE_SIZE, INGESTION_BATCH_ROWS
+
+# Marks the end of work for a thread
+_STOP = None
+
+
+class StageStats:
+    """
+    Throughput counters of a single pipeline stage, shared between threads of the stage
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.batches = 0
+        self.rows = 0
+        self.busy = 0.0
+        self.blocked = 0.0
+
+    def add(self, rows, busy, blocked=0.0):
+        with self.lock:
+            self.batches += 1
+            self.rows += rows
+            self.busy += busy
+            self.blocked += blocked
+
+    def asDict(self) -> dict:
+        with self.lock:
+            return {'batches': self.batches, 'rows': self.rows,
+                    'busy_seconds': round(self.busy, 3),
+                    'blocked_seconds': round(self.blocked, 3),
+                    'rows_per_second': round(self.rows / self.busy, 1) if self.busy else 0.0}
+
+
+class IngestionPipeline:
+    """
+    Loads chart data from poloniex and writes it into DB at the same time:
+        fetchers put loaded batches into a bounded queue, writers drain it and insert in bulk.
+    When writers fall behind the queue fills up and fetchers wait (backpressure)
+    """
+
+    def __init__(self, poloniexApi, connection=None, database=None, fetchers=INGESTION_FETCHERS,
+                 writers=INGESTION_WRITERS, queue_size=INGESTION_QUEUE_SIZE, batch_rows=INGESTION_BATCH_ROWS):
+        """
+        :param poloniexApi: api wrapper to load data with (safe to share, calls are paced by its coach)
+        :param connection: connection to write with, used only if database is not specified
+        :param database: connection string; every writer opens its own connection with it
+        :param fetchers: amount of threads those load data
+        :param writers: amount of threads those write data (always 1 without database)
+        :param queue_size: how many loaded batches may wait for writers
+        :param batch_rows: how many rows a writer collects into a single insert
+        """
+        self.poloniexApi = poloniexApi
+        self.connection = connection
+        self.database = database
+        self.fetchersAmount = fetchers
+        self.writersAmount = writers if database is not None else 1
+        self.batch_rows = batch_rows
+
+        self.tasks = queue.Queue()
+        self.batches = queue.Queue(maxsize=queue_size)
+
+        self.stats = {'fetch': StageStats(), 'write': StageStats()}
+        self.errors = []
+        self.threads = {'fetch': [], 'write': []}
+
+    def start(self):
+        for _ in range(self.fetchersAmount):
+            self.threads['fetch'].append(self._spawn(self._fetch))
+        for _ in range(self.writersAmount):
+            self.threads['write'].append(self._spawn(self._write))
+        return self
+
+    def submit(self, mainCurrency, secondaryCurrency, start, end, period):
+        """
+        Schedules loading of the range into DB
+        """
+        self.tasks.put((mainCurrency, secondaryCurrency, start, end, period))
+
+    def close(self) -> int:
+        """
+        Gracefully drains the pipeline: waits until every submitted range is loaded and written
+        :return: amount of rows those were written
+        """
+        for _ in self.threads['fetch']:
+            self.tasks.put(_STOP)
+        for thread in self.threads['fetch']:
+            thread.join()
+
+        # everything is loaded at this point, so writers stop right after the last batch
+        for _ in self.threads['write']:
+            self.batches.put(_STOP)
+        for thread in self.threads['write']:
+            thread.join()
+
+        print(datetime.now(), 'Ingestion finished:', self.metrics())
+        return self.stats['write'].rows
+
+    def metrics(self) -> dict:
+        """
+        :return: throughput of every stage
+        """
+        return {stage: stats.asDict() for stage, stats in self.stats.items()}
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @staticmethod
+    def _spawn(target) -> threading.Thread:
+        thread = threading.Thread(target=target, daemon=True)
+        thread.start()
+        return thread
+
+    def _fetch(self):
+        while True:
+            task = self.tasks.get()
+            if task is _STOP:
+                return
+
+            mainCurrency, secondaryCurrency, start, end, period = task
+            started = time.monotonic()
+
+            try:
+                chartData = self.poloniexApi.returnChartData(currencyPair=mainCurrency + '_' + secondaryCurrency,
+                                                             start=start, end=end, period=period)
+            except Exception as e:
+                self.errors.append((task, e))
+                print(datetime.now(), 'Loading of', task, 'failed:', e)
+                continue
+
+            # poloniex answers with a single zero-dated element if there is nothing in range,
+            # a single real candle (the last part of a range may hold only one) is kept
+            rows = [(mainCurrency, secondaryCurrency, period, o['date'],
+                     o['high'], o['low'], o['open'], o['close'],
+                     o['volume'], o['quoteVolume'], o['weightedAverage']) for o in chartData or [] if o['date']]
+            if not rows:
+                continue
+            loaded = time.monotonic()
+
+            # blocks when writers fall behind
+            self.batches.put(rows)
+
+            self.stats['fetch'].add(len(rows), loaded - started, time.monotonic() - loaded)
+
+    def _write(self):
+        connection, cursor = None, None
+        stopped = False
+
+        try:
+            connection = psycopg2.connect(self.database) if self.database is not None else self.connection
+            cursor = connection.cursor()
+
+            while not stopped:
+                rows = self.batches.get()
+                if rows is _STOP:
+                    stopped = True
+                    break
+
+                # take everything that is already waiting, to write it with a single insert
+                while len(rows) < self.batch_rows:
+                    try:
+                        more = self.batches.get_nowait()
+                    except queue.Empty:
+                        break
+                    if more is _STOP:
+                        stopped = True
+                        break
+                    rows.extend(more)
+
+                started = time.monotonic()
+                try:
+                    execute_values(cursor, CHART_DATA_INSERT_SQL, rows, page_size=len(rows))
+                    connection.commit()
+                except Exception as e:
+                    connection.rollback()
+                    self.errors.append((rows[0][:3], e))
+                    print(datetime.now(), 'Writing of', len(rows), 'rows failed:', e)
+                    continue
+
+                self.stats['write'].add(len(rows), time.monotonic() - started)
+        except Exception as e:
+            self.errors.append((None, e))
+            print(datetime.now(), 'Writer failed:', e)
+
+            # fetchers must not block on a writer that is gone: the rest of batches is taken off the queue and dropped
+            while not stopped:
+                rows = self.batches.get()
+                stopped = rows is _STOP
+                if not stopped:
+                    self.errors.append((rows[0][:3], e))
+        finally:
+            if cursor is not None:
+                cursor.close()
+            if connection is not None and connection is not self.connection:
+                connection.close()
@@ -0,0 +1,371 @@
+import itertools
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import deque
+from datetime import datetime
+
+from science.collector.service.poloniex import PoloniexError
+
+BUY, SELL = 'BUY', 'SELL'
+FILL_OR_KILL, IMMEDIATE_OR_CANCEL, POST_ONLY = 'fillOrKill', 'immediateOrCancel', 'postOnly'
+
+# account of the rest of the market: it provides liquidity and is not limited by balances
+MARKET = 'MARKET'
+
+# minimal total of an order, the same as poloniex requires
+MIN_TOTAL = 0.0001
+# what is left of an amount after float arithmetic is considered as nothing
+EPSILON = 1e-12
+
+
+class RestingOrder:
+    __slots__ = ['orderNumber', 'account', 'side', 'pair', 'rate', 'amount', 'startingAmount', 'date', 'seq']
+
+    def __init__(self, orderNumber, account, side, pair, rate, amount, seq):
+        self.orderNumber = orderNumber
+        self.account = account
+        self.side = side
+        self.pair = pair
+        self.rate = rate
+        self.amount = amount
+        self.startingAmount = amount
+        self.date = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+        # time priority within a level
+        self.seq = seq
+
+
+class OrderBook:
+    """
+    Book of a single pair: levels of every side are kept in sorted list of prices,
+    orders of a level are in a queue in order of their arrival (price-time priority)
+    """
+
+    def __init__(self):
+        self.levels = {BUY: {}, SELL: {}}
+        # ascending, the best bid is the last one and the best ask is the first one
+        self.prices = {BUY: [], SELL: []}
+
+    def best(self, side: str):
+        prices = self.prices[side]
+        if not prices:
+            return None
+        return prices[-1] if side == BUY else prices[0]
+
+    def add(self, order: RestingOrder):
+        levels = self.levels[order.side]
+        level = levels.get(order.rate)
+
+        if level is None:
+            level = levels[order.rate] = deque()
+            insort(self.prices[order.side], order.rate)
+
+        # an order that comes back (failed move) takes its previous place
+        if level and level[-1].seq > order.seq:
+            level.insert(next(i for i, o in enumerate(level) if o.seq > order.seq), order)
+        else:
+            level.append(order)
+
+    def remove(self, order: RestingOrder):
+        level = self.levels[order.side][order.rate]
+        level.remove(order)
+        if not level:
+            self.dropLevel(order.side, order.rate)
+
+    def dropLevel(self, side: str, rate: float):
+        del self.levels[side][rate]
+        prices = self.prices[side]
+        del prices[bisect_left(prices, rate)]
+
+    @staticmethod
+    def crosses(side: str, rate: float, price: float) -> bool:
+        """
+        :return: whether an order of side with limit rate may be matched with a resting one at price
+        """
+        return price <= rate if side == BUY else price >= rate
+
+    def liquidity(self, side: str, rate: float, amount: float) -> float:
+        """
+        :return: how much (but not more than amount) an order of side with limit rate would get immediately
+        """
+        opposite = SELL if side == BUY else BUY
+        prices = self.prices[opposite] if side == BUY else reversed(self.prices[opposite])
+
+        available = 0.0
+        for price in prices:
+            if not self.crosses(side, rate, price) or available >= amount:
+                break
+            available += sum(o.amount for o in self.levels[opposite][price])
+
+        return min(available, amount)
+
+    def snapshot(self, depth: int) -> dict:
+        """
+        :return: the book in the same shape as returnOrderBook of poloniex gives it
+        """
+        def side(s, prices):
+            return [['%.8f' % price, sum(o.amount for o in self.levels[s][price])] for price in prices[:depth]]
+
+        return {'asks': side(SELL, self.prices[SELL]), 'bids': side(BUY, self.prices[BUY][::-1]), 'isFrozen': '0'}
+
+
+class MatchingEngine:
+    """
+    In-process exchange: books of pairs, balances of accounts and their trades.
+    Fees are fractions (as returnFeeInfo gives them), maker pays makerFee and taker - takerFee.
+    Errors are raised as PoloniexError with the same messages as poloniex gives
+    """
+
+    def __init__(self, makerFee: float, takerFee: float):
+        self.makerFee, self.takerFee = makerFee, takerFee
+        self.books = {}
+        self.orders = {}
+        self.balances = {}
+        # own trades of every account: (currencyPair, moment of fill, trade as returnTradeHistory gives it)
+        self.trades = {}
+        self.orderNumbers = itertools.count(1)
+        self.tradeIds = itertools.count(1)
+        self.seqs = itertools.count()
+        self.lock = threading.Lock()
+
+    def book(self, pair: str) -> OrderBook:
+        book = self.books.get(pair)
+        if book is None:
+            book = self.books[pair] = OrderBook()
+        return book
+
+    def deposit(self, account: str, currency: str, amount: float):
+        with self.lock:
+            balances = self.balances.setdefault(account, {})
+            balances[currency] = balances.get(currency, 0.0) + amount
+
+    def seed(self, pair: str, orderBook: dict):
+        """
+        Places liquidity of the market
+        :param orderBook: as returnOrderBook of poloniex gives it: 'asks' and 'bids' as lists of [rate, amount]
+        """
+        with self.lock:
+            for side, levels in ((SELL, orderBook.get('asks', [])), (BUY, orderBook.get('bids', []))):
+                for rate, amount in levels:
+                    self.rest(MARKET, side, pair, float(rate), float(amount))
+
+    def clear(self, pair: str, account: str = MARKET):
+        """
+        Cancels all the orders of account in the book of pair
+        """
+        with self.lock:
+            for order in [o for o in self.orders.values() if o.pair == pair and o.account == account]:
+                self.release(order)
+
+    def submit(self, account: str, side: str, pair: str, rate: float, amount: float, orderType=None) -> dict:
+        """
+        Places a limit order: matches it with the opposite side as far as it crosses and rests what is left
+        :param orderType: None, fillOrKill, immediateOrCancel or postOnly
+        :return: response as buy or sell of poloniex gives it
+        """
+        with self.lock:
+            return self.place(account, side, pair, float(rate), float(amount), orderType)
+
+    def cancel(self, account: str, orderNumber) -> dict:
+        with self.lock:
+            order = self.ownOrder(account, orderNumber)
+            self.release(order)
+            return {'success': 1, 'amount': '%.8f' % order.amount,
+                    'message': 'Order #%s canceled.' % order.orderNumber}
+
+    def move(self, account: str, orderNumber, rate: float, amount: float = None, orderType=None) -> dict:
+        """
+        Cancels an order and places a new one of the same side atomically: if the new one fails, the old one stays
+        """
+        with self.lock:
+            order = self.ownOrder(account, orderNumber)
+            self.release(order)
+
+            try:
+                placed = self.place(account, order.side, order.pair, float(rate),
+                                    order.amount if amount is None else float(amount), orderType)
+            except PoloniexError:
+                self.reserve(order, order.amount)
+                self.orders[order.orderNumber] = order
+                self.book(order.pair).add(order)
+                raise
+
+            return {'success': 1, 'orderNumber': placed['orderNumber'],
+                    'resultingTrades': {order.pair: placed['resultingTrades']}}
+
+    def ownOrder(self, account: str, orderNumber) -> RestingOrder:
+        order = self.orders.get(str(orderNumber))
+        if order is None or order.account != account:
+            raise PoloniexError('Invalid order number, or you are not the person who placed the order.')
+        return order
+
+    def place(self, account, side, pair, rate, amount, orderType) -> dict:
+        if rate <= 0 or amount <= 0:
+            raise PoloniexError('Invalid rate or amount.')
+        if account != MARKET and rate * amount < MIN_TOTAL:
+            raise PoloniexError('Total must be at least %s.' % MIN_TOTAL)
+
+        book = self.book(pair)
+        immediate = book.liquidity(side, rate, amount)
+
+        if orderType == POST_ONLY and immediate > 0:
+            raise PoloniexError('Unable to place post-only order at this price.')
+        if orderType == FILL_OR_KILL and immediate < amount - EPSILON:
+            raise PoloniexError('Unable to fill order completely.')
+
+        orderNumber = str(next(self.orderNumbers))
+        taker = RestingOrder(orderNumber, account, side, pair, rate, amount, next(self.seqs))
+        self.reserve(taker, amount)
+
+        resultingTrades = self.match(book, taker)
+
+        response = {'orderNumber': orderNumber, 'resultingTrades': resultingTrades}
+
+        if taker.amount > EPSILON:
+            if orderType in (IMMEDIATE_OR_CANCEL, FILL_OR_KILL):
+                response['amountUnfilled'] = '%.8f' % taker.amount
+                self.unreserve(taker, taker.amount)
+            else:
+                self.orders[orderNumber] = taker
+                book.add(taker)
+
+        return response
+
+    def rest(self, account, side, pair, rate, amount) -> RestingOrder:
+        """
+        Places an order straight into the book without matching (liquidity of the market)
+        """
+        order = RestingOrder(str(next(self.orderNumbers)), account, side, pair, rate, amount, next(self.seqs))
+        self.orders[order.orderNumber] = order
+        self.book(pair).add(order)
+        return order
+
+    def match(self, book: OrderBook, taker: RestingOrder) -> list:
+        """
+        Takes the best levels of the opposite side one by one, within a level - the oldest orders first
+        :return: trades of taker as resultingTrades of poloniex
+        """
+        opposite = SELL if taker.side == BUY else BUY
+        resultingTrades = []
+
+        while taker.amount > EPSILON:
+            price = book.best(opposite)
+            if price is None or not book.crosses(taker.side, taker.rate, price):
+                break
+
+            level = book.levels[opposite][price]
+            maker = level[0]
+            amount = min(taker.amount, maker.amount)
+
+            tradeId = next(self.tradeIds)
+            now = time.perf_counter()
+            date = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+
+            self.settle(maker, amount, price, self.makerFee, tradeId, now, date)
+            trade = self.settle(taker, amount, price, self.takerFee, tradeId, now, date)
+            resultingTrades.append({'amount': trade['amount'], 'date': date, 'rate': trade['rate'],
+                                    'total': trade['total'], 'tradeID': trade['tradeID'], 'type': trade['type']})
+
+            maker.amount -= amount
+            taker.amount -= amount
+
+            if maker.amount <= EPSILON:
+                level.popleft()
+                del self.orders[maker.orderNumber]
+                if not level:
+                    book.dropLevel(opposite, price)
+
+        return resultingTrades
+
+    def settle(self, order: RestingOrder, amount, price, fee, tradeId, now, date) -> dict:
+        """
+        Pays for a fill of order from what was reserved for it and records the trade
+        """
+        if order.account != MARKET:
+            main, secondary = order.pair.split('_')
+            balances = self.balances.setdefault(order.account, {})
+
+            if order.side == BUY:
+                balances[secondary] = balances.get(secondary, 0.0) + amount * (1 - fee)
+                # reserved at the limit rate, filled at the price of the book
+                balances[main] = balances.get(main, 0.0) + amount * (order.rate - price)
+            else:
+                balances[main] = balances.get(main, 0.0) + amount * price * (1 - fee)
+
+        trade = {'globalTradeID': tradeId, 'tradeID': str(tradeId), 'date': date, 'rate': '%.8f' % price,
+                 'amount': '%.8f' % amount, 'total': '%.8f' % (amount * price), 'fee': '%.8f' % fee,
+                 'orderNumber': order.orderNumber, 'type': order.side.lower(), 'category': 'exchange'}
+        self.trades.setdefault(order.account, []).append((order.pair, now, trade))
+
+        return trade
+
+    def reserve(self, order: RestingOrder, amount: float):
+        if order.account == MARKET:
+            return
+
+        main, secondary = order.pair.split('_')
+        currency, needed = (main, amount * order.rate) if order.side == BUY else (secondary, amount)
+
+        balances = self.balances.setdefault(order.account, {})
+        if balances.get(currency, 0.0) < needed - EPSILON:
+            raise PoloniexError('Not enough %s.' % currency)
+        balances[currency] = balances.get(currency, 0.0) - needed
+
+    def unreserve(self, order: RestingOrder, amount: float):
+        if order.account == MARKET:
+            return
+
+        main, secondary = order.pair.split('_')
+        currency, reserved = (main, amount * order.rate) if order.side == BUY else (secondary, amount)
+
+        balances = self.balances.setdefault(order.account, {})
+        balances[currency] = balances.get(currency, 0.0) + reserved
+
+    def release(self, order: RestingOrder):
+        """
+        Removes resting order from the book and returns what is reserved for the rest of it
+        """
+        del self.orders[order.orderNumber]
+        self.book(order.pair).remove(order)
+        self.unreserve(order, order.amount)
+
+    def openOrders(self, account: str) -> dict:
+        """
+        :return: open orders of account as returnOpenOrders(all) of poloniex gives them
+        """
+        with self.lock:
+            orders = {pair: [] for pair in self.books}
+            for order in sorted(self.orders.values(), key=lambda o: o.seq):
+                if order.account == account:
+                    orders[order.pair].append({
+                        'orderNumber': order.orderNumber, 'type': order.side.lower(), 'rate': '%.8f' % order.rate,
+                        'amount': '%.8f' % order.amount, 'startingAmount': '%.8f' % order.startingAmount,
+                        'total': '%.8f' % (order.amount * order.rate), 'date': order.date, 'margin': 0})
+            return orders
+
+    def ticker(self, pair: str, last: float = None) -> dict:
+        """
+        :return: ticker of pair as returnTicker of poloniex gives it (last - of the last trade or the middle of book)
+        """
+        with self.lock:
+            book = self.book(pair)
+            ask, bid = book.best(SELL), book.best(BUY)
+
+            if last is None:
+                last = (ask + bid) / 2 if ask is not None and bid is not None else ask or bid or 0.0
+
+            return {'last': '%.8f' % last, 'lowestAsk': '%.8f' % (ask or 0.0), 'highestBid': '%.8f' % (bid or 0.0),
+                    'isFrozen': '0'}
+
+    def accountBalances(self, account: str) -> dict:
+        with self.lock:
+            return {currency: '%.8f' % amount for currency, amount in self.balances.get(account, {}).items()}
+
+    def accountTrades(self, account: str, pairs: list = None, after: float = None) -> list:
+        """
+        :param after: only trades filled later than that moment (perf_counter) are returned
+        :return: trades of account as (currencyPair, moment of fill, trade), the oldest first
+        """
+        with self.lock:
+            trades = self.trades.get(account, [])
+            return [t for t in trades if (pairs is None or t[0] in pairs) and (after is None or t[1] > after)]
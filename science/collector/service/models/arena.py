@@ -0,0 +1,115 @@
+import gc
+import os
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+class ArenaHandle:
+    """
+    What a worker process needs to find series in the arena: name of shared memory block and where every series is.
+    Small and cheap to pickle, unlike the series themselves
+    """
+
+    def __init__(self, name: str, index: dict):
+        """
+        :param name: name of shared memory block
+        :param index: dictionary where key = identity of series and value = (offset, length) in float64 elements
+        """
+        self.name = name
+        self.index = index
+
+
+class CandleArena:
+    """
+    Series published once into a single block of shared memory, so worker processes read them in place
+    instead of getting a pickled copy with every task.
+    The publishing process owns the block: it is removed on close() (or leaving the with block)
+    """
+
+    def __init__(self, series: dict):
+        """
+        :param series: dictionary where key = identity of series (e.g. currencyPair) and value = observations
+        """
+        series = {key: np.asarray(observations, dtype=np.float64).ravel() for key, observations in series.items()}
+        size = sum(len(s) for s in series.values())
+
+        self.shm = shared_memory.SharedMemory(create=True, size=max(size, 1) * 8)
+        self.owner = os.getpid()
+        self.index = {}
+
+        buffer = np.ndarray((size,), dtype=np.float64, buffer=self.shm.buf)
+        offset = 0
+        for key, s in series.items():
+            buffer[offset:offset + len(s)] = s
+            self.index[key] = (offset, len(s))
+            offset += len(s)
+        del buffer
+
+    def handle(self) -> ArenaHandle:
+        return ArenaHandle(self.shm.name, self.index)
+
+    def close(self):
+        # forked children have a copy of this object, but the block is not theirs to remove
+        if self.shm is None or os.getpid() != self.owner:
+            return
+
+        self.shm.close()
+        self.shm.unlink()
+        self.shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __del__(self):
+        # the block outlives the process otherwise
+        if getattr(self, 'shm', None) is not None:
+            self.close()
+
+
+class AttachedArena:
+    """
+    Read-only access to series of an arena from another process
+    """
+
+    def __init__(self, handle: ArenaHandle):
+        try:
+            # block is owned by the publishing process, this one must not remove it at exit
+            self.shm = shared_memory.SharedMemory(name=handle.name, track=False)
+        except TypeError:
+            self.shm = shared_memory.SharedMemory(name=handle.name)
+        self.index = handle.index
+
+    def __getitem__(self, key) -> np.ndarray:
+        """
+        :return: series as read-only view of shared memory (no copying)
+        """
+        offset, length = self.index[key]
+        series = np.ndarray((length,), dtype=np.float64, buffer=self.shm.buf, offset=offset * 8)
+        series.flags.writeable = False
+        return series
+
+    def close(self):
+        try:
+            self.shm.close()
+        except BufferError:
+            # views are still referenced (e.g. from reference cycles of fitted models) -> collect them and retry,
+            # if even that does not help, the mapping is released when the process exits
+            gc.collect()
+            try:
+                self.shm.close()
+            except BufferError:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def attach(handle: ArenaHandle) -> AttachedArena:
+    return AttachedArena(handle)
@@ -1,28 +1,83 @@
 import numpy as np
 from statsmodels.tsa.statespace.sarimax import SARIMAX
 
+from science.collector.core.utils import FORECAST_DIRECT, FORECAST_RECURSIVE, FORECAST_ALPHA, MODEL_REFIT_EVERY
+from science.collector.service.models.deadline import fitOptions
+from science.collector.service.models.state_store import fitWithState
 
-def modifyChartData(chartData):
+
+def createModel(chartData, P, D, Q) -> SARIMAX:
+    return SARIMAX(chartData, order=(P, D, Q), enforce_stationarity=False,
+                   enforce_invertibility=False)
+
+
+def directPrediction(chartData, futureSteps: int, P, D, Q, alpha=FORECAST_ALPHA, key=None,
+                     refit_every=MODEL_REFIT_EVERY) -> list:
     """
-    Somehow modify data for learning to obtain better prediction or convenient results
-    :param chartData: list of observations
-    :return: the same list of observations, but modified
+    Fits the model once and forecasts all the steps from that single fitted state.
+    If key is passed, parameters from the previous cycles are reused (see state_store.fitWithState)
+    :return: dict of predictions and dict of confidence intervals (lower, upper), where key = step number
     """
-    modifiedData = []
+    # no copy, as long as the data is already a float64 array
+    model = createModel(np.asarray(chartData, dtype=np.float64), P, D, Q)
 
-    # strange conversion for SARIMAX model correct input
-    for o in chartData:
-        modifiedData.append(np.array([o]))
+    if key is None:
+        model_fit = model.fit(disp=0, maxiter=1000, method='nm', **fitOptions())
+    else:
+        model_fit = fitWithState(model, key, 1000, refit_every)
 
-    return modifiedData
+    forecast = model_fit.get_forecast(steps=futureSteps)
+    mean, conf_int = np.asarray(forecast.predicted_mean), np.asarray(forecast.conf_int(alpha=alpha))
 
+    prediction = {step + 1: mean[step] for step in range(futureSteps)}
+    interval = {step + 1: (conf_int[step, 0], conf_int[step, 1]) for step in range(futureSteps)}
 
-def makePrediction(data: dict, futureSteps: int, hyperparameters=None) -> dict:
+    return [prediction, interval]
+
+
+def recursivePrediction(chartData, futureSteps: int, P, D, Q) -> dict:
+    """
+    Refits the model on every step with previous prediction appended to data
+    :return: dict of predictions, where key = step number
+    """
+    prediction = {}
+
+    # observations and all the predictions to come are kept in one buffer, every step fits on a view of it
+    n = len(chartData)
+    buffer = np.empty(n + futureSteps, dtype=np.float64)
+    buffer[:n] = chartData
+
+    for step in range(futureSteps):
+        model_fit = createModel(buffer[:n + step], P, D, Q).fit(disp=0, maxiter=1000, method='nm', **fitOptions())
+
+        output = model_fit.forecast()
+        predicted_value = output[0]
+        prediction[step + 1] = predicted_value
+
+        buffer[n + step] = predicted_value
+
+    return prediction
+
+
+def stateKey(pair: str, hyperparameters: dict) -> tuple:
+    """
+    :return: identity of the fitted model of pair, under which its parameters are kept between cycles
+    """
+    hp = hyperparameters['ARIMA']
+    return (pair, 'ARIMA') + tuple(hp[k] for k in ('P', 'D', 'Q'))
+
+
+def makePrediction(data: dict, futureSteps: int, hyperparameters=None, mode=FORECAST_DIRECT,
+                   intervals: dict = None, refit_every=MODEL_REFIT_EVERY) -> dict:
     """
     Make a prediction for incoming data on futureSteps
     :param data: dictionary of data where key = currencyPair and value = list of observations
     :param futureSteps: amount of steps on that algorithm will try to predict price
     :param hyperparameters: dictionary of hyperparameters for prediction model
+    :param mode: DIRECT - all steps from a single fit, RECURSIVE - refit on every step
+    :param intervals: if passed, confidence intervals of DIRECT predictions are put there,
+        where key = currencyPair and value = dict where key = step_number value = (lower, upper)
+    :param refit_every: after how many cycles parameters of DIRECT models are re-estimated
     :return: dictionary of data where key = currencyPair and
         value = dict of predictions (equal size to futureSteps variable) where key=step_number value = prediction
     """
@@ -35,21 +90,15 @@ def makePrediction(data: dict, futureSteps: int, hyperparameters=None) -> dict:
     predictions = {}
 
     for pair, chartData in data.items():
-        prediction = {}
-
-        chartData = modifyChartData(chartData)
-
-        for step in range(futureSteps):
-            model = SARIMAX(chartData, order=(P, D, Q), enforce_stationarity=False,
-                            enforce_invertibility=False)
-            model_fit = model.fit(disp=0, maxiter=1000, method='nm')
-
-            output = model_fit.forecast()
-            predicted_value = output[0]
-            prediction[step + 1] = predicted_value
+        if mode == FORECAST_RECURSIVE:
+            predictions[pair] = recursivePrediction(chartData, futureSteps, P, D, Q)
+            continue
 
-            chartData.append(np.array([predicted_value]))
+        predictions[pair], interval = directPrediction(chartData, futureSteps, P, D, Q,
+                                                       key=stateKey(pair, hyperparameters),
+                                                       refit_every=refit_every)
 
-        predictions[pair] = prediction
+        if intervals is not None:
+            intervals[pair] = interval
 
     return predictions
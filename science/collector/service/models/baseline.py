@@ -0,0 +1,271 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from science.collector.core.utils import BACKTEST_CHUNK
+from science.collector.service.models.forecaster import Forecaster
+
+
+def stackSeries(data: dict, window: int = None) -> list:
+    """
+    Puts all the series into one matrix, so a model can be solved for all pairs at once.
+    Series of different length are cut to the shortest one (from the beginning)
+    :param data: dictionary of data where key = currencyPair and value = observations
+    :param window: how many of the latest observations to take at most
+    :return: list of pairs and matrix (pairs x observations)
+    """
+    pairs = list(data.keys())
+    length = min(len(observations) for observations in data.values())
+    if window is not None:
+        length = min(length, window)
+
+    matrix = np.empty((len(pairs), length), dtype=np.float64)
+    for i, pair in enumerate(pairs):
+        matrix[i] = np.asarray(data[pair], dtype=np.float64)[-length:]
+
+    return [pairs, matrix]
+
+
+def toPredictions(pairs: list, forecasts: np.ndarray) -> dict:
+    """
+    :param pairs: list of pairs
+    :param forecasts: matrix (pairs x steps)
+    :return: dictionary where key = currencyPair and value = dict where key = step_number value = prediction
+    """
+    return {pair: {step + 1: forecasts[i, step] for step in range(forecasts.shape[1])}
+            for i, pair in enumerate(pairs)}
+
+
+class EWMA(Forecaster):
+    """
+    Exponentially weighted moving average: level of the series is the forecast for all steps.
+    Level is a dot product of the series with exponential weights, so all pairs are one matrix-vector product
+    Hyperparameters: {'EWMA': {'alpha': 0.1}}
+    """
+    batched = True
+
+    def makePrediction(self, data: dict, futureSteps: int, hyperparameters: dict, mode: str,
+                       intervals: dict = None, refit_every: int = None) -> dict:
+        if not data:
+            return {}
+
+        alpha = (hyperparameters or {}).get('EWMA', {}).get('alpha', 0.1)
+        pairs, matrix = stackSeries(data)
+
+        # l_t = alpha * x_t + (1 - alpha) * l_t-1, l_0 = x_0  ==>  l_T = sum of w_j * x_j
+        length = matrix.shape[1]
+        weights = alpha * (1 - alpha) ** np.arange(length - 1, -1, -1, dtype=np.float64)
+        weights[0] = (1 - alpha) ** (length - 1)
+
+        level = matrix @ weights
+
+        return toPredictions(pairs, np.repeat(level[:, None], futureSteps, axis=1))
+
+    def rollingPrediction(self, history: np.ndarray, window: int, futureSteps: int, hyperparameters: dict):
+        """
+        The same levels as makePrediction gives on every window, from a single filter over the whole history:
+        with L_t = alpha * x_t + (1 - alpha) * L_t-1 (L_0 = x_0) the level of the window [s, t] is
+        L_t - (1 - alpha)^(t - s) * (L_s - x_s)
+        """
+        alpha = (hyperparameters or {}).get('EWMA', {}).get('alpha', 0.1)
+        T, P = history.shape
+        forecasts = np.full((T, P, futureSteps), np.nan)
+        if T < window:
+            return forecasts
+
+        full = np.empty((T, P))
+        full[0] = history[0]
+        for t in range(1, T):
+            full[t] = alpha * history[t] + (1 - alpha) * full[t - 1]
+
+        starts = np.arange(T - window + 1)
+        level = full[window - 1:] - (1 - alpha) ** (window - 1) * (full[starts] - history[starts])
+
+        forecasts[window - 1:] = level[:, :, None]
+        return forecasts
+
+
+class HoltWinters(Forecaster):
+    """
+    Additive Holt-Winters (level, trend and season of length s; s = 0 - without season).
+    Recursion goes over time, but every step is done for all pairs at once
+    Hyperparameters: {'HOLT_WINTERS': {'alpha': 0.5, 'beta': 0.1, 'gamma': 0.1, 's': 12, 'window': 1000}}
+    """
+    batched = True
+
+    def makePrediction(self, data: dict, futureSteps: int, hyperparameters: dict, mode: str,
+                       intervals: dict = None, refit_every: int = None) -> dict:
+        if not data:
+            return {}
+
+        hp = (hyperparameters or {}).get('HOLT_WINTERS', {})
+        alpha, beta, gamma = hp.get('alpha', 0.5), hp.get('beta', 0.1), hp.get('gamma', 0.1)
+        s, window = hp.get('s', 12), hp.get('window', 1000)
+
+        pairs, matrix = stackSeries(data, window)
+        length = matrix.shape[1]
+
+        # not enough data for two seasons -> no season at all
+        if s and length < 2 * s:
+            s = 0
+
+        if s:
+            level = matrix[:, :s].mean(axis=1)
+            trend = (matrix[:, s:2 * s].mean(axis=1) - level) / s
+            season = matrix[:, :s] - level[:, None]
+            start = s
+        else:
+            level = matrix[:, 0].copy()
+            trend = matrix[:, 1] - matrix[:, 0] if length > 1 else np.zeros(len(pairs))
+            season = np.zeros((len(pairs), 1))
+            start = 1
+
+        for t in range(start, length):
+            i = t % s if s else 0
+            previous_level = level
+            level = alpha * (matrix[:, t] - season[:, i]) + (1 - alpha) * (level + trend)
+            trend = beta * (level - previous_level) + (1 - beta) * trend
+            if s:
+                season[:, i] = gamma * (matrix[:, t] - level) + (1 - gamma) * season[:, i]
+
+        steps = np.arange(1, futureSteps + 1)
+        forecasts = level[:, None] + trend[:, None] * steps
+        if s:
+            forecasts += season[:, (length - 1 + steps) % s]
+
+        return toPredictions(pairs, forecasts)
+
+    def rollingPrediction(self, history: np.ndarray, window: int, futureSteps: int, hyperparameters: dict):
+        """
+        A single pass of the recursion over the whole history instead of a restart on every window:
+        the state is initialized once, at the beginning of history, so forecasts differ from makePrediction
+        only by the influence of initialization, that decays with every observation
+        """
+        hp = (hyperparameters or {}).get('HOLT_WINTERS', {})
+        alpha, beta, gamma, s = hp.get('alpha', 0.5), hp.get('beta', 0.1), hp.get('gamma', 0.1), hp.get('s', 12)
+
+        T, P = history.shape
+        forecasts = np.full((T, P, futureSteps), np.nan)
+        if T < max(window, 2):
+            return forecasts
+
+        if s and T < 2 * s:
+            s = 0
+
+        if s:
+            level = history[:s].mean(axis=0)
+            trend = (history[s:2 * s].mean(axis=0) - level) / s
+            season = (history[:s] - level).T.copy()
+            start = s
+        else:
+            level = history[0].copy()
+            trend = history[1] - history[0]
+            season = np.zeros((P, 1))
+            start = 1
+
+        steps = np.arange(1, futureSteps + 1)
+        for t in range(start, T):
+            i = t % s if s else 0
+            previous_level = level
+            level = alpha * (history[t] - season[:, i]) + (1 - alpha) * (level + trend)
+            trend = beta * (level - previous_level) + (1 - beta) * trend
+            if s:
+                season[:, i] = gamma * (history[t] - level) + (1 - gamma) * season[:, i]
+
+            if t >= window - 1:
+                forecasts[t] = level[:, None] + trend[:, None] * steps
+                if s:
+                    forecasts[t] += season[:, (t + steps) % s]
+
+        return forecasts
+
+
+class AutoRegression(Forecaster):
+    """
+    AR(p) estimated with least squares for all pairs at once: normal equations of every pair are stacked
+    into one (pairs x p+1 x p+1) system and solved with a single batched solve
+    Hyperparameters: {'AR': {'p': 3, 'window': 1000}}
+    """
+    batched = True
+
+    # regularization relative to the scale of normal equations, keeps flat series solvable
+    RIDGE = 1e-8
+
+    def makePrediction(self, data: dict, futureSteps: int, hyperparameters: dict, mode: str,
+                       intervals: dict = None, refit_every: int = None) -> dict:
+        if not data:
+            return {}
+
+        hp = (hyperparameters or {}).get('AR', {})
+        p, window = hp.get('p', 3), hp.get('window', 1000)
+
+        pairs, matrix = stackSeries(data, window)
+
+        # prices of different pairs differ by orders of magnitude -> solve in units of the last price
+        scale = matrix[:, -1:].copy()
+        scale[scale == 0] = 1.0
+        matrix = matrix / scale
+
+        lags = sliding_window_view(matrix, p, axis=1)[:, :-1]
+        target = matrix[:, p:]
+        design = np.concatenate([np.ones(lags.shape[:2] + (1,)), lags], axis=2)
+
+        normal = np.einsum('nti,ntj->nij', design, design)
+        normal += self.RIDGE * np.trace(normal, axis1=1, axis2=2)[:, None, None] * np.eye(p + 1)
+        coefficients = np.linalg.solve(normal, np.einsum('nti,nt->ni', design, target)[..., None])[..., 0]
+
+        history = matrix[:, -p:].copy()
+        forecasts = np.empty((len(pairs), futureSteps))
+        for step in range(futureSteps):
+            forecasts[:, step] = coefficients[:, 0] + np.einsum('ni,ni->n', coefficients[:, 1:], history)
+            history = np.concatenate([history[:, 1:], forecasts[:, step:step + 1]], axis=1)
+
+        return toPredictions(pairs, forecasts * scale)
+
+    def rollingPrediction(self, history: np.ndarray, window: int, futureSteps: int, hyperparameters: dict):
+        """
+        Normal equations of every window are differences of cumulative sums of products of lags,
+        so all the dates are solved at once (chunk by chunk, to bound memory). The series is standardized once
+        instead of being scaled by the last price of every window: least squares with intercept do not depend
+        on it, so forecasts are the same as makePrediction gives up to the tiny regularization
+        """
+        hp = (hyperparameters or {}).get('AR', {})
+        p = hp.get('p', 3)
+        width = min(window, hp.get('window', 1000))
+        # amount of equations in a window
+        n = width - p
+
+        T, P = history.shape
+        forecasts = np.full((T, P, futureSteps), np.nan)
+        if T < window or n < 1:
+            return forecasts
+
+        mean = history.mean(axis=0)
+        deviation = history.std(axis=0)
+        deviation[deviation == 0] = 1.0
+        series = (history - mean) / deviation
+
+        # row r: equation of observation r + p: [1, x_r, ..., x_r+p-1, x_r+p] (design and target)
+        rows = np.concatenate([np.ones((T - p, P, 1)), sliding_window_view(series, p + 1, axis=0)], axis=2)
+        # the latest p observations at every date
+        latest = sliding_window_view(series, p, axis=0)
+
+        for a in range(window - 1, T, BACKTEST_CHUNK):
+            b = min(a + BACKTEST_CHUNK, T)
+
+            # equations of windows those end at dates a..b-1: rows from a - p - n + 1 to b - p - 1
+            first = a - p - n + 1
+            products = np.einsum('rni,rnj->rnij', rows[first:b - p], rows[first:b - p])
+            sums = np.concatenate([np.zeros((1,) + products.shape[1:]), np.cumsum(products, axis=0)])
+            equations = sums[n:] - sums[:-n]
+
+            normal, rhs = equations[..., :p + 1, :p + 1], equations[..., :p + 1, p + 1]
+            normal = normal + self.RIDGE * np.trace(normal, axis1=-2, axis2=-1)[..., None, None] * np.eye(p + 1)
+            coefficients = np.linalg.solve(normal, rhs[..., None])[..., 0]
+
+            recent = latest[a - p + 1:b - p + 1].copy()
+            for step in range(futureSteps):
+                forecast = coefficients[..., 0] + np.einsum('kni,kni->kn', coefficients[..., 1:], recent)
+                forecasts[a:b, :, step] = forecast * deviation + mean
+                recent = np.concatenate([recent[..., 1:], forecast[..., None]], axis=-1)
+
+        return forecasts
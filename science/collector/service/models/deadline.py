@@ -0,0 +1,57 @@
+import threading
+import time
+from contextlib import contextmanager
+
+_local = threading.local()
+
+
+class DeadlineExceeded(Exception):
+    """ Fitting did not finish within the time it was given """
+    pass
+
+
+@contextmanager
+def fitDeadline(seconds):
+    """
+    Every fit started inside is aborted as soon as the time is over
+    :param seconds: time for everything inside, None - unlimited
+    """
+    previous = getattr(_local, 'deadline', None)
+    _local.deadline = None if seconds is None else time.monotonic() + seconds
+    try:
+        yield
+    finally:
+        _local.deadline = previous
+
+
+@contextmanager
+def lastGoodOnly():
+    """
+    Inside, models are not optimized at all: only the parameters of the last good fit are reused
+    """
+    previous = getattr(_local, 'last_good_only', False)
+    _local.last_good_only = True
+    try:
+        yield
+    finally:
+        _local.last_good_only = previous
+
+
+def isLastGoodOnly() -> bool:
+    return getattr(_local, 'last_good_only', False)
+
+
+def _checkDeadline(*args):
+    deadline = getattr(_local, 'deadline', None)
+    if deadline is not None and time.monotonic() > deadline:
+        raise DeadlineExceeded('Fitting took longer than allowed')
+
+
+def fitOptions() -> dict:
+    """
+    :return: extra arguments for fit() of statsmodels, those abort optimization when deadline is over
+    """
+    if isLastGoodOnly():
+        raise DeadlineExceeded('Optimization is not allowed, only the last good fit can be used')
+    _checkDeadline()
+    return {'callback': _checkDeadline} if getattr(_local, 'deadline', None) is not None else {}
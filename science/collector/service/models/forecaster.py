@@ -0,0 +1,82 @@
+# key of hyperparameters with overrides for single pairs, e.g. {'PAIRS': {'BTC_ETH': {'SARIMA': {...}}}}
+PAIRS = 'PAIRS'
+
+
+def pairHyperparameters(pair: str, hyperparameters: dict) -> dict:
+    """
+    :return: hyperparameters of pair: common ones with overrides of that pair on top
+    """
+    if not hyperparameters or PAIRS not in hyperparameters:
+        return hyperparameters
+
+    common = {k: v for k, v in hyperparameters.items() if k != PAIRS}
+    return {**common, **hyperparameters[PAIRS].get(pair, {})}
+
+
+class Forecaster:
+    """
+    Common interface of all prediction algorithms
+    """
+    # batched forecasters solve all the pairs at once in milliseconds, so they are neither cached nor parallelized
+    batched: bool = False
+
+    def makePrediction(self, data: dict, futureSteps: int, hyperparameters: dict, mode: str,
+                       intervals: dict = None, refit_every: int = None) -> dict:
+        """
+        Make a prediction for incoming data on futureSteps
+        :param data: dictionary of data where key = currencyPair and value = observations
+        :param futureSteps: amount of steps on that algorithm will try to predict price
+        :param hyperparameters: dictionary of hyperparameters for all prediction models
+        :param mode: DIRECT - all steps from a single fit, RECURSIVE - refit on every step
+        :param intervals: if passed, confidence intervals are put there (if forecaster is able to give them)
+        :param refit_every: after how many cycles parameters are re-estimated (if forecaster keeps them)
+        :return: dictionary of data where key = currencyPair and
+            value = dict of predictions where key=step_number value = prediction
+        """
+        raise NotImplementedError
+
+    def stateKey(self, pair: str, hyperparameters: dict):
+        """
+        :return: identity of the fitted model of pair, under which its parameters are kept between cycles
+            (None if forecaster keeps nothing)
+        """
+        return None
+
+    def rollingPrediction(self, history, window: int, futureSteps: int, hyperparameters: dict):
+        """
+        Predictions as makePrediction would give them at every date of history on the window of data before it,
+        computed over the whole history at once
+        :param history: observations, matrix (dates x pairs)
+        :param window: amount of observations every prediction is made on
+        :param futureSteps: amount of steps in future
+        :param hyperparameters: dictionary of hyperparameters for all prediction models
+        :return: predictions, shape (dates x pairs x steps), NaN where there is not enough history yet,
+            None if forecaster can not make them in one pass
+        """
+        return None
+
+
+class ModuleForecaster(Forecaster):
+    """
+    Adapts a module with makePrediction and stateKey functions (sarima, arima) to the interface
+    """
+
+    def __init__(self, module):
+        self.module = module
+
+    def makePrediction(self, data: dict, futureSteps: int, hyperparameters: dict, mode: str,
+                       intervals: dict = None, refit_every: int = None) -> dict:
+        if hyperparameters and PAIRS in hyperparameters:
+            predictions = {}
+            for pair, chartData in data.items():
+                predictions.update(self.makePrediction({pair: chartData}, futureSteps,
+                                                       pairHyperparameters(pair, hyperparameters), mode,
+                                                       intervals, refit_every))
+            return predictions
+
+        if refit_every is None:
+            return self.module.makePrediction(data, futureSteps, hyperparameters, mode, intervals)
+        return self.module.makePrediction(data, futureSteps, hyperparameters, mode, intervals, refit_every)
+
+    def stateKey(self, pair: str, hyperparameters: dict):
+        return self.module.stateKey(pair, pairHyperparameters(pair, hyperparameters))
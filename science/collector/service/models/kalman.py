@@ -0,0 +1,210 @@
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+import numpy as np
+
+from science.collector.core.utils import KALMAN_STEPS, KALMAN_HISTORY, KALMAN_REESTIMATE_SECONDS
+
+# two-sided 95% quantile of normal distribution
+Z_95 = 1.959964
+
+
+class PairState:
+    """
+    Local linear trend model of a single series:
+        price = level + noise(r), level' = level + slope + noise(q_level), slope' = slope + noise(q_slope)
+    State is only (level, slope) and its 2x2 covariance, so a new candle costs a handful of float operations
+    """
+
+    def __init__(self, history: int):
+        self.level, self.slope = 0.0, 0.0
+        self.p00, self.p01, self.p11 = 0.0, 0.0, 0.0
+        self.r, self.q_level, self.q_slope = 0.0, 0.0, 0.0
+        self.lastDate = None
+        self.history = deque(maxlen=history)
+        self.forecast = None
+        self.intervals = None
+
+    def initialize(self, values: np.ndarray):
+        """
+        Starts the filter from the data itself, noise variances are guessed from the variance of differences
+        """
+        diff_variance = float(np.var(np.diff(values))) if len(values) > 2 else 0.0
+        scale = diff_variance if diff_variance > 0 else max(float(values[-1]) ** 2 * 1e-8, 1e-20)
+
+        self.r, self.q_level, self.q_slope = scale / 2, scale / 2, scale * 1e-4
+        self.level, self.slope = float(values[0]), 0.0
+        self.p00, self.p01, self.p11 = scale * 1e3, 0.0, scale
+
+    def step(self, value: float):
+        # predict
+        level, slope = self.level + self.slope, self.slope
+        p00 = self.p00 + 2 * self.p01 + self.p11 + self.q_level
+        p01 = self.p01 + self.p11
+        p11 = self.p11 + self.q_slope
+
+        # update
+        f = p00 + self.r
+        innovation = value - level
+        k0, k1 = p00 / f, p01 / f
+
+        self.level, self.slope = level + k0 * innovation, slope + k1 * innovation
+        self.p00, self.p01, self.p11 = p00 - k0 * p00, p01 - k0 * p01, p11 - k1 * p01
+
+    def precompute(self, steps: int):
+        """
+        Forecast for all the steps from the current state, ready to be taken at any moment
+        """
+        h = np.arange(1, steps + 1, dtype=np.float64)
+        mean = self.level + h * self.slope
+        variance = (self.p00 + 2 * h * self.p01 + h * h * self.p11 + h * self.q_level
+                    + self.q_slope * h * (h - 1) * (2 * h - 1) / 6 + self.r)
+        half_width = Z_95 * np.sqrt(np.maximum(variance, 0.0))
+
+        self.forecast = {int(i) + 1: mean[i] for i in range(steps)}
+        self.intervals = {int(i) + 1: (mean[i] - half_width[i], mean[i] + half_width[i]) for i in range(steps)}
+
+
+class StreamingForecaster:
+    """
+    Online forecasting engine: holds state of every pair, updates it with every new candle
+    and has a multi-step forecast ready. Noise variances are re-estimated in background.
+    Candles come from the cycles of this process (see Cycle.getAllDataForParams): the collector runs in a process
+    of its own, so between cycles the state does not move, every cycle applies the candles it loaded before
+    taking forecasts
+    """
+
+    def __init__(self, steps=KALMAN_STEPS, history=KALMAN_HISTORY, reestimate_every=KALMAN_REESTIMATE_SECONDS):
+        """
+        :param steps: for how many steps forecasts are kept ready
+        :param history: how many latest observations of every pair are kept for re-estimation
+        :param reestimate_every: how often (in seconds) noise variances are re-estimated
+        """
+        self.steps = steps
+        self.history = history
+        self.reestimate_every = reestimate_every
+        self.states = {}
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def update(self, key, dates, values):
+        """
+        Applies observations those are newer than the last applied one
+        :param key: identity of series, e.g. (pair, period, learn_on)
+        :param dates: dates of observations in ascending order
+        :param values: observations
+        """
+        with self.lock:
+            state = self.states.get(key)
+
+            if state is None:
+                if len(values) == 0:
+                    return
+                dates, values = dates[-self.history:], np.asarray(values, dtype=np.float64)[-self.history:]
+                state = self.states[key] = PairState(self.history)
+                state.initialize(values)
+
+            for date, value in zip(dates, values):
+                if state.lastDate is not None and date <= state.lastDate:
+                    continue
+                value = float(value)
+                state.step(value)
+                state.history.append(value)
+                state.lastDate = date
+
+            state.precompute(self.steps)
+
+        self.start()
+
+    def provisional(self, key, value: float) -> dict:
+        """
+        Forecast as if the current (still forming) candle closed at value, e.g. the last price from ticker.
+        State itself is not changed
+        :return: dict where key = step number value = prediction, None if series is unknown
+        """
+        with self.lock:
+            state = self.states.get(key)
+            if state is None:
+                return None
+
+            copy = PairState(1)
+            copy.__dict__.update({k: v for k, v in state.__dict__.items() if k != 'history'})
+
+        copy.step(float(value))
+        copy.precompute(self.steps)
+        return copy.forecast
+
+    def forecast(self, key, steps: int = None) -> list:
+        """
+        :return: precomputed predictions and confidence intervals, where key = step number (None if series is unknown)
+        """
+        with self.lock:
+            state = self.states.get(key)
+            if state is None or state.forecast is None:
+                return [None, None]
+
+            if steps is not None and steps > self.steps:
+                state.precompute(steps)
+
+            steps = steps or self.steps
+            return [{s: state.forecast[s] for s in range(1, steps + 1)},
+                    {s: state.intervals[s] for s in range(1, steps + 1)}]
+
+    def reestimate(self, key):
+        """
+        Estimates noise variances of series by maximum likelihood on its history and replays the history
+        """
+        from statsmodels.tsa.statespace.structural import UnobservedComponents
+
+        with self.lock:
+            state = self.states.get(key)
+            if state is None or len(state.history) < 50:
+                return
+            history = np.array(state.history, dtype=np.float64)
+
+        # the expensive part is done without the lock, updates keep coming meanwhile
+        results = UnobservedComponents(history, level='local linear trend').fit(disp=0)
+        r, q_level, q_slope = [float(p) for p in results.params[:3]]
+
+        with self.lock:
+            fresh = PairState(self.history)
+            fresh.initialize(history)
+            fresh.r, fresh.q_level, fresh.q_slope = r, q_level, q_slope
+
+            # everything that came during estimation is in the history as well
+            current = self.states[key]
+            for value in current.history:
+                fresh.step(value)
+                fresh.history.append(value)
+            fresh.lastDate = current.lastDate
+            fresh.precompute(self.steps)
+
+            self.states[key] = fresh
+
+    def start(self):
+        if self.thread is not None or self.reestimate_every is None:
+            return
+
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._reestimateForever, daemon=True)
+                self.thread.start()
+
+    def _reestimateForever(self):
+        while True:
+            time.sleep(self.reestimate_every)
+
+            with self.lock:
+                keys = list(self.states.keys())
+
+            for key in keys:
+                try:
+                    self.reestimate(key)
+                except Exception as e:
+                    print(datetime.now(), 'Re-estimation of', key, 'failed:', e)
+
+
+# Shared by all cycles of the process
+streamingForecaster = StreamingForecaster()
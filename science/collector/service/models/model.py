@@ -1,6 +1,18 @@
+import time
 from datetime import datetime
 
-from science.collector.service.models import sarima
+from science.collector.core.utils import FORECAST_DIRECT, MODEL_REFIT_EVERY, MODEL_WORKERS, \
+    MODEL_TASK_TIMEOUT_SECONDS, MODEL_TIME_BUDGET_SECONDS, MODEL_FALLBACK
+from science.collector.service.models.deadline import fitDeadline, lastGoodOnly
+from science.collector.service.models.forecaster import Forecaster
+from science.collector.service.models.parallel import predictInParallel
+from science.collector.service.models.prediction_cache import predictionCache
+from science.collector.service.models.registry import getForecaster, SHORTLIST
+from science.collector.service.models.state_store import stateStore
+
+# sources of predictions besides the name of forecaster
+CACHE = 'CACHE'
+LAST_GOOD = 'LAST_GOOD'
 
 
 class Model:
@@ -8,32 +20,212 @@ class Model:
     futureSteps: int
     hyperparameters: dict
     algorithm: str
+    mode: str
+    intervals: dict
+    errors: dict
+    sources: dict
 
-    def __init__(self, data: dict, futureSteps: int, hyperparameters: dict, algorithm: str):
+    def __init__(self, data: dict, futureSteps: int, hyperparameters: dict, algorithm: str, mode=FORECAST_DIRECT,
+                 refit_every=MODEL_REFIT_EVERY, workers=MODEL_WORKERS, timeout=MODEL_TASK_TIMEOUT_SECONDS,
+                 time_budget=MODEL_TIME_BUDGET_SECONDS, fallback=MODEL_FALLBACK):
         """
         :param data: data based on that predictions will be made
         :param futureSteps: amount of steps in future that will be predicted
         :param hyperparameters: dictionary of hyperparameters for prediction model
-        :param algorithm: what algorithm to use for prediction
+        :param algorithm: what algorithm to use for prediction (name of forecaster in registry or SHORTLIST)
+        :param mode: DIRECT - all steps from a single fit, RECURSIVE - refit on every step
+        :param refit_every: after how many cycles parameters are re-estimated
+        :param workers: amount of processes pairs are fitted in (0 - sequentially in the calling thread)
+        :param timeout: how long (in seconds) fitting of a single pair in a worker process may take
+        :param time_budget: how long (in seconds) fitting of all the pairs may take, None - unlimited
+        :param fallback: forecaster for pairs those did not fit in time and have no last good parameters
         """
         self.data = data
         self.futureSteps = futureSteps
         self.hyperparameters = hyperparameters
         self.algorithm = algorithm
+        self.mode = mode
+        self.refit_every = refit_every
+        self.workers = workers
+        self.timeout = timeout
+        self.time_budget = time_budget
+        self.fallback = fallback
+        self.deadline = None
+        # confidence intervals of predictions (only for DIRECT mode)
+        self.intervals = {}
+        # pairs those failed or did not fit in time
+        self.errors = {}
+        # where prediction of every pair came from: CACHE, LAST_GOOD or name of forecaster
+        self.sources = {}
 
     def predict(self) -> dict:
         """
         Choose an algorithm and make a prediction for given data
         """
-        predictions = None
-
         print(datetime.now(), 'Prediction algorithm started...')
+        self.deadline = None if self.time_budget is None else time.monotonic() + self.time_budget
 
-        if self.algorithm == "SARIMA":
-            predictions = sarima.makePrediction(self.data, self.futureSteps, self.hyperparameters)
-        if self.algorithm == "ARIMA":
-            predictions = sarima.makePrediction(self.data, self.futureSteps, self.hyperparameters)
+        if self.algorithm == SHORTLIST:
+            predictions = self.predictShortlisted()
+        else:
+            predictions = self.predictWith(self.algorithm, self.data)
 
         print(datetime.now(), 'Prediction algorithm finished')
 
+        # fitted parameters will be reused by the next cycles
+        stateStore.save()
+
+        return predictions
+
+    def predictShortlisted(self) -> dict:
+        """
+        Screens all the pairs with a cheap forecaster and refits only the most promising ones with an expensive one.
+        Hyperparameters: {'SHORTLIST': {'screen': 'AR', 'final': 'SARIMA', 'size': 10}}
+        :return: predictions of the final forecaster for shortlisted pairs and of the screening one for the rest
+        """
+        settings = (self.hyperparameters or {}).get(SHORTLIST, {})
+        size = settings.get('size', 10)
+
+        predictions = self.predictWith(settings.get('screen', 'AR'), self.data)
+
+        # the biggest expected relative move over the horizon, to either side
+        def expectedMove(pair):
+            last = float(self.data[pair][-1])
+            return max(abs(p - last) for p in predictions[pair].values()) / last if last else 0.0
+
+        shortlisted = sorted(predictions.keys(), key=expectedMove, reverse=True)[:size]
+
+        predictions.update(self.predictWith(settings.get('final', 'SARIMA'),
+                                            {pair: self.data[pair] for pair in shortlisted}))
+        return predictions
+
+    def predictWith(self, algorithm: str, data: dict) -> dict:
+        forecaster = getForecaster(algorithm)
+
+        if forecaster.batched:
+            self.sources.update({pair: algorithm for pair in data})
+            return forecaster.makePrediction(data, self.futureSteps, self.hyperparameters, self.mode,
+                                             self.intervals, self.refit_every)
+
+        return self.predictWithCache(algorithm, forecaster, data)
+
+    def predictWithCache(self, algorithm: str, forecaster: Forecaster, data: dict) -> dict:
+        """
+        Takes results of pairs those were already fitted on exactly the same data from cache,
+        fits only the rest and puts them into cache
+        :param algorithm: name of forecaster
+        :param forecaster: forecaster itself
+        :param data: dictionary of data where key = currencyPair and value = observations
+        :return: predictions for all the pairs
+        """
+        predictions, missing, keys = {}, {}, {}
+
+        for pair, chartData in data.items():
+            keys[pair] = predictionCache.key(chartData, pair, algorithm, self.hyperparameters,
+                                             self.futureSteps, self.mode)
+            cached = predictionCache.get(keys[pair])
+
+            if cached is None:
+                missing[pair] = chartData
+                continue
+
+            predictions[pair], interval = cached
+            self.sources[pair] = CACHE
+            if interval is not None:
+                self.intervals[pair] = interval
+
+        if self.workers:
+            fitted, intervals, errors = predictInParallel(algorithm, missing, self.futureSteps,
+                                                          self.hyperparameters, self.mode, self.refit_every,
+                                                          self.workers, self.taskTimeout(len(missing)))
+        else:
+            fitted, intervals, errors = self.predictSequentially(forecaster, missing)
+
+        for pair, prediction in fitted.items():
+            predictionCache.put(keys[pair], prediction, intervals.get(pair))
+            self.sources[pair] = algorithm
+
+        predictions.update(fitted)
+        self.intervals.update(intervals)
+
+        # results of fallback are not cached: the next cycle should try to fit these pairs properly
+        if errors:
+            self.errors.update(errors)
+            predictions.update(self.predictFallback(forecaster, {pair: missing[pair] for pair in errors}))
+
+        predictionCache.evict()
+        print(datetime.now(), 'Prediction cache:', predictionCache.metrics())
+
+        return predictions
+
+    def remainingTime(self):
+        """
+        :return: seconds left of the time budget, None - unlimited
+        """
+        return None if self.deadline is None else max(self.deadline - time.monotonic(), 0.0)
+
+    def taskTimeout(self, pairs: int):
+        """
+        :param pairs: amount of pairs still to be fitted
+        :return: how long fitting of a single pair in a worker process may take within the time budget
+        """
+        remaining = self.remainingTime()
+        if remaining is None or not pairs:
+            return self.timeout
+
+        share = remaining * min(self.workers, pairs) / pairs
+        return share if self.timeout is None else min(self.timeout, share)
+
+    def predictSequentially(self, forecaster: Forecaster, data: dict) -> list:
+        """
+        Fits pairs one by one in the calling thread, each pair gets an equal share of the remaining time budget
+        :return: predictions, confidence intervals and errors where key = currencyPair of pairs those failed
+        """
+        predictions, intervals, errors = {}, {}, {}
+
+        for i, (pair, chartData) in enumerate(data.items()):
+            remaining = self.remainingTime()
+
+            try:
+                with fitDeadline(None if remaining is None else remaining / (len(data) - i)):
+                    predictions.update(forecaster.makePrediction({pair: chartData}, self.futureSteps,
+                                                                 self.hyperparameters, self.mode, intervals,
+                                                                 self.refit_every))
+            except Exception as e:
+                errors[pair] = str(e)
+
+        if errors:
+            print(datetime.now(), 'Prediction failed for pairs:', errors)
+
+        return [predictions, intervals, errors]
+
+    def predictFallback(self, forecaster: Forecaster, data: dict) -> dict:
+        """
+        Predicts pairs those did not fit: with the last good parameters of the same model if there are any
+        (no optimization at all), otherwise with the fallback forecaster
+        :return: predictions for pairs those could be predicted anyhow
+        """
+        predictions, rest = {}, {}
+
+        for pair, chartData in data.items():
+            try:
+                with lastGoodOnly():
+                    predictions.update(forecaster.makePrediction({pair: chartData}, self.futureSteps,
+                                                                 self.hyperparameters, self.mode, self.intervals,
+                                                                 self.refit_every))
+                self.sources[pair] = LAST_GOOD
+            except Exception:
+                rest[pair] = chartData
+
+        if rest and self.fallback is not None:
+            try:
+                predictions.update(getForecaster(self.fallback).makePrediction(rest, self.futureSteps,
+                                                                               self.hyperparameters, self.mode,
+                                                                               self.intervals, self.refit_every))
+                self.sources.update({pair: self.fallback for pair in rest})
+            except Exception as e:
+                print(datetime.now(), 'Fallback prediction failed:', e)
+
+        print(datetime.now(), 'Fallback predictions:', {pair: self.sources.get(pair) for pair in data})
+
         return predictions
@@ -0,0 +1,95 @@
+import signal
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from science.collector.core.utils import MODEL_TASK_TIMEOUT_SECONDS
+from science.collector.service.models.arena import ArenaHandle, CandleArena, attach
+from science.collector.service.models.deadline import fitDeadline
+from science.collector.service.models.registry import getForecaster
+from science.collector.service.models.state_store import stateStore
+
+
+def _raiseTimeout(signum, frame):
+    raise TimeoutError('Fitting took longer than allowed')
+
+
+def _predictPair(algorithm: str, arena: ArenaHandle, pair: str, futureSteps: int, hyperparameters: dict, mode: str,
+                 refit_every: int, state, timeout) -> list:
+    """
+    Runs in worker process: attaches to the series in shared memory and makes prediction for a single pair
+    :return: prediction, confidence intervals and fitted state of the pair
+    """
+    forecaster = getForecaster(algorithm)
+    key = forecaster.stateKey(pair, hyperparameters)
+
+    if state is not None:
+        stateStore.put(key, state)
+
+    with attach(arena) as series:
+        # worker executes tasks in its main thread, so alarm interrupts exactly this task
+        if timeout is not None and hasattr(signal, 'SIGALRM'):
+            signal.signal(signal.SIGALRM, _raiseTimeout)
+            signal.setitimer(signal.ITIMER_REAL, timeout)
+
+        try:
+            intervals = {}
+            # optimizer gives up by itself a bit earlier, alarm is only a hard stop for the rest
+            with fitDeadline(None if timeout is None else timeout * 0.9):
+                predictions = forecaster.makePrediction({pair: series[pair]}, futureSteps, hyperparameters, mode,
+                                                        intervals, refit_every)
+        finally:
+            if timeout is not None and hasattr(signal, 'SIGALRM'):
+                signal.setitimer(signal.ITIMER_REAL, 0)
+
+    return [predictions[pair], intervals.get(pair), None if key is None else stateStore.get(key)]
+
+
+def _stateOf(forecaster, pair: str, hyperparameters: dict):
+    key = forecaster.stateKey(pair, hyperparameters)
+    return None if key is None else stateStore.get(key)
+
+
+def predictInParallel(algorithm: str, data: dict, futureSteps: int, hyperparameters: dict, mode: str,
+                      refit_every: int, workers: int, timeout=MODEL_TASK_TIMEOUT_SECONDS) -> list:
+    """
+    Distributes fitting of pairs across a pool of processes.
+    All the series are put once into a single block of shared memory, workers read them from there
+    :param algorithm: name of forecaster in registry
+    :param data: dictionary of data where key = currencyPair and value = observations
+    :param futureSteps: amount of steps in future that will be predicted
+    :param hyperparameters: dictionary of hyperparameters for prediction model
+    :param mode: DIRECT - all steps from a single fit, RECURSIVE - refit on every step
+    :param refit_every: after how many cycles parameters are re-estimated
+    :param workers: amount of processes
+    :param timeout: how long (in seconds) fitting of a single pair may take, None - unlimited
+    :return: predictions and confidence intervals in the same shape as makePrediction gives them,
+        and errors where key = currencyPair of pairs those failed or timed out
+    """
+    predictions, intervals, errors = {}, {}, {}
+    if not data:
+        return [predictions, intervals, errors]
+
+    forecaster = getForecaster(algorithm)
+
+    with CandleArena(data) as arena, ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {pair: executor.submit(_predictPair, algorithm, arena.handle(), pair, futureSteps, hyperparameters,
+                                         mode, refit_every, _stateOf(forecaster, pair, hyperparameters), timeout)
+                   for pair in data.keys()}
+
+        for pair, future in futures.items():
+            try:
+                prediction, interval, state = future.result()
+            except Exception as e:
+                errors[pair] = str(e)
+                continue
+
+            predictions[pair] = prediction
+            if interval is not None:
+                intervals[pair] = interval
+            if state is not None:
+                stateStore.put(forecaster.stateKey(pair, hyperparameters), state)
+
+    if errors:
+        print(datetime.now(), 'Prediction failed for pairs:', errors)
+
+    return [predictions, intervals, errors]
@@ -0,0 +1,162 @@
+import hashlib
+import json
+import os
+import stat
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+from science.collector.core.utils import MODEL_CACHE_DIR, MODEL_CACHE_MAX_AGE_SECONDS, MODEL_CACHE_MAX_ENTRIES
+
+
+class PredictionCache:
+    """
+    On-disk cache of results of fitted models.
+    Key is a hash of everything the result depends on: the series itself, algorithm and its hyperparameters
+    """
+
+    def __init__(self, directory=MODEL_CACHE_DIR, max_age=MODEL_CACHE_MAX_AGE_SECONDS,
+                 max_entries=MODEL_CACHE_MAX_ENTRIES):
+        """
+        :param directory: where results are kept, None - cache is disabled.
+            It is created private (mode 0700), a directory that is accessible by other users is not used
+        :param max_age: how long (in seconds) a result stays valid
+        :param max_entries: how many results are kept at most, the least recently used ones are evicted first
+        """
+        self.directory = directory
+        self.max_age = max_age
+        self.max_entries = max_entries
+        self.hits, self.misses, self.evictions = 0, 0, 0
+        self.lock = threading.Lock()
+
+        if self.directory is not None:
+            os.makedirs(self.directory, mode=0o700, exist_ok=True)
+            if not self.isPrivate():
+                print(datetime.now(), 'Prediction cache is disabled: directory', self.directory,
+                      'must be owned by the user of the process and not be accessible by others')
+                self.directory = None
+
+    @staticmethod
+    def key(series, pair: str, algorithm: str, hyperparameters: dict, futureSteps: int, mode: str) -> str:
+        digest = hashlib.sha256(np.ascontiguousarray(series, dtype=np.float64).tobytes())
+        digest.update(json.dumps([pair, algorithm, hyperparameters, futureSteps, mode], sort_keys=True,
+                                 default=str).encode('utf-8'))
+        return digest.hexdigest()
+
+    def isPrivate(self) -> bool:
+        """
+        :return: whether nobody but the user of the process can put files into the directory
+        """
+        try:
+            info = os.lstat(self.directory)
+        except OSError:
+            return False
+
+        return stat.S_ISDIR(info.st_mode) and info.st_uid == os.getuid() and not info.st_mode & 0o077
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key + '.json')
+
+    @staticmethod
+    def encode(prediction: dict, interval: dict) -> dict:
+        return {'prediction': [[int(step), float(value)] for step, value in prediction.items()],
+                'interval': None if interval is None else
+                [[int(step), float(low), float(high)] for step, (low, high) in interval.items()]}
+
+    @staticmethod
+    def decode(entry: dict) -> list:
+        prediction = {int(step): float(value) for step, value in entry['prediction']}
+        interval = None if entry['interval'] is None else \
+            {int(step): (float(low), float(high)) for step, low, high in entry['interval']}
+        return [prediction, interval]
+
+    def get(self, key: str):
+        """
+        :return: cached prediction and its confidence interval (None if there is no interval)
+            or None if there is no valid result
+        """
+        if self.directory is None or not self.isPrivate():
+            return None
+
+        path = self.path(key)
+        try:
+            # modification time is when the result was written, it is never touched afterwards
+            written = os.path.getmtime(path)
+            if time.time() - written > self.max_age:
+                raise FileNotFoundError(path)
+
+            with open(path) as f:
+                value = self.decode(json.load(f))
+
+            # mark as recently used: only access time changes, so reads do not extend validity
+            os.utime(path, (time.time(), written))
+        except (OSError, ValueError, KeyError, TypeError):
+            with self.lock:
+                self.misses += 1
+            return None
+
+        with self.lock:
+            self.hits += 1
+        return value
+
+    def put(self, key: str, prediction: dict, interval: dict = None):
+        """
+        :param prediction: dict where key = step number
+        :param interval: confidence intervals (lower, upper), where key = step number
+        """
+        if self.directory is None:
+            return
+
+        # written under temporary name, so a concurrent reader never sees half of the file
+        path = self.path(key)
+        temporary = path + '.' + str(os.getpid()) + '.' + str(threading.get_ident())
+        with open(temporary, 'w') as f:
+            json.dump(self.encode(prediction, interval), f)
+        os.replace(temporary, path)
+
+    def evict(self) -> int:
+        """
+        Removes expired results and the least recently used ones above max_entries
+        :return: amount of removed results
+        """
+        if self.directory is None:
+            return 0
+
+        now = time.time()
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+                entries.append((stat.st_atime, stat.st_mtime, path))
+            except OSError:
+                continue
+
+        # the most recently used first, validity is counted from when the result was written
+        entries.sort(reverse=True)
+        expired = [path for i, (atime, mtime, path) in enumerate(entries)
+                   if now - mtime > self.max_age or i >= self.max_entries]
+
+        for path in expired:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+        with self.lock:
+            self.evictions += len(expired)
+        return len(expired)
+
+    def metrics(self) -> dict:
+        with self.lock:
+            requests = self.hits + self.misses
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'hit_rate': round(self.hits / requests, 3) if requests else 0.0}
+
+
+# Shared by all cycles of the process
+predictionCache = PredictionCache()
@@ -0,0 +1,24 @@
+from science.collector.service.models import sarima, arima
+from science.collector.service.models.baseline import EWMA, HoltWinters, AutoRegression
+from science.collector.service.models.forecaster import Forecaster, ModuleForecaster
+
+# Screens all pairs with a cheap forecaster and refits only the most promising ones with an expensive one
+SHORTLIST = 'SHORTLIST'
+
+FORECASTERS = {
+    'SARIMA': ModuleForecaster(sarima),
+    'ARIMA': ModuleForecaster(arima),
+    'EWMA': EWMA(),
+    'HOLT_WINTERS': HoltWinters(),
+    'AR': AutoRegression(),
+}
+
+
+def register(name: str, forecaster: Forecaster):
+    FORECASTERS[name] = forecaster
+
+
+def getForecaster(name: str) -> Forecaster:
+    if name not in FORECASTERS:
+        raise ValueError('Unknown algorithm: %s. Known are: %s' % (name, ', '.join(FORECASTERS.keys())))
+    return FORECASTERS[name]
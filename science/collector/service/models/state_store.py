@@ -0,0 +1,112 @@
+import os
+import pickle
+import threading
+import time
+from datetime import datetime
+
+from science.collector.core.utils import MODEL_REFIT_EVERY, MODEL_DRIFT_TOLERANCE, MODEL_STATE_FILE
+from science.collector.service.models.deadline import fitOptions, isLastGoodOnly, DeadlineExceeded
+
+
+class FittedState:
+    params: list
+    fit_quality: float
+    fitted_at: float
+    cycles: int
+
+    def __init__(self, params, fit_quality: float):
+        """
+        DTO for fitted parameters of a model
+        :param params: estimated parameters
+        :param fit_quality: log-likelihood per observation on the data parameters were estimated on
+        """
+        self.params = params
+        self.fit_quality = fit_quality
+        self.fitted_at = time.time()
+        # how many cycles passed since parameters were estimated
+        self.cycles = 0
+
+
+class StateStore:
+    """
+    Keeps fitted parameters of models between cycles (and optionally between restarts, in a file)
+    """
+
+    def __init__(self, path=MODEL_STATE_FILE):
+        """
+        :param path: file where states are persisted, None - keep them only in memory
+        """
+        self.path = path
+        self.states = {}
+        self.lock = threading.Lock()
+        self.load()
+
+    def get(self, key) -> FittedState:
+        with self.lock:
+            return self.states.get(key)
+
+    def put(self, key, state: FittedState):
+        with self.lock:
+            self.states[key] = state
+
+    def load(self):
+        if self.path is None or not os.path.exists(self.path):
+            return
+
+        try:
+            with open(self.path, 'rb') as f:
+                self.states = pickle.load(f)
+        except Exception as e:
+            print(datetime.now(), 'Fitted states are not loaded:', e)
+
+    def save(self):
+        if self.path is None:
+            return
+
+        with self.lock:
+            with open(self.path, 'wb') as f:
+                pickle.dump(self.states, f)
+
+
+def fitWithState(model, key, maxiter: int, refit_every=MODEL_REFIT_EVERY, drift_tolerance=MODEL_DRIFT_TOLERANCE):
+    """
+    Fits the model reusing parameters from the previous cycles:
+        - parameters are fresh enough -> only the filter is run over the data at fixed parameters (no optimization)
+        - full re-estimation is due (every refit_every cycles, or fit quality drifted) -> optimization is
+            warm-started from previous parameters
+        - nothing is known about the model yet -> cold start
+    Inside deadline.lastGoodOnly() the previous parameters are reused unconditionally, and nothing is optimized
+    :param model: statsmodels state space model
+    :param key: identity of the model (pair, algorithm and hyperparameters)
+    :param maxiter: maximal amount of iterations of optimization
+    :param refit_every: after how many cycles parameters are re-estimated anyway
+    :param drift_tolerance: relative decrease of log-likelihood per observation that leads to re-estimation
+    :return: fitted results
+    """
+    state = stateStore.get(key)
+    known = state is not None and len(state.params) == len(model.start_params)
+
+    if isLastGoodOnly():
+        if not known:
+            raise DeadlineExceeded('There is no good fit to fall back to')
+        return model.filter(state.params)
+
+    if known:
+        if state.cycles < refit_every:
+            results = model.filter(state.params)
+            fit_quality = results.llf / results.nobs
+
+            if fit_quality >= state.fit_quality - drift_tolerance * abs(state.fit_quality):
+                state.cycles += 1
+                return results
+
+        results = model.fit(start_params=state.params, disp=0, maxiter=maxiter, method='nm', **fitOptions())
+    else:
+        results = model.fit(disp=0, maxiter=maxiter, method='nm', **fitOptions())
+
+    stateStore.put(key, FittedState(results.params, results.llf / results.nobs))
+    return results
+
+
+# Shared by all cycles of the process
+stateStore = StateStore()
@@ -0,0 +1,161 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from science.collector.core.utils import EXECUTION_WORKERS
+
+PLACE, MOVE, CANCEL, KEEP = 'PLACE', 'MOVE', 'CANCEL', 'KEEP'
+
+# poloniex moves orders only as these types (fillOrKill never rests in the book, so it can not be moved into)
+MOVABLE_ORDER_TYPES = [None, 'immediateOrCancel', 'postOnly']
+
+
+class OrderAction:
+    op_type: str
+    pair: str
+    rate: float
+    amount: float
+
+    def __init__(self, action, op_type, pair, rate=None, amount=None, orderNumber=None):
+        """
+        Single call to the exchange
+        :param action: PLACE, MOVE, CANCEL or KEEP (open order already is what is needed, no call)
+        :param op_type: BUY or SELL
+        :param orderNumber: open order the action is applied to (for MOVE, CANCEL and KEEP)
+        """
+        self.action = action
+        self.op_type = op_type
+        self.pair = pair
+        self.rate = rate
+        self.amount = amount
+        self.orderNumber = orderNumber
+
+    def __repr__(self):
+        return '{} {} {} rate={} amount={} order={}'.format(self.action, self.op_type, self.pair, self.rate,
+                                                            self.amount, self.orderNumber)
+
+
+def sameOrder(order: dict, rate: float, amount: float) -> bool:
+    """
+    :return: whether open order already has the rate and amount (with precision of poloniex, 8 digits)
+    """
+    return round(float(order['rate']), 8) == round(rate, 8) and round(float(order['amount']), 8) == round(amount, 8)
+
+
+def reconcile(desired: list, openOrders: dict, reopen: bool, orderType='fillOrKill') -> list:
+    """
+    Diffs desired orders against open ones and builds the minimal set of calls:
+        - without reopen every desired order is placed, open orders are not touched
+        - with reopen the first open order of the same pair and type is kept if it already is the desired one,
+          moved (cancel and place in one atomic call) otherwise, the rest of them are cancelled.
+          Orders of type that can not be moved into are cancelled and placed anew
+    :param desired: orders to have, as OrderAction with action PLACE
+    :param openOrders: open orders of account, where key = currencyPair (as returnOpenOrders(all) gives them)
+    :param reopen: whether open orders of the same pair and type must be replaced by the desired ones
+    :param orderType: type of placed orders
+    :return: actions in order they must be performed in within a pair
+    """
+    actions = []
+    taken = set()
+
+    for order in desired:
+        if not reopen:
+            actions.append(order)
+            continue
+
+        existing = [o for o in openOrders.get(order.pair) or []
+                    if o['type'].upper() == order.op_type and o['orderNumber'] not in taken]
+        taken.update(o['orderNumber'] for o in existing)
+
+        if existing and orderType in MOVABLE_ORDER_TYPES:
+            first, existing = existing[0], existing[1:]
+            if sameOrder(first, order.rate, order.amount):
+                actions.append(OrderAction(KEEP, order.op_type, order.pair, order.rate, order.amount,
+                                           first['orderNumber']))
+            else:
+                actions.append(OrderAction(MOVE, order.op_type, order.pair, order.rate, order.amount,
+                                           first['orderNumber']))
+
+            actions.extend(OrderAction(CANCEL, o['type'].upper(), order.pair, orderNumber=o['orderNumber'])
+                           for o in existing)
+        else:
+            # cancels go first: they free the balance the new order may need
+            actions.extend(OrderAction(CANCEL, o['type'].upper(), order.pair, orderNumber=o['orderNumber'])
+                           for o in existing)
+            actions.append(order)
+
+    return actions
+
+
+class OrderExecutor:
+
+    def __init__(self, poloniex_service, workers=EXECUTION_WORKERS, orderType='fillOrKill'):
+        """
+        Performs actions concurrently: pairs are independent of each other, actions of a pair go one by one.
+        Rate limit of private calls is kept by the coach all the calls of poloniex_service share
+        :param poloniex_service: wrapper for interaction with poloniex api
+        :param workers: how many calls may be in flight at once
+        :param orderType: type of placed and moved orders
+        """
+        self.poloniex_service = poloniex_service
+        self.workers = workers
+        self.orderType = orderType
+
+    def execute(self, actions: list) -> list:
+        """
+        :param actions: result of reconcile
+        :return: for every action: what was done, response (or error) of exchange and latency of the call in seconds
+        """
+        byPair = {}
+        for action in actions:
+            byPair.setdefault(action.pair, []).append(action)
+
+        started = time.perf_counter()
+
+        if self.workers > 1 and len(byPair) > 1:
+            with ThreadPoolExecutor(max_workers=min(self.workers, len(byPair))) as executor:
+                chains = list(executor.map(self.performChain, byPair.values()))
+        else:
+            chains = [self.performChain(chain) for chain in byPair.values()]
+
+        results = [result for chain in chains for result in chain]
+
+        latencies = sorted(r['latency'] for r in results if r['action'] != KEEP)
+        if latencies:
+            print(datetime.now(), 'Executed', len(latencies), 'calls in', round(time.perf_counter() - started, 3),
+                  'seconds, latency median:', round(latencies[len(latencies) // 2], 3), 'max:',
+                  round(latencies[-1], 3))
+
+        return results
+
+    def performChain(self, chain: list) -> list:
+        return [self.perform(action) for action in chain]
+
+    def perform(self, action: OrderAction) -> dict:
+        """
+        Makes a single call, failure of a call does not stop the others
+        """
+        result = {'action': action.action, 'type': action.op_type, 'pair': action.pair, 'rate': action.rate,
+                  'amount': action.amount, 'orderNumber': action.orderNumber}
+
+        started = time.perf_counter()
+        try:
+            if action.action == PLACE:
+                result['response'] = self.poloniex_service.operate(operation=action.op_type,
+                                                                   currencyPair=action.pair, rate=action.rate,
+                                                                   amount=action.amount, orderType=self.orderType)
+            elif action.action == MOVE:
+                result['response'] = self.poloniex_service.moveOrder(action.orderNumber, rate=action.rate,
+                                                                     amount=action.amount,
+                                                                     orderType=self.orderType)
+            elif action.action == CANCEL:
+                result['response'] = self.poloniex_service.cancelOrder(action.orderNumber)
+        except Exception as e:
+            result['error'] = str(e)
+
+        result['latency'] = time.perf_counter() - started
+
+        print('Performed', action, 'in', round(result['latency'], 3), 'seconds:',
+              result.get('response', result.get('error')))
+
+        return result
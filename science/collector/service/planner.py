@@ -0,0 +1,98 @@
+import numpy as np
+
+BUY, SELL = 0, 1
+OP_TYPES = ['BUY', 'SELL']
+
+# compact plan: one row per operation, pair is an index into the list of pairs
+PLAN_DTYPE = np.dtype([('op', np.int8), ('pair', np.int32), ('step', np.int32), ('delta', np.float64),
+                       ('price', np.float64)])
+
+
+def minusFee(delta, fee: float):
+    """
+    Subtracts fee from delta
+    :param fee: fraction, as returnFeeInfo gives it
+    """
+    return delta * (1 - fee)
+
+
+def believedSteps(steps: int, risk: int) -> int:
+    """
+    :return: in how many of the closest steps the plan believes as if they must happen
+    """
+    if steps <= 1 or risk <= 0:
+        return 1
+
+    return max(1, round(steps * min(risk, 100) / 100))
+
+
+def planSignals(predictions: np.ndarray, current: np.ndarray, bought_for: np.ndarray, makerFee: float,
+                takerFee: float, THRESHOLD: float) -> list:
+    """
+    Profitability of every possible operation in one pass, the same rules as Trader applies:
+        - BUY at step, if predicted price is above the current one by more than threshold
+        - otherwise SELL at step, if something is held and predicted price is above the price it was bought for
+        - SELL now (only along with the first step), if current price is above the price it was bought for
+    Leading dimensions are arbitrary, e.g. (pairs, steps) for a single cycle or (time, pairs, steps) for a backtest
+    :param predictions: predicted prices, shape (..., pairs, steps)
+    :param current: current prices, shape (..., pairs)
+    :param bought_for: average price of what is held, NaN where nothing is held, shape (..., pairs)
+    :param makerFee: fee of SELL operations (fraction, as returnFeeInfo gives it)
+    :param takerFee: fee of BUY operations (fraction, as returnFeeInfo gives it)
+    :param THRESHOLD: the baseline of profitability to perform any operation
+    :return: profits of BUY and SELL at every step and of SELL now, -inf where operation is not appropriate
+    """
+    threshold = max(THRESHOLD, 0.0)
+
+    buy = minusFee(predictions - current[..., None], takerFee)
+    buying = buy > threshold
+
+    # comparisons with NaN are False, so nothing is sold where nothing is held
+    with np.errstate(invalid='ignore'):
+        sell = minusFee(predictions - bought_for[..., None], makerFee)
+        sell_now = minusFee(current - bought_for, makerFee)
+        selling = ~buying & (sell > threshold)
+        selling_now = ~buying[..., 0] & (sell_now > threshold)
+
+    return [np.where(buying, buy, -np.inf), np.where(selling, sell, -np.inf),
+            np.where(selling_now, sell_now, -np.inf)]
+
+
+def selectPlan(predictions: np.ndarray, current: np.ndarray, signals: list, top_n: int, believe_in: int) -> np.ndarray:
+    """
+    Picks top_n of the most profitable operations among the believed steps
+    (the same as top_n of every step first and then top_n across the steps)
+    :param predictions: predicted prices, shape (pairs, steps)
+    :param current: current prices, shape (pairs,)
+    :param signals: result of planSignals for a single cycle
+    :param top_n: how many of most profitable operations to apply
+    :param believe_in: in how many of the closest steps to look for operations
+    :return: plan as array of PLAN_DTYPE sorted by delta, the most profitable first
+    """
+    buy, sell, sell_now = signals
+    pairs = predictions.shape[0]
+
+    deltas = np.concatenate([buy[:, :believe_in].ravel(), sell[:, :believe_in].ravel(), sell_now])
+
+    if top_n < len(deltas):
+        chosen = np.argpartition(-deltas, top_n - 1)[:top_n]
+    else:
+        chosen = np.arange(len(deltas))
+
+    chosen = chosen[np.isfinite(deltas[chosen])]
+    chosen = chosen[np.argsort(-deltas[chosen], kind='stable')]
+
+    plan = np.empty(len(chosen), dtype=PLAN_DTYPE)
+    stepped = pairs * believe_in
+
+    # positions in deltas -> (operation, pair, step)
+    is_now = chosen >= 2 * stepped
+    within = np.where(is_now, 0, chosen % stepped)
+
+    plan['op'] = np.where(chosen < stepped, BUY, SELL)
+    plan['pair'] = np.where(is_now, chosen - 2 * stepped, within // believe_in)
+    plan['step'] = np.where(is_now, 1, within % believe_in + 1)
+    plan['delta'] = deltas[chosen]
+    plan['price'] = np.where(is_now, current[plan['pair']], predictions[plan['pair'], plan['step'] - 1])
+
+    return plan
@@ -29,6 +29,7 @@ from hashlib import sha512 as _sha512
 from hmac import new as _new
 from itertools import chain as _chain
 from json import loads as _loads
+from queue import Queue
 from time import time, sleep
 from urllib.parse import urlencode as _urlencode
 
@@ -96,14 +97,34 @@ class RetryException(PoloniexError):
     pass
 
 
+class ApiKey(object):
+    """ Api key with its own nonce """
+
+    def __init__(self, key, secret):
+        self.key, self.secret = key, secret
+        self._nonce = int("{:.6f}".format(time()).replace('.', ''))
+
+    @property
+    def nonce(self):
+        """ Increments the nonce"""
+        self._nonce += 42
+        return self._nonce
+
+    def catchUp(self, nonce):
+        """ Moves the nonce past the one poloniex saw last """
+        self._nonce = max(self._nonce, nonce)
+
+
 class Poloniex(object):
     """The Poloniex Object!"""
 
     def __init__(self, key=False, secret=False,
-                 timeout=None, coach=True, jsonNums=False, proxies=None):
+                 timeout=None, coach=True, jsonNums=False, proxies=None, keys=None):
         """
         key = str api key supplied by Poloniex
         secret = str secret hash supplied by Poloniex
+        keys = list of additional (key, secret) of the same account, private
+            calls with different keys are sent in parallel
         timeout = int time in sec to wait for an api response
             (otherwise 'requests.exceptions.Timeout' is raised)
         coach = bool to indicate if the api coach should be used
@@ -118,8 +139,12 @@ class Poloniex(object):
         self.proxies = proxies
         if self.coach is True:
             self.coach = Coach()
-        # create nonce
-        self._nonce = int("{:.6f}".format(time()).replace('.', ''))
+        # private calls may be made from several threads at once: a call holds
+        # its key from taking the nonce until the response, so nonces of a key
+        # reach poloniex in order and calls with different keys go in parallel
+        self._keys = Queue()
+        for apiKey in [(key, secret)] + list(keys or []):
+            self._keys.put(ApiKey(*apiKey))
         # json number datatypes
         self.jsonNums = jsonNums
         # grab keys, set timeout
@@ -178,34 +203,39 @@ class Poloniex(object):
         if cmdType == 'Private':
             payload['url'] = 'https://poloniex.com/tradingApi'
 
-            # wait for coach
-            if self.coach:
-                self.coach.wait()
+            # take a key that is not in use
+            apiKey = self._keys.get()
+            try:
+                # wait for coach
+                if self.coach:
+                    self.coach.wait()
 
-            # set nonce
-            args['nonce'] = self.nonce
+                # set nonce
+                args['nonce'] = apiKey.nonce
 
-            # add args to payload
-            payload['data'] = args
+                # add args to payload
+                payload['data'] = args
 
-            # sign data with our Secret
-            sign = _new(
-                self.secret.encode('utf-8'),
-                _urlencode(args).encode('utf-8'),
-                _sha512)
+                # sign data with our Secret
+                sign = _new(
+                    apiKey.secret.encode('utf-8'),
+                    _urlencode(args).encode('utf-8'),
+                    _sha512)
 
-            # add headers to payload
-            payload['headers'] = {'Sign': sign.hexdigest(),
-                                  'Key': self.key}
-            # add proxies if needed
-            if self.proxies:
-                payload['proxies'] = self.proxies
+                # add headers to payload
+                payload['headers'] = {'Sign': sign.hexdigest(),
+                                      'Key': apiKey.key}
+                # add proxies if needed
+                if self.proxies:
+                    payload['proxies'] = self.proxies
 
-            # send the call
-            ret = _post(**payload)
+                # send the call
+                ret = _post(**payload)
 
-            # return data
-            return self._handleReturned(ret.text)
+                # return data
+                return self._handleReturned(ret.text, apiKey)
+            finally:
+                self._keys.put(apiKey)
 
         # public?
         if cmdType == 'Public':
@@ -224,12 +254,6 @@ class Poloniex(object):
             # return data
             return self._handleReturned(ret.text)
 
-    @property
-    def nonce(self):
-        """ Increments the nonce"""
-        self._nonce += 42
-        return self._nonce
-
     def _checkCmd(self, command):
         """ Returns if the command is private of public, raises PoloniexError
         if command is not found """
@@ -244,7 +268,7 @@ class Poloniex(object):
 
         raise PoloniexError("Invalid Command!: %s" % command)
 
-    def _handleReturned(self, data):
+    def _handleReturned(self, data, apiKey=None):
         """ Handles returned data from poloniex"""
         try:
             if not self.jsonNums:
@@ -262,8 +286,8 @@ class Poloniex(object):
 
             # update nonce if we fell behind
             if "Nonce must be greater" in out['error']:
-                self._nonce = int(
-                    out['error'].split('.')[0].split()[-1])
+                if apiKey:
+                    apiKey.catchUp(int(out['error'].split('.')[0].split()[-1]))
                 # raise RequestException so we try again
                 raise RequestException('PoloniexError ' + out['error'])
 
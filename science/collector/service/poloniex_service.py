@@ -1,8 +1,13 @@
+import hashlib
 import time
 from datetime import datetime, timedelta
 
-from science.collector.core.utils import CHART_DATA_INSERT_PLAN_SQL, \
-    CURRENCIES_INSERT_PLAN_SQL, PERIODS, ALL, MAX_DATA_IN_SINGLE_QUERY, KEY, SECRET, datetimeToTimestamp
+from psycopg2.extras import execute_values
+
+from science.collector.core.utils import CHART_DATA_INSERT_PLAN_SQL, CURRENCIES_COLUMNS, CURRENCIES_UPSERT_SQL, \
+    CURRENCIES_DELETE_SQL, PERIODS, ALL, MAX_DATA_IN_SINGLE_QUERY, KEY, SECRET, datetimeToTimestamp, \
+    EXECUTION_KEYS
+from science.collector.service.ingestion_pipeline import IngestionPipeline
 from science.collector.service.poloniex import Poloniex, Coach
 
 
@@ -11,13 +16,21 @@ class PoloniexPublicService:
     cursor = None
     myCoach: Coach
     poloniexApi: Poloniex
+    chartDataApi: Poloniex
+
+    # Service is re-created on every request, so the state of the last currencies sync lives on the class
+    currenciesCache: dict = None
+    currenciesFingerprint: str = None
 
-    def __init__(self, connection, cursor):
+    def __init__(self, connection, cursor, database=None):
+        """
+        :param connection: connection to DB
+        :param cursor: cursor of that connection
+        :param database: connection string, lets background writers open connections of their own
+        """
         self.connection = connection
         self.cursor = cursor
-
-        # prepares the query for insert
-        self.cursor.execute(CURRENCIES_INSERT_PLAN_SQL)
+        self.database = database
 
         # prepares the query for insert
         self.cursor.execute(CHART_DATA_INSERT_PLAN_SQL)
@@ -25,25 +38,68 @@ class PoloniexPublicService:
         self.connection.commit()
 
         self.myCoach = Coach(timeFrame=1.0, callLimit=6)
-        self.poloniexApi = Poloniex(key=KEY, secret=SECRET, coach=self.myCoach)
+        self.poloniexApi = Poloniex(key=KEY, secret=SECRET, coach=self.myCoach, keys=EXECUTION_KEYS)
+        # numbers of chart data are parsed straight into floats, they go into numpy arrays anyway
+        # (poloniexApi keeps them as strings, as precision of amounts and rates matters for trading)
+        self.chartDataApi = Poloniex(coach=self.myCoach, jsonNums=float)
 
     def updateCurrencies(self):
+        """
+        Synchronizes poloniex.currencies with poloniex api.
+        If the fetched set is the same as on the previous sync -> DB is not touched at all,
+        otherwise only changed rows are upserted and disappeared ones are deleted
+        :return: currencies as they were returned by poloniex
+        """
         r = self.poloniexApi.returnCurrencies()
 
-        # clear the table
-        self.cursor.execute("DELETE FROM poloniex.currencies")
+        rows = {info['id']: (info['id'], symbol, info['name'],
+                             info['minConf'], info['depositAddress'], info['disabled'],
+                             info['delisted'], info['frozen'])
+                for symbol, info in r.items()}
+
+        fingerprint = self.fingerprintCurrencies(rows)
 
-        sql = "EXECUTE currencies_insert_plan (%s, %s, %s, %s, %s, %s, %s, %s)"
+        # nothing has changed since the last sync
+        if fingerprint == PoloniexPublicService.currenciesFingerprint:
+            return r
 
-        # actual insert into DB
-        for symbol, info in r.items():
-            self.cursor.execute(sql, (info['id'], symbol, info['name'],
-                                      info['minConf'], info['depositAddress'], info['disabled'],
-                                      info['delisted'], info['frozen']))
+        # first sync in this process -> compare against what is already stored
+        cached = PoloniexPublicService.currenciesCache
+        if cached is None:
+            cached = self.returnCurrenciesFromDB()
+
+        changed = [row for currency_id, row in rows.items() if cached.get(currency_id) != row]
+        removed = [currency_id for currency_id in cached if currency_id not in rows]
+
+        if changed:
+            execute_values(self.cursor, CURRENCIES_UPSERT_SQL, changed)
+
+        if removed:
+            self.cursor.execute(CURRENCIES_DELETE_SQL, (removed,))
 
         self.connection.commit()
+
+        PoloniexPublicService.currenciesCache = rows
+        PoloniexPublicService.currenciesFingerprint = fingerprint
+
+        print(datetime.now(), 'Currencies synchronized. Changed:', len(changed), 'Removed:', len(removed))
         return r
 
+    def returnCurrenciesFromDB(self) -> dict:
+        """
+        :return: rows of poloniex.currencies as tuples, where key = id of currency
+        """
+        self.cursor.execute("SELECT " + ', '.join(CURRENCIES_COLUMNS) + " FROM poloniex.currencies")
+        return {row['id']: tuple(row) for row in self.cursor.fetchall()}
+
+    @staticmethod
+    def fingerprintCurrencies(rows: dict) -> str:
+        """
+        :param rows: rows of currencies, where key = id of currency
+        :return: digest that changes whenever any of the rows changes
+        """
+        return hashlib.sha1(repr(sorted(rows.items())).encode('utf-8')).hexdigest()
+
     def returnMarketTradeHistory(self, currencyPair: str, start: int, end: int) -> object:
         return self.poloniexApi.returnTradeHistory(currencyPair, start, end)
 
@@ -58,18 +114,59 @@ class PoloniexPublicService:
         :param end: end of period
         :param period: periodicity of data
         """
-        sql = "DELETE FROM poloniex.chart_data WHERE"
-        sql += " period = " + period if period is not None else ""
-        sql += " date >= " + start if start is not None else ""
-        sql += " date <= " + end if end is not None else ""
-        sql += " main_currency = \'" + mainCurrency + "\'" if mainCurrency is not None else ""
-        sql += " secondary_currency = \'" + secondaryCurrency + "\'" if secondaryCurrency is not None else ""
+        where, args = self.chartDataConditions(mainCurrency, secondaryCurrency, start, end, period)
+
+        self.cursor.execute("DELETE FROM poloniex.chart_data" + where, args)
+        self.connection.commit()
+
+    @staticmethod
+    def chartDataConditions(mainCurrency, secondaryCurrency, start, end, period) -> list:
+        """
+        Builds WHERE clause for chart data selections. Not mentioned parameters do not restrict anything
+        :return: WHERE clause (empty if nothing is mentioned) and arguments for it
+        """
+        conditions, args = [], []
+
+        for condition, value in (("period = %s", period),
+                                 ("date >= %s", start),
+                                 ("date <= %s", end),
+                                 ("main_currency = %s", mainCurrency),
+                                 ("secondary_currency = %s", secondaryCurrency)):
+            if value is not None:
+                conditions.append(condition)
+                args.append(value)
 
-        sql = sql[:-5] if sql.endswith("WHERE") else sql
+        where = " WHERE " + " AND ".join(conditions) if conditions else ""
+        return [where, args]
 
-        self.cursor.execute(sql)
+    def ensureChartDataPartitions(self, start, end) -> int:
+        """
+        Creates monthly partitions of chart data those cover the range, if they are not created yet
+        :param start: start of range
+        :param end: end of range
+        :return: amount of created partitions
+        """
+        self.cursor.execute("SELECT poloniex.create_chart_data_partitions(%s, %s)", (int(start), int(end)))
+        created = self.cursor.fetchone()[0]
+        self.connection.commit()
+        return created
+
+    def dropExpiredChartData(self, retention: int, now=None) -> int:
+        """
+        Retention: drops whole monthly partitions of chart data those are older than retention
+        :param retention: how long (in seconds) the data must be kept
+        :param now: moment relative to which the age is calculated (current time by default)
+        :return: amount of dropped partitions
+        """
+        now = int(time.time()) if now is None else now
+
+        self.cursor.execute("SELECT poloniex.drop_chart_data_partitions(%s)", (now - retention,))
+        dropped = self.cursor.fetchone()[0]
         self.connection.commit()
 
+        print(datetime.now(), 'Dropped', dropped, 'partitions of chart data')
+        return dropped
+
     def loadChartData(self, mainCurrency, secondaryCurrency, start, end, period) -> int:
         """
         Loads all the elements within mentioned parameters into DB
@@ -83,23 +180,57 @@ class PoloniexPublicService:
         """
         # to have actual list of currencies
         self.updateCurrencies()
-        i = 0
 
         periods = self.specifyPeriod(period)
         mainPairs, secondaryPairs = self.specifyPairs(mainCurrency, secondaryCurrency)
 
-        for p in periods:
-            if mainPairs is None and secondaryPairs is None:
-                i += self._loadChartDataAndSaveToDb(mainCurrency, secondaryCurrency, start, end, p)
-            else:
-                for pair in mainPairs or []:
-                    m, s = pair.split('_')
-                    i += self._loadChartDataAndSaveToDb(m, s, start, end, p)
-                for pair in secondaryPairs or []:
-                    m, s = pair.split('_')
-                    i += self._loadChartDataAndSaveToDb(m, s, start, end, p)
+        self.ensureChartDataPartitions(start, end)
+
+        # loading and writing overlap: while one range is written the next ones are already being loaded
+        pipeline = self.createIngestionPipeline().start()
+        try:
+            for p in periods:
+                if mainPairs is None and secondaryPairs is None:
+                    self.submitChartData(pipeline, mainCurrency, secondaryCurrency, start, end, p)
+                else:
+                    for pair in mainPairs or []:
+                        m, s = pair.split('_')
+                        self.submitChartData(pipeline, m, s, start, end, p)
+                    for pair in secondaryPairs or []:
+                        m, s = pair.split('_')
+                        self.submitChartData(pipeline, m, s, start, end, p)
+        finally:
+            i = pipeline.close()
         return i
 
+    def createTradeLedger(self):
+        """
+        :return: local ledger of own trades of the account
+        """
+        from science.collector.service.trade_ledger import TradeLedger
+        return TradeLedger(self)
+
+    def createIngestionPipeline(self) -> IngestionPipeline:
+        return IngestionPipeline(self.poloniexApi, connection=self.connection, database=self.database)
+
+    def submitChartData(self, pipeline: IngestionPipeline, mainCurrency, secondaryCurrency, start, end, period):
+        """
+        Splits the range on affordable parts and submits them into the pipeline
+        :param pipeline: pipeline that loads and saves the data
+        :param mainCurrency: main currency of the pair
+        :param secondaryCurrency: second currency of the pair
+        :param start: start of period
+        :param end: end of period
+        :param period: periodicity of data
+        """
+        # bounds are inclusive: parts must not share the boundary candle
+        step = period * MAX_DATA_IN_SINGLE_QUERY
+        partStart = start
+        while partStart <= end:
+            partEnd = min(partStart + step - period, end)
+            pipeline.submit(mainCurrency, secondaryCurrency, partStart, partEnd, period)
+            partStart = partEnd + period
+
     def specifyPeriod(self, period) -> list:
         return PERIODS if period is None else [period]
 
@@ -158,17 +289,28 @@ class PoloniexPublicService:
         # time.sleep(PAUSE_BETWEEN_QUERIES_SECONDS)
         print(int(time.time()), ': ', mainCurrency, secondaryCurrency, start, end, period, end='\n\n')
 
-        sql = "EXECUTE chart_data_insert_plan (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)"
-
         # load the data from poloniex API
         currencyPair = mainCurrency + '_' + secondaryCurrency
-        chartData = self.self.poloniexApi.returnChartData(currencyPair=currencyPair, start=start, end=end,
-                                                          period=period)
+        chartData = self.poloniexApi.returnChartData(currencyPair=currencyPair, start=start, end=end,
+                                                     period=period)
 
         if not chartData or len(chartData) < 2:
             return len([])
 
         print(len(chartData))
+        return self.saveChartDataToDb(mainCurrency, secondaryCurrency, period, chartData)
+
+    def saveChartDataToDb(self, mainCurrency, secondaryCurrency, period, chartData: list) -> int:
+        """
+        Saves already loaded observations into DB
+        :param mainCurrency: main currency of the pair
+        :param secondaryCurrency: second currency of the pair
+        :param period: periodicity of data
+        :param chartData: observations as they were returned by poloniex
+        :return: amount of elements those were saved
+        """
+        sql = "EXECUTE chart_data_insert_plan (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)"
+
         # save the data to DB
         for o in chartData:
             self.cursor.execute(sql, (mainCurrency, secondaryCurrency, period,
@@ -180,6 +322,30 @@ class PoloniexPublicService:
         self.connection.commit()
         return len(chartData)
 
+    def returnLastChartDataDates(self) -> dict:
+        """
+        :return: date of the latest stored observation, where key = (currencyPair, period)
+        """
+        self.cursor.execute("SELECT main_currency, secondary_currency, period, max(date) AS last_date "
+                            "FROM poloniex.chart_data GROUP BY main_currency, secondary_currency, period")
+
+        return {(row['main_currency'] + '_' + row['secondary_currency'], row['period']): row['last_date']
+                for row in self.cursor.fetchall()}
+
+    def getChartDataFreshness(self, now=None) -> dict:
+        """
+        Freshness lag of every stored series: how many seconds passed since the latest stored candle was closed
+        :param now: moment relative to which the lag is calculated (current time by default)
+        :return: lag in seconds, where key = currencyPair and value = dict where key = period
+        """
+        now = int(time.time()) if now is None else now
+        freshness = {}
+
+        for (pair, period), last_date in self.returnLastChartDataDates().items():
+            freshness.setdefault(pair, {})[period] = now - (last_date + period)
+
+        return freshness
+
     def getChartData(self, currencyPair, start, end, period):
         chartData = self.poloniexApi.returnChartData(currencyPair=currencyPair, start=start, end=end, period=period)
 
@@ -193,19 +359,16 @@ class PoloniexPublicService:
         sql = "SELECT "
 
         sql += ', '.join(fields) if fields is not None else "*"
-        sql += " FROM poloniex.chart_data WHERE"
+        sql += " FROM poloniex.chart_data"
 
-        sql += " period = " + str(period) + " AND" if str(period) is not None else ""
-        sql += " date >= " + str(start) + " AND" if str(start) is not None else ""
-        sql += " date <= " + str(end) + " AND" if str(end) is not None else ""
-        sql += " main_currency = '" + mainCurrency + "'" + " AND" if mainCurrency is not None else ""
-        sql += " secondary_currency = '" + secondaryCurrency + "'" + " AND" if secondaryCurrency is not None else ""
+        where, args = self.chartDataConditions(mainCurrency, secondaryCurrency, start, end, period)
+        sql += where
 
-        sql = sql[:-4] if sql.endswith(" AND") else sql
-        sql = sql[:-5] if sql.endswith("WHERE") else sql
-        sql += " LIMIT " + limit if limit is not None else ""
+        if limit is not None:
+            sql += " LIMIT %s"
+            args.append(int(limit))
 
-        self.cursor.execute(sql)
+        self.cursor.execute(sql, args)
         return self.cursor.fetchall()
 
     def saveChartDataToCSV(self, main_currency, secondary_currency, start, end, period, file_name='dataset'):
@@ -279,4 +442,14 @@ class PoloniexPublicService:
             return self.poloniexApi.sell(currencyPair=currencyPair, rate=rate, amount=amount, orderType=orderType)
 
     def cancelOrder(self, orderNumber):
-        self.poloniexApi.cancelOrder(orderNumber)
+        return self.poloniexApi.cancelOrder(orderNumber)
+
+    def moveOrder(self, orderNumber, rate, amount=None, orderType=None) -> dict:
+        """
+        Cancels an order and places a new one of the same type in a single atomic call
+        :param orderNumber: open order to move
+        :param rate: new price per unit
+        :param amount: new amount, None - the same as it is
+        :param orderType: None, immediateOrCancel or postOnly
+        """
+        return self.poloniexApi.moveOrder(orderNumber, rate, amount=amount or False, orderType=orderType or False)
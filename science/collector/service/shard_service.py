@@ -0,0 +1,239 @@
+import atexit
+import multiprocessing
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+
+from science.collector.core.utils import SHARD_POOL, SHARD_QUEUE, CYCLE_SHARD_TIMEOUT_SECONDS, \
+    CYCLE_SHARD_START_METHOD
+
+
+def splitPairs(pairs: list, shards: int) -> list:
+    """
+    :return: pairs split into at most `shards` groups of (almost) equal size
+    """
+    return [group for group in (pairs[i::shards] for i in range(shards)) if group]
+
+
+def runShard(database: str, params_dict: dict, pairs: list) -> dict:
+    """
+    Runs in worker process: loads data and makes predictions for a group of pairs.
+    Worker opens a DB connection of its own, caches of the process (windows, fitted states) stay warm between cycles
+    :param database: connection string
+    :param params_dict: parameters of the cycle
+    :param pairs: pairs of the shard
+    :return: predictions, pairs those failed and time the shard took
+    """
+    import psycopg2
+    from psycopg2.extras import DictCursor
+
+    from science.collector.core.entities import Parameters
+    from science.collector.service.cycle_service import Cycle
+    from science.collector.service.poloniex_service import PoloniexPublicService
+
+    started = time.time()
+    connection = psycopg2.connect(database)
+    try:
+        cycle = Cycle(PoloniexPublicService(connection, connection.cursor(cursor_factory=DictCursor), database))
+        predictions = cycle.predictForParams(Parameters(params_dict), pairs)
+    finally:
+        connection.close()
+
+    return {'predictions': predictions, 'errors': cycle.errors, 'seconds': time.time() - started}
+
+
+def _queueWorker(tasks, results):
+    """
+    Loop of a worker of QueueExecutor: takes tasks from its own queue until None comes
+    """
+    while True:
+        task = tasks.get()
+        if task is None:
+            return
+
+        run, shard, fn, args = task
+        try:
+            results.put((run, shard, True, fn(*args)))
+        except Exception as e:
+            results.put((run, shard, False, str(e)))
+
+
+class PoolExecutor:
+    """
+    Shards are run by a pool of processes of this host
+    """
+
+    def __init__(self, workers: int, context=None):
+        self.workers = workers
+        self.context = context or multiprocessing.get_context(CYCLE_SHARD_START_METHOD)
+        self.pool = ProcessPoolExecutor(max_workers=workers, mp_context=self.context)
+
+    def run(self, fn, tasks: list) -> list:
+        """
+        All the shards share one deadline
+        :param fn: function of a shard
+        :param tasks: arguments of every shard
+        :return: for every shard: whether it succeeded and its result (or error)
+        """
+        futures = [self.pool.submit(fn, *args) for args in tasks]
+        _, late = wait(futures, timeout=CYCLE_SHARD_TIMEOUT_SECONDS)
+
+        results, broken = [], False
+        for future in futures:
+            if future in late:
+                results.append((False, 'Shard did not respond in time'))
+                continue
+            try:
+                results.append((True, future.result()))
+            except BrokenProcessPool as e:
+                results.append((False, str(e) or type(e).__name__))
+                broken = True
+            except Exception as e:
+                results.append((False, str(e) or type(e).__name__))
+
+        if late or broken:
+            self.restart()
+
+        return results
+
+    def restart(self):
+        """
+        A running shard can not be cancelled and would keep its worker busy for the next cycles
+        (and a pool that lost a worker takes no tasks at all): workers are stopped and the pool is created anew
+        """
+        processes = list((self.pool._processes or {}).values())
+        self.pool.shutdown(wait=False, cancel_futures=True)
+        for process in processes:
+            process.terminate()
+
+        self.pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=self.context)
+
+    def shutdown(self):
+        self.pool.shutdown()
+
+
+class QueueExecutor:
+    """
+    Local stand-in of distribution over several hosts through a queue: every worker is a separate process
+    with a queue of its own, the same shard always goes to the same worker (so its caches stay warm),
+    and results come back through a common queue
+    """
+
+    def __init__(self, workers: int, context=None):
+        self.context = context or multiprocessing.get_context(CYCLE_SHARD_START_METHOD)
+        self.results = self.context.Queue()
+        self.queues = [None] * workers
+        self.processes = [None] * workers
+        for worker in range(workers):
+            self.startWorker(worker)
+        self.runs = 0
+
+    def startWorker(self, worker: int):
+        self.queues[worker] = self.context.Queue()
+        # not daemons: a worker may need processes of its own (model_workers)
+        self.processes[worker] = self.context.Process(target=_queueWorker, args=(self.queues[worker], self.results))
+        self.processes[worker].start()
+
+    def run(self, fn, tasks: list) -> list:
+        self.runs += 1
+
+        for shard, args in enumerate(tasks):
+            self.queues[shard % len(self.queues)].put((self.runs, shard, fn, args))
+
+        results = [(False, 'Shard did not respond in time')] * len(tasks)
+        deadline = time.time() + CYCLE_SHARD_TIMEOUT_SECONDS
+        pending = set(range(len(tasks)))
+
+        while pending:
+            try:
+                run, shard, succeeded, result = self.results.get(timeout=max(deadline - time.time(), 0))
+            except queue.Empty:
+                break
+
+            # late answer of a previous run
+            if run != self.runs:
+                continue
+
+            results[shard] = (succeeded, result)
+            pending.discard(shard)
+
+        # a worker still busy with a late shard would hold back its shards of the next cycles -> it is replaced
+        for worker in {shard % len(self.queues) for shard in pending}:
+            self.processes[worker].terminate()
+            self.startWorker(worker)
+
+        return results
+
+    def shutdown(self):
+        for q in self.queues:
+            q.put(None)
+        for process in self.processes:
+            process.join(timeout=5)
+
+
+class ShardCoordinator:
+    """
+    Splits pairs of a cycle into shards, loads data and makes predictions for every shard in a separate process
+    and merges the results, so the plan is made once over all the pairs
+    """
+
+    def __init__(self, workers: int, mode=SHARD_POOL):
+        """
+        :param workers: amount of worker processes (and shards)
+        :param mode: POOL - pool of processes, QUEUE - workers with queues of their own (stand-in for several hosts)
+        """
+        self.workers = workers
+        self.mode = mode
+        self.executor = QueueExecutor(workers) if mode == SHARD_QUEUE else PoolExecutor(workers)
+        # one cycle at a time, results of concurrent cycles must not be mixed
+        self.lock = threading.Lock()
+
+    def predict(self, database: str, params_dict: dict, pairs: list) -> list:
+        """
+        :param database: connection string, workers connect to DB themselves
+        :param params_dict: parameters of the cycle
+        :param pairs: all the pairs of the cycle
+        :return: merged predictions of all shards and errors where key = currencyPair
+        """
+        shards = splitPairs(pairs, self.workers)
+        started = time.time()
+
+        with self.lock:
+            results = self.executor.run(runShard, [(database, params_dict, shard) for shard in shards])
+
+        predictions, errors, seconds = {}, {}, []
+        for shard, (succeeded, result) in zip(shards, results):
+            if not succeeded:
+                errors.update({pair: result for pair in shard})
+                continue
+
+            predictions.update(result['predictions'])
+            errors.update(result['errors'])
+            seconds.append(round(result['seconds'], 3))
+
+        print(datetime.now(), 'Shards', self.mode, 'finished in', round(time.time() - started, 3),
+              'seconds, per shard:', seconds)
+
+        return [predictions, errors]
+
+    def shutdown(self):
+        self.executor.shutdown()
+
+
+coordinators = {}
+coordinatorsLock = threading.Lock()
+
+
+def getCoordinator(workers: int, mode=SHARD_POOL) -> ShardCoordinator:
+    """
+    Coordinators (and their worker processes) are kept for the lifetime of the process and reused by all cycles
+    """
+    with coordinatorsLock:
+        coordinator = coordinators.get((workers, mode))
+        if coordinator is None:
+            coordinator = coordinators[(workers, mode)] = ShardCoordinator(workers, mode)
+            atexit.register(coordinator.shutdown)
+        return coordinator
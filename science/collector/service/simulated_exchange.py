@@ -0,0 +1,258 @@
+import time
+from datetime import datetime
+
+import numpy as np
+
+from science.collector.core.utils import ALL, SIMULATION_BOOK_DEPTH, SIMULATION_SPREAD, SIMULATION_LEVEL_STEP, \
+    SIMULATION_LEVEL_TOTAL, SIMULATION_LATENCY_SECONDS, SIMULATION_VOLATILITY
+from science.collector.service.cost_basis import CostBasisIndex
+from science.collector.service.matching_engine import MatchingEngine, BUY, SELL, MARKET, IMMEDIATE_OR_CANCEL
+from science.collector.service.order_executor import KEEP
+from science.collector.service.trader import Trader
+
+PAPER = 'PAPER'
+
+# amount the market sweeps resting orders with when it moves (it is not limited by balances)
+SWEEP_AMOUNT = 1e18
+
+
+def syntheticBook(mid: float, depth=SIMULATION_BOOK_DEPTH, spread=SIMULATION_SPREAD, step=SIMULATION_LEVEL_STEP,
+                  total=SIMULATION_LEVEL_TOTAL) -> dict:
+    """
+    :param mid: price in the middle between the best bid and ask
+    :return: order book in the same shape as returnOrderBook of poloniex gives it
+    """
+    asks = [mid * (1 + spread / 2 + step * i) for i in range(depth)]
+    bids = [mid * (1 - spread / 2 - step * i) for i in range(depth)]
+
+    return {'asks': [['%.8f' % rate, total / rate] for rate in asks],
+            'bids': [['%.8f' % rate, total / rate] for rate in bids if rate > 0]}
+
+
+def recordedBooks(poloniexApi, pairs: list, depth=SIMULATION_BOOK_DEPTH) -> dict:
+    """
+    :return: current order books of pairs from poloniex, where key = currencyPair
+    """
+    books = poloniexApi.returnOrderBook(ALL, depth)
+    return {pair: books[pair] for pair in pairs if pair in books}
+
+
+def syntheticPredictions(rng, current: dict, steps: int, volatility=SIMULATION_VOLATILITY) -> dict:
+    """
+    :param rng: numpy random generator
+    :param current: current prices, where key = currencyPair
+    :return: random walks from current prices, in the same shape as the cycle gives predictions
+    """
+    predictions = {}
+    for pair, price in current.items():
+        path = price * np.exp(np.cumsum(rng.normal(0.0, volatility, steps)))
+        predictions[pair] = {step: float(path[step - 1]) for step in range(1, steps + 1)}
+    return predictions
+
+
+class SimulatedTradeLedger:
+    """
+    Stand-in of TradeLedger: own trades are taken straight from the matching engine
+    """
+
+    def __init__(self, exchange):
+        self.exchange = exchange
+
+    def sync(self) -> int:
+        return 0
+
+    def returnTradeHistory(self, pairs: list, after: int = 0) -> dict:
+        history = {}
+        for pair, _, trade in self.exchange.engine.accountTrades(self.exchange.account, pairs):
+            if trade['globalTradeID'] > after:
+                history.setdefault(pair, []).append(trade)
+
+        for trades in history.values():
+            trades.reverse()
+
+        return history
+
+
+class SimulatedExchange:
+    """
+    Stand-in of PoloniexPublicService for Trader: the same calls are served by the in-process matching engine,
+    every call takes a simulated round trip (and waits for the coach, if there is one, as private calls of poloniex do)
+    """
+
+    def __init__(self, engine: MatchingEngine, pairs: list, account=PAPER, latency=SIMULATION_LATENCY_SECONDS,
+                 coach=None):
+        """
+        :param engine: matching engine with books of the pairs
+        :param pairs: pairs those are traded
+        :param account: account the calls are made for
+        :param latency: round trip of a call in seconds
+        :param coach: rate limiter of calls, None - unlimited
+        """
+        self.engine = engine
+        self.pairs = pairs
+        self.account = account
+        self.latency = latency
+        self.coach = coach
+
+    def call(self, fn, *args, **kwargs):
+        if self.coach:
+            self.coach.wait()
+
+        # half of the round trip the request travels to the exchange, the other half the response travels back
+        time.sleep(self.latency / 2)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            time.sleep(self.latency / 2)
+
+    def returnTickerForPairs(self, pairs: list) -> dict:
+        return self.call(lambda: {pair: self.engine.ticker(pair) for pair in pairs})
+
+    def returnBalances(self) -> dict:
+        balances = {currency: '0.00000000' for pair in self.pairs for currency in pair.split('_')}
+        balances.update(self.call(self.engine.accountBalances, self.account))
+        return balances
+
+    def returnOpenOrders(self, currencyPair):
+        orders = self.call(self.engine.openOrders, self.account)
+        return orders if currencyPair == ALL else orders.get(currencyPair, [])
+
+    def returnFeeInfo(self) -> dict:
+        return {'makerFee': '%.8f' % self.engine.makerFee, 'takerFee': '%.8f' % self.engine.takerFee}
+
+    def returnOrderBook(self, currencyPair, depth=SIMULATION_BOOK_DEPTH) -> dict:
+        return self.call(lambda: self.engine.book(currencyPair).snapshot(depth))
+
+    def operate(self, operation, currencyPair, rate, amount, orderType='fillOrKill') -> dict:
+        return self.call(self.engine.submit, self.account, operation, currencyPair, rate, amount, orderType or None)
+
+    def cancelOrder(self, orderNumber):
+        return self.call(self.engine.cancel, self.account, orderNumber)
+
+    def moveOrder(self, orderNumber, rate, amount=None, orderType=None) -> dict:
+        return self.call(self.engine.move, self.account, orderNumber, rate, amount, orderType)
+
+    def createTradeLedger(self) -> SimulatedTradeLedger:
+        return SimulatedTradeLedger(self)
+
+
+class PaperTrading:
+    """
+    Runs Trader against the simulated exchange: plans on predictions, executes them and moves the market
+    in between iterations, so resting orders get filled. Measures latency and throughput of the whole path
+    """
+
+    def __init__(self, exchange: SimulatedExchange, budget: float, steps: int, top_n=3, risk=0, THRESHOLD=0.000001,
+                 current_price_from='last', reopen=False, order_type='fillOrKill', volatility=SIMULATION_VOLATILITY,
+                 seed=None):
+        """
+        :param exchange: simulated exchange, its books must be seeded
+        :param volatility: standard deviation of moves of the market (and of synthetic predictions)
+        :param seed: seed of random moves
+        Other parameters are the same as Trader takes
+        """
+        self.exchange = exchange
+        self.engine = exchange.engine
+        self.pairs = exchange.pairs
+        self.budget = budget
+        self.steps = steps
+        self.top_n = top_n
+        self.risk = risk
+        self.THRESHOLD = THRESHOLD
+        self.current_price_from = current_price_from
+        self.reopen = reopen
+        self.order_type = order_type
+        self.volatility = volatility
+        self.rng = np.random.default_rng(seed)
+
+        # cost basis of the paper account only, the one of the real account is not touched
+        self.costBasis = CostBasisIndex()
+        self.mids = {pair: float(self.engine.ticker(pair)['last']) for pair in self.pairs}
+
+    def iterate(self, predictions: dict = None) -> dict:
+        """
+        A single cycle: plan and execution
+        :param predictions: predictions of the cycle, None - synthetic ones
+        :return: when it started, how long planning and execution took and performed calls
+        """
+        started = time.perf_counter()
+
+        if predictions is None:
+            predictions = syntheticPredictions(self.rng, self.mids, self.steps, self.volatility)
+
+        trader = Trader(poloniex_service=self.exchange, budget=self.budget, steps=self.steps, pairs=self.pairs,
+                        predictions=predictions, risk=self.risk, top_n=self.top_n, THRESHOLD=self.THRESHOLD,
+                        current_price_from=self.current_price_from, reopen=self.reopen, order_type=self.order_type,
+                        cost_basis=self.costBasis)
+        plan = trader.preparePlan()
+        planned = time.perf_counter()
+
+        calls = trader.trade(plan)
+
+        return {'started': started, 'plan': planned - started, 'execution': time.perf_counter() - planned,
+                'calls': calls}
+
+    def moveMarket(self):
+        """
+        Every pair makes a random step: the market takes everything of the paper account that is priced through
+        the new middle and its own liquidity is placed anew around it
+        """
+        for pair in self.pairs:
+            mid = self.mids[pair] = self.mids[pair] * float(np.exp(self.rng.normal(0.0, self.volatility)))
+
+            self.engine.clear(pair)
+            self.engine.submit(MARKET, BUY, pair, mid, SWEEP_AMOUNT, IMMEDIATE_OR_CANCEL)
+            self.engine.submit(MARKET, SELL, pair, mid, SWEEP_AMOUNT, IMMEDIATE_OR_CANCEL)
+            self.engine.seed(pair, syntheticBook(mid))
+
+    def run(self, iterations: int, predictions: dict = None) -> dict:
+        """
+        :param iterations: amount of cycles
+        :param predictions: predictions every cycle is made on, None - synthetic ones for every cycle
+        :return: metrics of latencies (seconds) and throughput, and balances at the end
+        """
+        started = time.perf_counter()
+        placedAt, results = {}, []
+
+        for _ in range(iterations):
+            result = self.iterate(predictions)
+            results.append(result)
+
+            for call in result['calls']:
+                response = call.get('response')
+                if isinstance(response, dict) and 'orderNumber' in response:
+                    placedAt[str(response['orderNumber'])] = result['started']
+
+            self.moveMarket()
+
+        elapsed = time.perf_counter() - started
+
+        calls = [call for result in results for call in result['calls'] if call['action'] != KEEP]
+        fills = [at - placedAt[trade['orderNumber']]
+                 for _, at, trade in self.engine.accountTrades(self.exchange.account)
+                 if trade['orderNumber'] in placedAt]
+
+        metrics = {'iterations': iterations, 'seconds': round(elapsed, 3),
+                   'calls': len(calls), 'failed_calls': sum(1 for call in calls if 'error' in call),
+                   'fills': len(fills),
+                   'calls_per_second': round(len(calls) / elapsed, 3) if elapsed else None,
+                   'fills_per_second': round(len(fills) / elapsed, 3) if elapsed else None,
+                   'plan_seconds': self.describe([result['plan'] for result in results]),
+                   'execution_seconds': self.describe([result['execution'] for result in results]),
+                   'call_latency': self.describe([call['latency'] for call in calls]),
+                   'plan_to_fill': self.describe(fills)}
+
+        print(datetime.now(), 'Paper trading finished:', metrics)
+
+        return {'metrics': metrics, 'balances': self.exchange.returnBalances()}
+
+    @staticmethod
+    def describe(values: list) -> dict:
+        """
+        :return: median, 95th percentile and maximum of values
+        """
+        if not values:
+            return {'p50': None, 'p95': None, 'max': None}
+
+        p50, p95 = np.percentile(values, [50, 95])
+        return {'p50': round(float(p50), 6), 'p95': round(float(p95), 6), 'max': round(float(max(values)), 6)}
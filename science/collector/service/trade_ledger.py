@@ -0,0 +1,129 @@
+import calendar
+import hashlib
+import time
+from datetime import datetime
+
+from psycopg2.extras import execute_values
+
+from science.collector.core.utils import ALL, KEY, TRADE_LEDGER_INITIAL_START, TRADE_LEDGER_PAGE
+from science.collector.service.poloniex_service import PoloniexPublicService
+
+LEDGER_LAST_SQL = """
+SELECT max(date) AS last_date, max(global_trade_id) AS last_trade_id
+FROM poloniex.trade_ledger
+WHERE account = %s"""
+
+LEDGER_INSERT_SQL = """
+INSERT INTO poloniex.trade_ledger
+    (account, global_trade_id, trade_id, currency_pair, date, type, rate, amount, total, fee, order_number, category)
+    VALUES %s
+ON CONFLICT (account, global_trade_id) DO NOTHING"""
+
+LEDGER_SELECT_SQL = """
+SELECT global_trade_id, trade_id, currency_pair, date, type, rate, amount, total, fee, order_number, category
+FROM poloniex.trade_ledger
+WHERE account = %s AND currency_pair = ANY(%s) AND global_trade_id > %s
+ORDER BY global_trade_id"""
+
+
+def parseTradeDate(date: str) -> int:
+    """
+    :return: date of trade from poloniex ('YYYY-MM-DD HH:MM:SS', UTC) in seconds
+    """
+    return calendar.timegm(datetime.strptime(date, '%Y-%m-%d %H:%M:%S').timetuple())
+
+
+class TradeLedger:
+    poloniex_service: PoloniexPublicService
+
+    def __init__(self, poloniex_service, account: str = None):
+        """
+        Local copy of own trades of the account, that is only appended with trades newer than the last stored one
+        :param poloniex_service: wrapper for interaction with poloniex api and DB
+        :param account: identity of the account, by default derived from its api key
+        """
+        self.poloniex_service = poloniex_service
+        self.connection = poloniex_service.connection
+        self.cursor = poloniex_service.cursor
+        self.account = account or hashlib.sha256(KEY.encode()).hexdigest()[:16]
+
+    def sync(self) -> int:
+        """
+        Loads trades made since the last stored one (the whole history on the first sync).
+        Poloniex gives at most TRADE_LEDGER_PAGE trades per call (the newest ones),
+        so a range that is full is loaded further back page by page
+        :return: amount of new trades
+        """
+        self.cursor.execute(LEDGER_LAST_SQL, (self.account,))
+        last = self.cursor.fetchone()
+
+        # trades of the same second as the last stored one may have come after it
+        start = TRADE_LEDGER_INITIAL_START if last['last_date'] is None else last['last_date']
+        last_trade_id = last['last_trade_id'] or 0
+        end = int(time.time())
+
+        rows = {}
+        while True:
+            page = self.poloniex_service.poloniexApi.returnTradeHistory(ALL, start, end, TRADE_LEDGER_PAGE)
+
+            # for all pairs poloniex gives dictionary of pairs, but an empty list when there are no trades at all
+            page = list(page.items()) if isinstance(page, dict) else []
+
+            # the oldest trade of every pair, whether pairs are cut by the limit one by one or all together
+            oldest, count = {}, 0
+            for pair, trades in page:
+                count += len(trades)
+                for trade in trades:
+                    date = parseTradeDate(trade['date'])
+                    oldest[pair] = min(oldest.get(pair, date), date)
+
+                    if int(trade['globalTradeID']) > last_trade_id:
+                        rows[int(trade['globalTradeID'])] = (
+                            self.account, int(trade['globalTradeID']), int(trade['tradeID']), pair, date,
+                            trade['type'], trade['rate'], trade['amount'], trade['total'], trade['fee'],
+                            int(trade['orderNumber']), trade.get('category'))
+
+            # the page was cut by the limit -> the rest is older (trades those are loaded twice are the same rows):
+            #   - the whole page was cut: everything newer than its oldest trade is loaded already
+            #   - pairs were cut one by one: only the cut ones go on, from the newest of their cuts
+            #     (the rest of pairs are loaded completely)
+            cut = [pair for pair, trades in page if len(trades) >= TRADE_LEDGER_PAGE]
+            if count >= TRADE_LEDGER_PAGE:
+                next_end = min(oldest.values())
+            elif cut:
+                next_end = max(oldest[pair] for pair in cut)
+            else:
+                break
+
+            if next_end <= start or next_end >= end:
+                break
+            end = next_end
+
+        if rows:
+            execute_values(self.cursor, LEDGER_INSERT_SQL, list(rows.values()))
+            self.connection.commit()
+
+        print(datetime.now(), 'Trade ledger synced, new trades:', len(rows))
+
+        return len(rows)
+
+    def returnTradeHistory(self, pairs: list, after: int = 0) -> dict:
+        """
+        :param pairs: pairs those trades are needed for
+        :param after: only trades with globalTradeID greater than that are returned
+        :return: stored trades of the account, in the same shape as returnTradeHistory(all) of poloniex gives:
+            dictionary where key = currencyPair and value = list of trades, the newest first
+        """
+        self.cursor.execute(LEDGER_SELECT_SQL, (self.account, list(pairs), after))
+
+        history = {}
+        for row in self.cursor.fetchall():
+            history.setdefault(row['currency_pair'], []).append({
+                'globalTradeID': row['global_trade_id'], 'tradeID': row['trade_id'], 'date': row['date'],
+                'type': row['type'], 'rate': row['rate'], 'amount': row['amount'], 'total': row['total'],
+                'fee': row['fee'], 'orderNumber': row['order_number'], 'category': row['category']})
+
+        for trades in history.values():
+            trades.reverse()
+
+        return history
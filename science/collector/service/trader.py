@@ -1,18 +1,26 @@
+import numpy as np
+
 from science.collector.core.entities import Operation
 from science.collector.core.utils import ALL
+from science.collector.service.cost_basis import CostBasisIndex, costBasisIndex
+from science.collector.service.order_executor import OrderAction, OrderExecutor, PLACE, reconcile
+from science.collector.service.planner import PLAN_DTYPE, OP_TYPES, planSignals, selectPlan, believedSteps
 from science.collector.service.poloniex_service import PoloniexPublicService
 
 
 class Trader:
     poloniex_service: PoloniexPublicService
     budget, top_n, risk, steps, pairs, predictions, common_currency, THRESHOLD = 0.0, 0, 0, 0, [], {}, '', 0
-    ticker, balances, tradeHistory, orders, current_price, takerFee, makerFee, = {}, {}, {}, {}, '', 0.0, 0.0
+    ticker, balances, orders, current_price, takerFee, makerFee, = {}, {}, {}, '', 0.0, 0.0
 
     def __init__(self, poloniex_service, budget, steps, pairs, predictions, risk=0, top_n=3,
-                 common_currency='BTC', THRESHOLD=0.000001, current_price_from='last', reopen=False):
+                 common_currency='BTC', THRESHOLD=0.000001, current_price_from='last', reopen=False,
+                 order_type='fillOrKill', cost_basis: CostBasisIndex = None):
         """
         :param predictions: from model that makes predictions
         :param reopen: whether we must reopen all previously opened orders with new iteration if the currency coincide
+        :param order_type: type of placed orders (fillOrKill, immediateOrCancel, postOnly or None)
+        :param cost_basis: cost basis of the account, by default the one shared by all cycles of the process
         :param current_price_from: the field from ticker to rely on while calculating profitability between current price and predicted one
         :param THRESHOLD: the baseline of profitability to perform any operation
         :param common_currency: what is the common currency
@@ -25,6 +33,8 @@ class Trader:
         :param poloniex_service: wrapper for interaction with poloniex api
         """
         self.reopen = reopen
+        self.order_type = order_type
+        self.cost_basis = costBasisIndex if cost_basis is None else cost_basis
         self.poloniex_service = poloniex_service
         self.budget = budget
         self.risk = 100 if risk > 100 else 0 if risk < 0 else risk
@@ -42,8 +52,12 @@ class Trader:
         # What is currently on balance
         self.balances = self.poloniex_service.returnBalances()
 
-        # Get trade history for account
-        self.tradeHistory = self.poloniex_service.returnTradeHistory(ALL)
+        # Get trade history for account: it is kept in the local ledger, only the trades since the last sync are loaded
+        # and only the trades those are not in the cost basis yet are applied to it
+        ledger = self.poloniex_service.createTradeLedger()
+        ledger.sync()
+        self.cost_basis.update(ledger.returnTradeHistory(self.pairs, after=self.cost_basis.lastTradeId(self.pairs)),
+                               self.pairs)
 
         # Return all open orders for account
         self.orders = self.poloniex_service.returnOpenOrders(ALL)
@@ -61,110 +75,57 @@ class Trader:
             D) Current situation on market (on-line sells and buys)
         :return: prepared plan
         """
-        common_plan = {}
-
-        # iterate through all the pairs and predicted steps and find all appropriate operations to make
-        for step in range(1, self.steps + 1):
-            plan_for_step = []
-            for pair, prediction_list in self.predictions.items():
-                main_currency, secondary_currency = pair.split('_')
-
-                predicted_price = prediction_list[step]
-                current_price = self.ticker[pair][self.current_price_from]
-
-                # get delta between current
-                buy_profit = self.get_delta(two=current_price, one=predicted_price, pair=pair, op_type='BUY')
-
-                # If profit more than threshold and 0 --> we must buy currency now
-                # Example: current = 2, predicted = 4, profit = 2, so we must buy it now for 2, to sell later for 4
-                if buy_profit > 0 and buy_profit > self.THRESHOLD:
-                    plan_for_step.append(Operation('BUY', pair, buy_profit, step, predicted_price))
-                    continue
-
-                # Find an average price for this currency was bought
-                tradeHistoryForPair: list = self.tradeHistory.get(pair, None)
-
-                main_balance = float(self.balances[main_currency])
-                secondary_balance = float(self.balances[secondary_currency])
-
-                # if we already have on balance this currency so we must investigate the price for what it was bought
-                if tradeHistoryForPair and secondary_balance > 0.0:
-                    bought_for = self.calculate_avg_price(tradeHistoryForPair, secondary_balance)
-
-                    # calculate profit of selling it NOW relying on price we have bought it for previously
-                    current_sell_profit = self.get_delta(two=bought_for, one=current_price, pair=pair,
-                                                         op_type='SELL')
+        pairs = list(self.predictions.keys())
+        plan = self.preparePlanArray(pairs)
 
-                    # calculate profit of selling it LATER relying on price we have bought it for previously
-                    predicted_sell_profit = self.get_delta(two=bought_for, one=predicted_price, pair=pair,
-                                                           op_type='SELL')
+        return [Operation(OP_TYPES[row['op']], pairs[row['pair']], float(row['delta']), int(row['step']),
+                          float(row['price'])) for row in plan]
 
-                    # If profit more than threshold and 0 --> we must sell currency now
-                    if predicted_sell_profit > 0 and predicted_sell_profit > self.THRESHOLD:
-                        plan_for_step.append(Operation('SELL', pair, predicted_sell_profit, step, predicted_price))
-
-                    # If profit more than threshold and 0 --> we must sell currency now
-                    if step == 1 and current_sell_profit > 0 and current_sell_profit > self.THRESHOLD:
-                        plan_for_step.append(Operation('SELL', pair, current_sell_profit, step, current_price))
-
-            common_plan[step] = plan_for_step
-
-        for step, plan in common_plan.items():
-            # sort by delta (profitability metrics)
-            plan.sort(key=lambda op: op.delta, reverse=True)
-
-            # leave only top_n operations
-            common_plan[step] = plan[:self.top_n]
-
-        resulting_plan = []
+    def preparePlanArray(self, pairs: list) -> np.ndarray:
+        """
+        The same rules as preparePlan describes, applied to all the pairs and steps at once (see planner)
+        :param pairs: order of pairs in the plan
+        :return: plan as array of planner.PLAN_DTYPE, where pair is an index in pairs
+        """
+        if not pairs:
+            return np.empty(0, dtype=PLAN_DTYPE)
 
-        # Manage risk for the steps
-        if self.steps > 1 and self.risk > 0:
-            # in how many steps we believe as if it must happen
-            _believe_in = round(self.steps * self.risk / 100)
-            believe_in = 1 if _believe_in == 0 else _believe_in
+        # predictions (pairs x steps), current prices and prices the balances were bought for (NaN - nothing held)
+        predictions = np.array([[self.predictions[pair][step] for step in range(1, self.steps + 1)] for pair in pairs],
+                               dtype=np.float64)
+        current = np.array([self.ticker[pair][self.current_price_from] for pair in pairs], dtype=np.float64)
+        bought_for = np.full(len(pairs), np.nan)
 
-            # collect all operations from all believed steps into one list
-            for step, plan in common_plan.items():
-                if step > believe_in:
-                    continue
-                resulting_plan.extend(plan)
+        for i, pair in enumerate(pairs):
+            secondary_balance = float(self.balances[pair.split('_')[1]])
+            if secondary_balance > 0.0:
+                price = self.cost_basis.averagePrice(pair, secondary_balance)
+                bought_for[i] = np.nan if price is None else price
 
-            # select only top_n of them by profitability
-            resulting_plan.sort(key=lambda op: op.delta, reverse=True)
-            resulting_plan = resulting_plan[:self.top_n]
-        else:
-            resulting_plan = common_plan[1]
+        signals = planSignals(predictions, current, bought_for, self.makerFee, self.takerFee, self.THRESHOLD)
 
-        return resulting_plan
+        return selectPlan(predictions, current, signals, self.top_n, believedSteps(self.steps, self.risk))
 
     def trade(self, plan: list) -> list:
         """
-        Performs an operations if needed based on previously prepared plan
-        :return: performed operations
+        Performs an operations if needed based on previously prepared plan.
+        Open orders are reconciled with the plan by the minimal set of calls, those are made concurrently
+        :return: performed calls with responses and latencies
         """
-        performed_operations = []
+        desired = []
 
         for operation in plan:
-            # if there is an open orders for the currencies we have planned to buy or sell -> cancel previously opened order
-            if self.reopen:
-                for order in self.orders[operation.pair] or []:
-                    if order['type'].upper() == operation.op_type:
-                        self.poloniex_service.cancelOrder(order['orderNumber'])
-
             amount = round(self.budget / operation.price / self.top_n, 8)
             total = amount * operation.price
             print('Amount =', amount, '; Total =', total)
 
             if total >= 0.0001:
-                performed_operation = self.poloniex_service.operate(operation=operation.op_type,
-                                                                    currencyPair=operation.pair,
-                                                                    rate=operation.price,
-                                                                    amount=amount)
-                performed_operations.append(performed_operation)
-                print('Performed operation:', performed_operation)
+                desired.append(OrderAction(PLACE, operation.op_type, operation.pair, operation.price, amount))
+
+        # if there is an open orders for the currencies we have planned to buy or sell -> they are moved or cancelled
+        actions = reconcile(desired, self.orders, self.reopen, self.order_type)
 
-        return performed_operations
+        return OrderExecutor(self.poloniex_service, orderType=self.order_type).execute(actions)
 
     def to_common_currency(self, amount, pair):
         """
@@ -175,65 +136,3 @@ class Trader:
         """
         # TODO implement to get a possibility to trade with respect to a few main currencies
         return amount
-
-    def calculate_avg_price(self, tradeHistory: list, balance: float) -> float:
-        """
-        Calculate all remainders for that currency was bought and collect it into dictionary
-        :param balance: current balance for the right currency
-        :param tradeHistory: history of all transactions for particular currency pair
-        :return: avg price from all remainders
-        """
-        remainders_dict = {}
-
-        # Sort them by relevance
-        tradeHistory.sort(key=lambda k: k['globalTradeID'], reverse=True)
-        _balance = balance
-        for record in tradeHistory:
-            _type, amount, operation_total, fee = record['type'], float(record['amount']), float(record['total']), \
-                                                  float(record['fee'])
-
-            # if it is not buy operation -> we do not interested in it
-            # because we need to find out for what price we have bought the amount of this currency, that we have now
-            if _type != 'buy':
-                continue
-
-            # Fee doesn't included in 'total' so we must add fee and then divide by amount to get fair rate
-            rate = (operation_total + fee) / amount
-
-            # If current operation does not explain why do we have so many coins on balance...
-            if _balance > operation_total:
-                # add this amount with this rate into our dictionary
-                remainders_dict[rate] = operation_total
-
-                # and subtract it from balance
-                _balance -= operation_total
-
-            # or - if total of current operation >= than balance, just return current rate as average price for left coins
-            else:
-                return rate
-
-            # Calculate average price for remainders
-            average_price = sum(remainders_dict.keys()) / float(len(remainders_dict))
-
-            return average_price
-
-    def minus_fee(self, delta, op_type):
-        """
-        Subtracts fee from delta
-        :param op_type: type of operation differs by fee cost
-        :param delta: basic difference
-        :return: difference minus fee for operation
-        """
-        fee = self.takerFee if op_type == 'BUY' else self.makerFee
-        return delta - (delta * fee) / 100
-
-    def get_delta(self, one, two, pair, op_type):
-        # simple difference between two numbers
-        __current_delta = float(one) - float(two)
-
-        # minus fee
-        _current_delta = self.minus_fee(__current_delta, op_type)
-
-        # convert to common currency
-        current_delta = self.to_common_currency(_current_delta, pair)
-        return current_delta
@@ -0,0 +1,142 @@
+import threading
+
+import numpy as np
+
+
+class RollingWindow:
+    """
+    Ring buffer of a single series, that always gives its content as one contiguous array.
+    Buffer is twice as big as the window, so the window is moved to the front only once per `capacity` appends
+    """
+
+    def __init__(self, capacity: int):
+        """
+        :param capacity: maximal amount of observations in window
+        """
+        self.capacity = capacity
+        self.dates = np.empty(2 * capacity, dtype=np.int64)
+        self.values = np.empty(2 * capacity, dtype=np.float64)
+        self.head, self.tail = 0, 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return self.tail - self.head
+
+    @property
+    def lastDate(self):
+        return int(self.dates[self.tail - 1]) if len(self) else None
+
+    def extend(self, dates: np.ndarray, values: np.ndarray):
+        """
+        Appends observations those are not older than the last one.
+        Observation with the same date as the last one replaces it (the last candle may still have been forming)
+        :param dates: dates of observations in ascending order
+        :param values: observations
+        """
+        if len(self):
+            fresh = dates >= self.dates[self.tail - 1]
+            dates, values = dates[fresh], values[fresh]
+
+            if len(dates) and dates[0] == self.dates[self.tail - 1]:
+                self.tail -= 1
+
+        if len(dates) > self.capacity:
+            dates, values = dates[-self.capacity:], values[-self.capacity:]
+
+        # window would not fit -> keep only its newest part and move it to the front
+        if self.tail + len(dates) > 2 * self.capacity:
+            keep = min(len(self), self.capacity - len(dates))
+            self.dates[:keep] = self.dates[self.tail - keep:self.tail]
+            self.values[:keep] = self.values[self.tail - keep:self.tail]
+            self.head, self.tail = 0, keep
+
+        self.dates[self.tail:self.tail + len(dates)] = dates
+        self.values[self.tail:self.tail + len(values)] = values
+        self.tail += len(dates)
+
+        # do not let the window grow beyond capacity
+        self.head = max(self.head, self.tail - self.capacity)
+
+    def evict(self, before: int):
+        """
+        Removes observations older than date
+        """
+        self.head += int(np.searchsorted(self.dates[self.head:self.tail], before, side='left'))
+
+    def view(self) -> list:
+        """
+        Must be called under the lock of the window: the buffer is changed in place by the next refresh
+        (the last candle is replaced, the window is moved to the front), so views of it would change under the caller
+        :return: dates and observations of window as copies of the buffer
+        """
+        return [self.dates[self.head:self.tail].copy(), self.values[self.head:self.tail].copy()]
+
+
+def decodeChartData(chartData: list, learn_on: str) -> list:
+    """
+    Takes dates and a single column out of decoded chart data, straight into preallocated arrays
+    :param chartData: chart data from poloniex api (numbers are expected to be parsed already, see jsonNums)
+    :param learn_on: the column with price
+    :return: dates and observations as contiguous arrays
+    """
+    n = len(chartData)
+    return [np.fromiter((o['date'] for o in chartData), dtype=np.int64, count=n),
+            np.fromiter((o[learn_on] for o in chartData), dtype=np.float64, count=n)]
+
+
+class WindowCache:
+    """
+    Process-resident cache of windows of chart data, that survives across cycle iterations:
+    every iteration loads from poloniex only the candles after the last cached one
+    """
+
+    def __init__(self):
+        self.windows = {}
+        self.lock = threading.Lock()
+
+    def window(self, key: tuple, capacity: int) -> RollingWindow:
+        with self.lock:
+            window = self.windows.get(key)
+
+            # size of window has changed -> start over
+            if window is None or window.capacity != capacity:
+                window = self.windows[key] = RollingWindow(capacity)
+
+            return window
+
+    def getWindow(self, poloniexApi, pair: str, period: int, learn_on: str, start: int, end: int) -> list:
+        """
+        Refreshes the window of the series and gives it back
+        :param poloniexApi: api wrapper to load missing candles with (better the one that parses numbers as floats)
+        :param pair: currency pair
+        :param period: periodicity of data
+        :param learn_on: the column with price from poloniex
+        :param start: start of window
+        :param end: end of window
+        :return: dates and observations of window as contiguous arrays of their own (copied under the lock)
+        """
+        start, end = int(start), int(end)
+        window = self.window((pair, period, learn_on), (end - start) // period + 1)
+
+        with window.lock:
+            last_date = window.lastDate
+
+            # the last cached candle is loaded again, it might have been still forming
+            load_from = start if last_date is None or last_date < start else last_date
+
+            chartData = poloniexApi.returnChartData(currencyPair=pair, start=load_from, end=end, period=period)
+
+            if chartData and chartData[0]['date']:
+                window.extend(*decodeChartData(chartData, learn_on))
+
+            window.evict(start)
+
+            return window.view()
+
+    def clear(self):
+        with self.lock:
+            self.windows = {}
+
+
+# Shared by all cycles of the process
+windowCache = WindowCache()
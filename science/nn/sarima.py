@@ -1,26 +1,40 @@
 import calendar
-import multiprocessing
+import json
+import math
+import os
 import warnings
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import date
-from math import sqrt
-from multiprocessing import Process
+from itertools import product
 from operator import itemgetter
 
+import numpy as np
 import psycopg2
 from pandas import read_csv
 from psycopg2.extras import DictCursor
-from sklearn.metrics import mean_squared_error
 from statsmodels.tsa.statespace.sarimax import SARIMAX
 
+from science.collector.service.models.arena import CandleArena, attach
 from science.collector.service.poloniex_service import PoloniexPublicService
 
 warnings.filterwarnings('ignore')
 
+DATABASE = "dbname=deep_crypto user=postgres password=postgres host=localhost port=5432"
+# file where results of every trial of the search are persisted (JSON lines)
+RESULTS_FILE = 'trials.jsonl'
+# file where the chosen hyperparameters are saved
+HYPERPARAMETERS_FILE = 'hyperparameters.json'
+# growing fractions of data configs are evaluated on during the search
+RUNGS = (0.25, 0.5, 1.0)
+# only the best 1/ETA of configs go to the next rung
+ETA = 3
+
 trials = []
 
 
 def prepare_csv(some_range):
-    connection = psycopg2.connect("dbname=deep_crypto user=postgres password=postgres host=localhost port=5432")
+    connection = psycopg2.connect(DATABASE)
     cursor = connection.cursor(cursor_factory=psycopg2.extras.DictCursor)
 
     poloniexPublicService = PoloniexPublicService(connection, cursor)
@@ -38,40 +52,82 @@ def split_data(series, percentage):
     return [history, test]
 
 
-def evaluate_model(params, train, test, print_period=50):
+def evaluate_model(params, train, test, print_period=50, refit_every=None, horizons=(1,)):
+    """
+    Walk-forward evaluation of SARIMA on the test part of the series.
+    Parameters are estimated once on train (or every refit_every test points, on everything observed so far),
+    in between the filter simply moves forward by one observation at fixed parameters,
+    so evaluation costs a fit plus a linear pass of the filter instead of a fit per test point.
+    h-step forecast made at time t is Z * T^(h-1) * a(t+1|t), where a(t+1|t) is the predicted state of the filter
+    :param params: [P, D, Q, s]
+    :param train: observations parameters are estimated on (not modified)
+    :param test: observations forecasts are evaluated on
+    :param print_period: every which test point forecast is printed
+    :param refit_every: after how many test points parameters are re-estimated, None - never
+    :param horizons: for how many steps ahead forecasts are evaluated
+    :return: dictionary with params, RMSE and MAE for every horizon (RMSE - of the first one)
+    """
     global trials
 
-    # print('Starting evaluation of model with params:', params)
     [P, D, Q, s] = params
 
-    predictions = list()
+    train = np.asarray(train, dtype=np.float64).ravel()
+    test = np.asarray(test, dtype=np.float64).ravel()
+    series = np.concatenate([train, test])
+    n = len(train)
+
+    predictions = {h: np.empty(len(test)) for h in horizons}
+    fitted_params, refits = None, 0
+    block = refit_every or max(len(test), 1)
+
+    for block_start in range(0, len(test), block):
+        block_end = min(block_start + block, len(test))
+
+        # parameters are estimated only on what was observed before the block, warm-started from the previous ones
+        model = SARIMAX(series[:n + block_start], seasonal_order=(P, D, Q, s), enforce_stationarity=False,
+                        enforce_invertibility=False)
+        fitted_params = model.fit(start_params=fitted_params, disp=0, maxiter=1000, method='nm').params
+        refits += 1
+
+        # one pass of the filter at fixed parameters through the block gives all the one-step-ahead states
+        model = SARIMAX(series[:n + block_end], seasonal_order=(P, D, Q, s), enforce_stationarity=False,
+                        enforce_invertibility=False)
+        results = model.filter(fitted_params)
 
-    for t in range(len(test)):
-        model = SARIMAX(train, seasonal_order=(P, D, Q, s), enforce_stationarity=False, enforce_invertibility=False)
-        model_fit = model.fit(disp=0, maxiter=1000, method='nm')
+        ssm = model.ssm
+        Z, T = ssm['design'][:, :, 0], ssm['transition'][:, :, 0]
+        c, d = ssm['state_intercept'][:, 0], ssm['obs_intercept'][0, 0]
 
-        output = model_fit.forecast()
-        yhat = output[0]
-        predictions.append(yhat)
+        targets = np.arange(n + block_start, n + block_end)
 
-        obs = test[t]
-        train.append(obs)
+        for h in horizons:
+            # state predicted for the first step from the origin, moved h - 1 steps further without observations
+            state = results.filter_results.predicted_state[:, targets - h + 1]
+            for _ in range(h - 1):
+                state = T @ state + c[:, None]
 
-        if (t % print_period) == 0:
-            print('Params:', params, 'predicted=%f, expected=%f' % (yhat, obs))
-            pass
+            predictions[h][block_start:block_end] = (Z @ state)[0] + d
 
-    error = mean_squared_error(test, predictions)
-    rmse = sqrt(error)
+    for t in range(0, len(test), print_period):
+        print('Params:', params, 'predicted=%f, expected=%f' % (predictions[horizons[0]][t], test[t]))
 
-    dit = {'P': P, 'D': D, 'Q': Q, 's': s, 'RMSE': rmse}
+    dit = {'P': P, 'D': D, 'Q': Q, 's': s, 'refits': refits}
+    for h in horizons:
+        errors = predictions[h] - test
+        dit['RMSE_%d' % h] = float(np.sqrt(np.mean(errors ** 2)))
+        dit['MAE_%d' % h] = float(np.mean(np.abs(errors)))
+    dit['RMSE'] = dit['RMSE_%d' % horizons[0]]
+
+    trials.append(dit)
     print(dit)
 
+    return dit
+
 
 def prepare_params():
-    P_list = [1]
-    D_list = [0]
-    Q_list = [2]
+    P_list = [0, 1, 2]
+    D_list = [0, 1]
+    Q_list = [0, 1, 2]
     s_list = [12]
 
     return [P_list, D_list, Q_list, s_list]
@@ -86,51 +142,196 @@ def prepare_data():
     return [train, test]
 
 
-def choose_the_best_params():
-    [P_list, D_list, Q_list, s_list] = prepare_params()
-    [train, test] = prepare_data()
+def load_series(poloniexPublicService, pair, start, end, period):
+    """
+    :return: weighted average prices of pair from DB in ascending order of dates
+    """
+    main_currency, secondary_currency = pair.split('_')
+    rows = poloniexPublicService.getChartDataFromDB(main_currency, secondary_currency, start, end, period,
+                                                    fields=['date', 'weighted_average'], limit=None)
+    rows = np.array([(r['date'], r['weighted_average']) for r in rows], dtype=np.float64).reshape(-1, 2)
+
+    return rows[np.argsort(rows[:, 0]), 1]
+
+
+def search_signature(start, end, period, test_size, refit_every, rungs):
+    """
+    :return: identity of everything a result of a trial depends on besides pair, rung and config
+    """
+    return json.dumps([int(start), int(end), int(period), int(test_size), refit_every, list(rungs)])
+
+
+def load_results(results_file, signature):
+    """
+    Trials persisted by the previous runs of the same search, so they are not evaluated again
+    :param signature: search_signature of the search, trials of other searches (other data or split) are ignored
+    :return: dictionary where key = (pair, rung, P, D, Q, s) and value = result of evaluation
+    """
+    done = {}
+    if not os.path.exists(results_file):
+        return done
+
+    with open(results_file) as f:
+        for line in f:
+            try:
+                r = json.loads(line)
+            except ValueError:
+                # the last line of interrupted run may be cut off
+                continue
+            if r.get('search') == signature:
+                done[(r['pair'], r['rung'], r['P'], r['D'], r['Q'], r['s'])] = r
+
+    return done
+
+
+def evaluate_in_arena(arena, pair, length, test_size, params, refit_every=None):
+    """
+    Runs in worker process: takes the prefix of the series straight from shared memory and evaluates params on it
+    """
+    with attach(arena) as series:
+        prefix = series[pair][:length]
+        return evaluate_model(params, prefix[:-test_size], prefix[-test_size:], test_size, refit_every)
+
+
+def successive_halving(executor, pair, series, configs, test_size, results_file, done, signature, rungs=RUNGS,
+                       eta=ETA, refit_every=None):
+    """
+    Evaluates all the configs on a short prefix of the series, only the best 1/eta of them go further
+    to a longer prefix, and so on: only the most promising configs are evaluated on the whole series.
+    Every prefix is evaluated walk-forward on its last test_size observations
+    :return: results of the last rung those made it, sorted by RMSE
+    """
+    survivors, results = list(configs), []
+
+    # the series is published once, every trial of every rung reads its prefix in place
+    with CandleArena({pair: series}) as arena:
+        for rung, fraction in enumerate(rungs):
+            length = min(max(int(len(series) * fraction), 2 * test_size), len(series))
+
+            results = run_rung(executor, arena, pair, rung, length, survivors, test_size, results_file, done,
+                               signature, refit_every)
+            survivors = [(r['P'], r['D'], r['Q'], r['s']) for r in results[:max(1, math.ceil(len(results) / eta))]]
+
+            print(pair, 'rung', rung, 'on', length, 'observations, best:', results[:1])
+
+            if not survivors:
+                break
+
+    return results
+
+
+def run_rung(executor, arena, pair, rung, length, configs, test_size, results_file, done, signature,
+             refit_every=None):
+    """
+    Evaluates configs those were not evaluated yet on the prefix of length observations
+    :return: results of successful trials sorted by RMSE
+    """
+    results, futures = [], {}
+    for config in configs:
+        key = (pair, rung) + tuple(config)
+        if key in done:
+            results.append(done[key])
+        else:
+            futures[executor.submit(evaluate_in_arena, arena.handle(), pair, length, test_size, list(config),
+                                    refit_every)] = key
+
+    with open(results_file, 'a') as f:
+        for future in as_completed(futures):
+            key = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {'P': key[2], 'D': key[3], 'Q': key[4], 's': key[5], 'RMSE': float('inf'), 'error': str(e)}
+
+            result.update({'pair': pair, 'rung': rung, 'observations': length, 'search': signature})
+            done[key] = result
+            results.append(result)
+
+            # persisted at once, so an interrupted search resumes from here
+            f.write(json.dumps(result) + '\n')
+            f.flush()
+
+    return sorted([r for r in results if 'error' not in r], key=itemgetter('RMSE'))
+
+
+def to_hyperparameters(best):
+    """
+    :param best: dictionary where key = currencyPair and value = the best result of that pair
+    :return: hyperparameters as Parameters.hyperparameters expects them: the config that won on most pairs
+        is the common one, the rest of pairs get overrides
+    """
+    configs = {pair: {'P': r['P'], 'D': r['D'], 'Q': r['Q'], 's': r['s']} for pair, r in best.items()}
+    if not configs:
+        return {}
+
+    common = Counter(tuple(c.items()) for c in configs.values()).most_common(1)[0][0]
+
+    hyperparameters = {'SARIMA': dict(common)}
+    overrides = {pair: {'SARIMA': c} for pair, c in configs.items() if tuple(c.items()) != common}
+    if overrides:
+        hyperparameters['PAIRS'] = overrides
+
+    return hyperparameters
+
+
+def choose_the_best_params(pairs, start, end, period=300, test_size=100, workers=None, results_file=RESULTS_FILE,
+                           hyperparameters_file=HYPERPARAMETERS_FILE, rungs=RUNGS, eta=ETA, refit_every=None):
+    """
+    Searches the best SARIMA hyperparameters for every pair over the grid of prepare_params with successive halving.
+    Results of every trial are appended to results_file, so the search can be interrupted and resumed
+    (only trials of the same data range, period, split and rungs are reused)
+    :param pairs: list of pairs
+    :param start: start of data in DB
+    :param end: end of data in DB
+    :param period: periodicity of data
+    :param test_size: on how many last observations of every prefix configs are evaluated
+    :param workers: amount of processes trials are evaluated in, None - amount of CPUs
+    :param results_file: file (JSON lines) where results of trials are persisted
+    :param hyperparameters_file: file where chosen hyperparameters are saved
+    :param rungs: growing fractions of data configs are evaluated on
+    :param eta: only the best 1/eta of configs go to the next rung
+    :param refit_every: after how many test points parameters are re-estimated during evaluation
+    :return: hyperparameters for Parameters.hyperparameters, with overrides for pairs under 'PAIRS'
+    """
+    connection = psycopg2.connect(DATABASE)
+    cursor = connection.cursor(cursor_factory=psycopg2.extras.DictCursor)
+    poloniexPublicService = PoloniexPublicService(connection, cursor)
 
-    # processes = []
+    configs = list(product(*prepare_params()))
+    signature = search_signature(start, end, period, test_size, refit_every, rungs)
+    done = load_results(results_file, signature)
+    best = {}
 
-    for s in s_list:
-        processes = []
-        for P in P_list:
-            for D in D_list:
-                processes = []
-                for Q in Q_list:
-                    try:
-                        new_process = multiprocessing.Process(target=evaluate_model,
-                                                              args=[[P, D, Q, s], train, test, 10])
-                        new_process.start()
-                        processes.append(new_process)
-                    except BaseException:
-                        print('Exception Occurred!')
-        for p in processes:
-            p.join()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for pair in pairs:
+            series = load_series(poloniexPublicService, pair, start, end, period)
 
+            if len(series) < 2 * test_size:
+                print('Not enough data for pair:', pair)
+                continue
 
-def main():
-    day_start = str(calendar.timegm(date(year=2018, month=1, day=7).timetuple()))
-    day_end = str(calendar.timegm(date(year=2018, month=1, day=8).timetuple()))
+            results = successive_halving(executor, pair, series, configs, test_size, results_file, done, signature,
+                                         rungs, eta, refit_every)
+            if results:
+                best[pair] = results[0]
 
-    week_start = str(calendar.timegm(date(year=2018, month=1, day=1).timetuple()))
-    week_end = str(calendar.timegm(date(year=2018, month=1, day=8).timetuple()))
+    connection.close()
 
-    month_start = str(calendar.timegm(date(year=2017, month=12, day=15).timetuple()))
-    month_end = str(calendar.timegm(date(year=2018, month=1, day=15).timetuple()))
+    hyperparameters = to_hyperparameters(best)
+
+    with open(hyperparameters_file, 'w') as f:
+        json.dump(hyperparameters, f, indent=2)
 
-    day_range = {'start': day_start, 'end': day_end}
-    week_range = {'start': week_start, 'end': week_end}
-    month_range = {'start': month_start, 'end': month_end}
+    return hyperparameters
 
-    prepare_csv(month_range)
-    choose_the_best_params()
-    top = sorted(trials, key=itemgetter('RMSE'), reverse=True)[:3]
 
-    for r in top:
-        print(r)
+def main():
+    month_start = str(calendar.timegm(date(year=2017, month=12, day=15).timetuple()))
+    month_end = str(calendar.timegm(date(year=2018, month=1, day=15).timetuple()))
+
+    hyperparameters = choose_the_best_params(['BTC_ETH'], month_start, month_end)
 
-    # print(params_dict)
+    print(json.dumps(hyperparameters, indent=2))
 
 
 if __name__ == '__main__':
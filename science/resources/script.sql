@@ -40,12 +40,12 @@ CREATE TABLE chart_data (
   volume             NUMERIC,
   quote_volume       NUMERIC,
   weighted_average   NUMERIC,
-  PRIMARY KEY (main_currency, secondary_currency, date, period)
-);
+  PRIMARY KEY (main_currency, secondary_currency, period, date)
+) PARTITION BY LIST (period);
 
-COMMENT ON TABLE poloniex.chart_data IS 'Master table of all chart data for actual currencies. Partitioned into bunch of tables those are differs in currency pair';
-COMMENT ON COLUMN poloniex.chart_data.main_currency IS 'Main currency of pair (left one). Also, used as part of partition key';
-COMMENT ON COLUMN poloniex.chart_data.secondary_currency IS 'Secondary currency of pair (right one). Also, used as part of partition key';
+COMMENT ON TABLE poloniex.chart_data IS 'Master table of all chart data for actual currencies. Partitioned by period, then by month of date. Example: chart_data_300_201801';
+COMMENT ON COLUMN poloniex.chart_data.main_currency IS 'Main currency of pair (left one)';
+COMMENT ON COLUMN poloniex.chart_data.secondary_currency IS 'Secondary currency of pair (right one)';
 COMMENT ON COLUMN poloniex.chart_data.date IS 'Date in seconds for such these data was actual';
 COMMENT ON COLUMN poloniex.chart_data.period IS 'Periodicity of data in seconds';
 COMMENT ON COLUMN poloniex.chart_data.high IS 'Maximal value of currency for this period';
@@ -56,49 +56,127 @@ COMMENT ON COLUMN poloniex.chart_data.volume IS 'Traded volume of main (left) cu
 COMMENT ON COLUMN poloniex.chart_data.quote_volume IS 'Traded volume of secondary (right) currency of pair during this period';
 COMMENT ON COLUMN poloniex.chart_data.weighted_average IS 'Average value of price for this period';
 
-CREATE INDEX chart_data_date_idx
-  ON poloniex.chart_data (date, period);
+COMMENT ON INDEX poloniex.chart_data_pkey IS 'Serves range selections of a single series: (pair, period, date)';
+
+CREATE INDEX chart_data_date_brin_idx
+  ON poloniex.chart_data USING BRIN (date);
 
-COMMENT ON INDEX poloniex.chart_data_date_idx IS 'For speeding up a selections';
+COMMENT ON INDEX poloniex.chart_data_date_brin_idx IS 'Tiny index for range selections across all pairs, data is appended in order of date';
 
-CREATE OR REPLACE FUNCTION poloniex.chart_data_insert_trigger()
-  RETURNS TRIGGER
+CREATE OR REPLACE FUNCTION poloniex.create_chart_data_partitions(p_start BIGINT, p_end BIGINT)
+  RETURNS INT
 LANGUAGE plpgsql
 AS $$
 DECLARE
-  RES             RECORD;
-  v_parition_name VARCHAR;
+  v_period     INT;
+  v_month      TIMESTAMP;
+  v_parent     VARCHAR;
+  v_partition  VARCHAR;
+  v_created    INT := 0;
 BEGIN
+  FOREACH v_period IN ARRAY ARRAY [300, 900, 1800, 7200, 14400, 86400]
+  LOOP
+    v_parent := 'chart_data_' || v_period;
 
-  v_parition_name := NEW.main_currency || '_' || NEW.secondary_currency || '_' || NEW.period;
-  EXECUTE 'INSERT INTO poloniex.chart_data_' || v_parition_name || ' VALUES ( ($1).* )RETURNING *'
-  INTO RES
-  USING NEW;
-  RETURN NULL;
-  EXCEPTION WHEN undefined_table
-  THEN
-    PERFORM 1
-    FROM pg_tables t
-    WHERE t.tablename = 'chart_data_' || v_parition_name AND t.schemaname = 'poloniex'
-    LIMIT 1;
+    PERFORM 1 FROM pg_tables t WHERE t.tablename = v_parent AND t.schemaname = 'poloniex';
     IF NOT FOUND
     THEN
-      EXECUTE
-      'CREATE TABLE poloniex.chart_data_' || v_parition_name || ' ( CHECK ( period = ' || NEW.period ||
-      ')) INHERITS ( poloniex.chart_data) /*TABLESPACE pgstore_table*/;';
-      EXECUTE 'CREATE INDEX chart_data_' || v_parition_name || '_date_idx  ON poloniex.chart_data_' ||
-              v_parition_name || ' using btree  (date, period) /*TABLESPACE pgstore_idx*/;';
+      EXECUTE 'CREATE TABLE poloniex.' || v_parent || ' PARTITION OF poloniex.chart_data FOR VALUES IN (' ||
+              v_period || ') PARTITION BY RANGE (date);';
+      EXECUTE 'CREATE TABLE poloniex.' || v_parent || '_default PARTITION OF poloniex.' || v_parent || ' DEFAULT;';
     END IF;
-    EXECUTE 'INSERT INTO poloniex.chart_data_' || v_parition_name || ' VALUES ( ($1).* )RETURNING *'
-    INTO RES
-    USING NEW;
-    RETURN NULL;
+
+    v_month := date_trunc('month', to_timestamp(p_start) AT TIME ZONE 'UTC');
+    WHILE v_month <= to_timestamp(p_end) AT TIME ZONE 'UTC'
+    LOOP
+      v_partition := v_parent || '_' || to_char(v_month, 'YYYYMM');
+
+      PERFORM 1 FROM pg_tables t WHERE t.tablename = v_partition AND t.schemaname = 'poloniex';
+      IF NOT FOUND
+      THEN
+        EXECUTE 'CREATE TABLE poloniex.' || v_partition || ' PARTITION OF poloniex.' || v_parent ||
+                ' FOR VALUES FROM (' || extract(EPOCH FROM v_month) :: BIGINT || ') TO (' ||
+                extract(EPOCH FROM v_month + INTERVAL '1 month') :: BIGINT || ');';
+        v_created := v_created + 1;
+      END IF;
+
+      v_month := v_month + INTERVAL '1 month';
+    END LOOP;
+  END LOOP;
+
+  RETURN v_created;
 END;
 $$;
 
-CREATE TRIGGER insert_trigger
-  BEFORE INSERT
-  ON poloniex.chart_data
-  FOR EACH ROW EXECUTE PROCEDURE poloniex.chart_data_insert_trigger();
+COMMENT ON FUNCTION poloniex.create_chart_data_partitions(BIGINT, BIGINT) IS 'Creates monthly partitions of every period those cover range [p_start, p_end]. Returns amount of created partitions';
+
+CREATE OR REPLACE FUNCTION poloniex.drop_chart_data_partitions(p_before BIGINT)
+  RETURNS INT
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  v_partition RECORD;
+  v_dropped   INT := 0;
+BEGIN
+  FOR v_partition IN
+  SELECT c.relname
+  FROM pg_inherits i
+    JOIN pg_class c ON c.oid = i.inhrelid
+    JOIN pg_class p ON p.oid = i.inhparent
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+  WHERE n.nspname = 'poloniex' AND p.relname ~ '^chart_data_[0-9]+$' AND c.relname ~ '^chart_data_[0-9]+_[0-9]{6}$'
+        AND extract(EPOCH FROM to_date(right(c.relname, 6), 'YYYYMM') + INTERVAL '1 month') <= p_before
+  LOOP
+    EXECUTE 'DROP TABLE poloniex.' || v_partition.relname || ';';
+    v_dropped := v_dropped + 1;
+  END LOOP;
+
+  RETURN v_dropped;
+END;
+$$;
+
+COMMENT ON FUNCTION poloniex.drop_chart_data_partitions(BIGINT) IS 'Retention: drops whole monthly partitions those end before p_before. Returns amount of dropped partitions';
+
+SELECT poloniex.create_chart_data_partitions(extract(EPOCH FROM date_trunc('month', now())) :: BIGINT,
+                                             extract(EPOCH FROM now() + INTERVAL '1 month') :: BIGINT);
+
+DROP TABLE IF EXISTS poloniex.chart_data_gaps CASCADE;
+CREATE TABLE chart_data_gaps (
+  main_currency      VARCHAR(20),
+  secondary_currency VARCHAR(20),
+  period             INT,
+  gap_start          BIGINT,
+  gap_end            BIGINT,
+  scanned_at         BIGINT,
+  PRIMARY KEY (main_currency, secondary_currency, period, gap_start)
+);
+
+COMMENT ON TABLE poloniex.chart_data_gaps IS 'Index of spans of candles those are missing in chart_data. Refreshed by every scan of a range';
+COMMENT ON COLUMN poloniex.chart_data_gaps.gap_start IS 'Date of the first missing candle of the span';
+COMMENT ON COLUMN poloniex.chart_data_gaps.gap_end IS 'Date of the last missing candle of the span (inclusive)';
+COMMENT ON COLUMN poloniex.chart_data_gaps.scanned_at IS 'Date in seconds when the span was found';
+
+DROP TABLE IF EXISTS poloniex.trade_ledger CASCADE;
+CREATE TABLE trade_ledger (
+  account         VARCHAR(64),
+  global_trade_id BIGINT,
+  trade_id        BIGINT,
+  currency_pair   VARCHAR(41),
+  date            BIGINT,
+  type            VARCHAR(4),
+  rate            NUMERIC,
+  amount          NUMERIC,
+  total           NUMERIC,
+  fee             NUMERIC,
+  order_number    BIGINT,
+  category        VARCHAR(20),
+  PRIMARY KEY (account, global_trade_id)
+);
+
+CREATE INDEX trade_ledger_pair_idx
+  ON poloniex.trade_ledger (account, currency_pair, global_trade_id);
 
-COMMENT ON FUNCTION poloniex.chart_data_insert_trigger() IS 'Partitions tables for Pairs and Period. Example: chart_data_ETH_STEEM_14400';
\ No newline at end of file
+COMMENT ON TABLE poloniex.trade_ledger IS 'Own trades of accounts, appended incrementally with trades newer than the last stored one';
+COMMENT ON COLUMN poloniex.trade_ledger.account IS 'Identity of the account (derived from its api key)';
+COMMENT ON COLUMN poloniex.trade_ledger.date IS 'Date of the trade in seconds';
+COMMENT ON COLUMN poloniex.trade_ledger.fee IS 'Fee rate of the trade (fraction)';
@@ -0,0 +1,63 @@
+import unittest
+
+from science.collector.service.cost_basis import CostBasisIndex
+
+PAIR = 'BTC_ETH'
+
+
+def trade(global_id: int, trade_type: str, amount: float, rate: float, fee: float = 0.0) -> dict:
+    """
+    :return: trade in the shape returnTradeHistory of poloniex gives it
+    """
+    return {'globalTradeID': global_id, 'type': trade_type, 'amount': str(amount), 'rate': str(rate),
+            'total': str(amount * rate), 'fee': str(fee)}
+
+
+class CostBasisIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        # bought 10 for 1, then 10 for 3, then sold 5 -> the oldest lot is half consumed
+        self.index = CostBasisIndex()
+        self.index.update({PAIR: [trade(3, 'sell', 5, 2), trade(1, 'buy', 10, 1), trade(2, 'buy', 10, 3)]})
+
+    def test_average_of_what_is_held(self):
+        # 5 left of the first lot (5) and the whole second one (30)
+        self.assertAlmostEqual(self.index.averagePrice(PAIR), 35 / 15)
+        self.assertAlmostEqual(self.index.averagePrice(PAIR, 100), 35 / 15)
+
+    def test_partial_balance_takes_the_newest_lots(self):
+        # the second lot (30) and 2 of the first one (2)
+        self.assertAlmostEqual(self.index.averagePrice(PAIR, 12), 32 / 12)
+        # inside of the second lot
+        self.assertAlmostEqual(self.index.averagePrice(PAIR, 4), 3)
+
+    def test_fee_of_buy_is_in_the_price(self):
+        index = CostBasisIndex()
+        index.update({PAIR: [trade(1, 'buy', 10, 1, fee=0.002)]})
+
+        # 9.98 came for 10
+        self.assertAlmostEqual(index.averagePrice(PAIR), 10 / 9.98)
+
+    def test_trades_are_applied_once(self):
+        self.index.update({PAIR: [trade(2, 'buy', 10, 3), trade(3, 'sell', 5, 2), trade(4, 'sell', 10, 2)]})
+
+        # only the new sell is applied: the rest of the first lot and half of the second one are gone
+        self.assertAlmostEqual(self.index.averagePrice(PAIR), 3)
+        self.assertEqual(self.index.lastTradeId([PAIR]), 4)
+
+    def test_nothing_held(self):
+        self.index.update({PAIR: [trade(4, 'sell', 100, 2)]})
+
+        self.assertIsNone(self.index.averagePrice(PAIR))
+        self.assertIsNone(self.index.averagePrice('BTC_XMR'))
+
+    def test_pairs_never_loaded_are_not_up_to_date(self):
+        self.assertEqual(self.index.lastTradeId([PAIR]), 3)
+        self.assertEqual(self.index.lastTradeId([PAIR, 'BTC_XMR']), 0)
+
+        self.index.update({}, pairs=['BTC_XMR'])
+        self.assertEqual(self.index.lastTradeId([PAIR, 'BTC_XMR']), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
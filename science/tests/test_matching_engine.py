@@ -0,0 +1,131 @@
+import unittest
+
+from science.collector.service.matching_engine import MatchingEngine, BUY, SELL, MARKET, FILL_OR_KILL, \
+    IMMEDIATE_OR_CANCEL, POST_ONLY
+from science.collector.service.poloniex import PoloniexError
+
+PAIR = 'BTC_ETH'
+ACCOUNT = 'PAPER'
+MAKER_FEE, TAKER_FEE = 0.001, 0.002
+
+
+class MatchingEngineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = MatchingEngine(MAKER_FEE, TAKER_FEE)
+        self.engine.seed(PAIR, {'asks': [['0.02', 1], ['0.021', 2]], 'bids': [['0.019', 1], ['0.018', 2]]})
+        self.engine.deposit(ACCOUNT, 'BTC', 1.0)
+        self.engine.deposit(ACCOUNT, 'ETH', 10.0)
+
+    def balance(self, currency: str) -> float:
+        return float(self.engine.accountBalances(ACCOUNT)[currency])
+
+    def openOrders(self) -> list:
+        return self.engine.openOrders(ACCOUNT)[PAIR]
+
+    def assertBalances(self, btc: float, eth: float):
+        self.assertAlmostEqual(self.balance('BTC'), btc, places=8)
+        self.assertAlmostEqual(self.balance('ETH'), eth, places=8)
+
+    def test_fill_or_kill_takes_several_levels(self):
+        response = self.engine.submit(ACCOUNT, BUY, PAIR, 0.021, 2, FILL_OR_KILL)
+
+        self.assertEqual([(t['rate'], t['amount']) for t in response['resultingTrades']],
+                         [('0.02000000', '1.00000000'), ('0.02100000', '1.00000000')])
+        self.assertNotIn('amountUnfilled', response)
+        # reserved at the limit rate, the better price of the first level comes back
+        self.assertBalances(1 - 2 * 0.021 + (0.021 - 0.02), 10 + 2 * (1 - TAKER_FEE))
+        self.assertEqual(self.openOrders(), [])
+
+    def test_fill_or_kill_without_liquidity_changes_nothing(self):
+        with self.assertRaisesRegex(PoloniexError, 'Unable to fill order completely'):
+            self.engine.submit(ACCOUNT, BUY, PAIR, 0.02, 2, FILL_OR_KILL)
+
+        self.assertBalances(1, 10)
+        self.assertEqual(self.engine.book(PAIR).snapshot(1)['asks'], [['0.02000000', 1.0]])
+
+    def test_immediate_or_cancel_fills_partially(self):
+        response = self.engine.submit(ACCOUNT, BUY, PAIR, 0.02, 3, IMMEDIATE_OR_CANCEL)
+
+        self.assertEqual(len(response['resultingTrades']), 1)
+        self.assertEqual(response['amountUnfilled'], '2.00000000')
+        # reservation of the unfilled part is returned, nothing rests
+        self.assertBalances(1 - 0.02, 10 + (1 - TAKER_FEE))
+        self.assertEqual(self.openOrders(), [])
+
+    def test_post_only(self):
+        with self.assertRaisesRegex(PoloniexError, 'post-only'):
+            self.engine.submit(ACCOUNT, BUY, PAIR, 0.02, 1, POST_ONLY)
+        self.assertBalances(1, 10)
+
+        response = self.engine.submit(ACCOUNT, BUY, PAIR, 0.0195, 1, POST_ONLY)
+
+        self.assertEqual(response['resultingTrades'], [])
+        self.assertEqual([o['orderNumber'] for o in self.openOrders()], [response['orderNumber']])
+        self.assertBalances(1 - 0.0195, 10)
+
+    def test_limit_order_rests_the_rest_and_is_filled_as_maker(self):
+        response = self.engine.submit(ACCOUNT, BUY, PAIR, 0.02, 1.5)
+
+        self.assertEqual(len(response['resultingTrades']), 1)
+        order, = self.openOrders()
+        self.assertEqual((order['amount'], order['startingAmount']), ('0.50000000', '1.50000000'))
+        self.assertBalances(1 - 1.5 * 0.02, 10 + (1 - TAKER_FEE))
+
+        # the market sells into the rest of it
+        self.engine.submit(MARKET, SELL, PAIR, 0.02, 0.5, IMMEDIATE_OR_CANCEL)
+
+        self.assertEqual(self.openOrders(), [])
+        self.assertBalances(1 - 1.5 * 0.02, 10 + (1 - TAKER_FEE) + 0.5 * (1 - MAKER_FEE))
+
+    def test_sell_needs_the_secondary_currency(self):
+        with self.assertRaisesRegex(PoloniexError, 'Not enough ETH'):
+            self.engine.submit(ACCOUNT, SELL, PAIR, 0.03, 11)
+        self.assertBalances(1, 10)
+
+    def test_failed_move_keeps_order_balances_and_priority(self):
+        placed = self.engine.submit(ACCOUNT, BUY, PAIR, 0.0195, 1, POST_ONLY)
+        # the market joins the same level after it
+        self.engine.seed(PAIR, {'bids': [['0.0195', 1]]})
+
+        with self.assertRaisesRegex(PoloniexError, 'post-only'):
+            self.engine.move(ACCOUNT, placed['orderNumber'], 0.02, orderType=POST_ONLY)
+        with self.assertRaisesRegex(PoloniexError, 'Not enough BTC'):
+            self.engine.move(ACCOUNT, placed['orderNumber'], 0.019, 100)
+
+        order, = self.openOrders()
+        self.assertEqual((order['orderNumber'], order['rate'], order['amount']),
+                         (placed['orderNumber'], '0.01950000', '1.00000000'))
+        self.assertBalances(1 - 0.0195, 10)
+
+        # it is still the first in its level
+        trades = self.engine.submit(MARKET, SELL, PAIR, 0.0195, 1, IMMEDIATE_OR_CANCEL)['resultingTrades']
+        self.assertEqual(len(trades), 1)
+        self.assertEqual(self.openOrders(), [])
+        self.assertBalances(1 - 0.0195, 10 + (1 - MAKER_FEE))
+
+    def test_move(self):
+        placed = self.engine.submit(ACCOUNT, BUY, PAIR, 0.0195, 1, POST_ONLY)
+
+        moved = self.engine.move(ACCOUNT, placed['orderNumber'], 0.0185, 2)
+
+        order, = self.openOrders()
+        self.assertEqual((order['orderNumber'], order['rate'], order['amount']),
+                         (moved['orderNumber'], '0.01850000', '2.00000000'))
+        self.assertNotEqual(moved['orderNumber'], placed['orderNumber'])
+        self.assertBalances(1 - 2 * 0.0185, 10)
+
+    def test_cancel(self):
+        placed = self.engine.submit(ACCOUNT, SELL, PAIR, 0.03, 4)
+        self.assertBalances(1, 6)
+
+        with self.assertRaisesRegex(PoloniexError, 'Invalid order number'):
+            self.engine.cancel('SOMEONE', placed['orderNumber'])
+
+        self.assertEqual(self.engine.cancel(ACCOUNT, placed['orderNumber'])['amount'], '4.00000000')
+        self.assertBalances(1, 10)
+        self.assertEqual(self.openOrders(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
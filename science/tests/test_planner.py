@@ -0,0 +1,98 @@
+import unittest
+
+import numpy as np
+
+from science.collector.service.planner import BUY, SELL, planSignals, selectPlan, believedSteps, minusFee
+
+MAKER_FEE, TAKER_FEE, THRESHOLD = 0.0015, 0.0025, 0.000001
+
+
+def perStepPlan(predictions, current, bought_for, top_n, steps, risk) -> list:
+    """
+    The plan as Trader built it before the planner: top_n of every step sorted by delta,
+    then top_n across the believed steps
+    :return: operations as (op, pair, step, delta)
+    """
+    common_plan = {}
+    for step in range(1, steps + 1):
+        plan_for_step = []
+        for pair in range(len(current)):
+            predicted_price = predictions[pair, step - 1]
+
+            buy_profit = minusFee(predicted_price - current[pair], TAKER_FEE)
+            if buy_profit > 0 and buy_profit > THRESHOLD:
+                plan_for_step.append((BUY, pair, step, buy_profit))
+                continue
+
+            if not np.isnan(bought_for[pair]):
+                predicted_sell_profit = minusFee(predicted_price - bought_for[pair], MAKER_FEE)
+                current_sell_profit = minusFee(current[pair] - bought_for[pair], MAKER_FEE)
+
+                if predicted_sell_profit > 0 and predicted_sell_profit > THRESHOLD:
+                    plan_for_step.append((SELL, pair, step, predicted_sell_profit))
+                if step == 1 and current_sell_profit > 0 and current_sell_profit > THRESHOLD:
+                    plan_for_step.append((SELL, pair, 1, current_sell_profit))
+
+        plan_for_step.sort(key=lambda op: op[3], reverse=True)
+        common_plan[step] = plan_for_step[:top_n]
+
+    believe_in = believedSteps(steps, risk)
+    resulting_plan = [op for step in range(1, believe_in + 1) for op in common_plan[step]]
+    resulting_plan.sort(key=lambda op: op[3], reverse=True)
+
+    return resulting_plan[:top_n]
+
+
+class SelectPlanTest(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(7)
+        self.pairs, self.steps = 6, 4
+
+        self.current = rng.uniform(1, 2, self.pairs)
+        self.predictions = self.current[:, None] * rng.uniform(0.9, 1.1, (self.pairs, self.steps))
+        # half of pairs is held, some of them bought cheaper than they are now
+        self.bought_for = np.where(np.arange(self.pairs) % 2 == 0, self.current * rng.uniform(0.9, 1.05, self.pairs),
+                                   np.nan)
+
+    def plan(self, top_n: int, risk: int) -> list:
+        signals = planSignals(self.predictions, self.current, self.bought_for, MAKER_FEE, TAKER_FEE, THRESHOLD)
+        plan = selectPlan(self.predictions, self.current, signals, top_n, believedSteps(self.steps, risk))
+        return [(int(op['op']), int(op['pair']), int(op['step']), float(op['delta'])) for op in plan]
+
+    def assertSamePlan(self, top_n: int, risk: int):
+        expected = perStepPlan(self.predictions, self.current, self.bought_for, top_n, self.steps, risk)
+        actual = self.plan(top_n, risk)
+
+        self.assertEqual([op[:3] for op in actual], [op[:3] for op in expected])
+        np.testing.assert_allclose([op[3] for op in actual], [op[3] for op in expected])
+
+    def test_first_step_only(self):
+        for top_n in (1, 3, 100):
+            self.assertSamePlan(top_n, risk=0)
+
+    def test_believed_steps(self):
+        for top_n in (1, 3, 100):
+            for risk in (25, 50, 100):
+                self.assertSamePlan(top_n, risk)
+
+    def test_price_of_operation(self):
+        signals = planSignals(self.predictions, self.current, self.bought_for, MAKER_FEE, TAKER_FEE, THRESHOLD)
+        plan = selectPlan(self.predictions, self.current, signals, 100, self.steps)
+
+        for op in plan:
+            if op['op'] == SELL and op['price'] == self.current[op['pair']]:
+                # SELL now is at the current price
+                self.assertEqual(op['step'], 1)
+            else:
+                self.assertEqual(op['price'], self.predictions[op['pair'], op['step'] - 1])
+
+    def test_nothing_profitable(self):
+        predictions = np.repeat(self.current[:, None] * 0.5, self.steps, axis=1)
+        signals = planSignals(predictions, self.current, np.full(self.pairs, np.nan), MAKER_FEE, TAKER_FEE, THRESHOLD)
+
+        self.assertEqual(len(selectPlan(predictions, self.current, signals, 3, self.steps)), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()